@@ -0,0 +1,52 @@
+import hashlib
+import sqlite3
+import zlib
+from json import dumps, loads
+from time import time
+from typing import Optional
+
+from scrapy.http import Headers, Response
+from scrapy.utils.misc import load_object
+from scrapy.utils.request import request_fingerprint
+
+from firmware.render_cache import RenderCache
+
+
+class CrawlArchive:
+    # Responses of a crawl as the downloader produced them (HTTP, FTP listings and files, rendered Selenium pages)
+    # with zlib compressed bodies, keyed by request. A later crawl can replay them without any network access.
+
+    # request.meta keys that change the response for the same request
+    RELEVANT_META = ('selenium', ) + RenderCache.RELEVANT_META
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, url TEXT, status INTEGER, headers TEXT, body BLOB, cls TEXT, recorded REAL)')
+
+    def get(self, request) -> Optional[Response]:
+        row = self._db.execute('SELECT url, status, headers, body, cls FROM responses WHERE key = ?', (self.key(request), )).fetchone()
+        if row is None:
+            return None
+        url, status, headers, body, cls = row
+        headers = Headers({name: [value.encode('latin-1') for value in values] for name, values in loads(headers).items()})
+        return load_object(cls)(url=url, status=status, headers=headers, body=zlib.decompress(body), request=request, flags=['archived'])
+
+    def put(self, request, response: Response):
+        headers = {name.decode('latin-1'): [value.decode('latin-1') for value in values] for name, values in response.headers.items()}
+        cls = f'{type(response).__module__}.{type(response).__name__}'
+        with self._db:
+            self._db.execute('REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (self.key(request), response.url, response.status, dumps(headers), zlib.compress(response.body), cls, time()))
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+    @classmethod
+    def key(cls, request) -> str:
+        meta = {name: request.meta[name] for name in cls.RELEVANT_META if name in request.meta}
+        return hashlib.sha1(f'{request_fingerprint(request)} {dumps(meta, sort_keys=True)}'.encode('utf-8')).hexdigest()
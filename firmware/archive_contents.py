@@ -0,0 +1,149 @@
+import bz2
+import gzip
+import hashlib
+import lzma
+import os
+import sqlite3
+import stat
+import tarfile
+import zipfile
+from time import time
+from typing import IO, Iterator, List, Optional, Tuple
+
+CHUNK_SIZE = 1024 * 1024
+
+# magic numbers of the formats that are indexed
+COMPRESSED_FORMATS = {'gz': (b'\x1f\x8b', gzip.open), 'bz2': (b'BZh', bz2.open), 'xz': (b'\xfd7zXZ\x00', lzma.open)}
+ZIP_MAGIC = (b'PK\x03\x04', b'PK\x05\x06')
+TAR_MAGIC_OFFSET = 257
+
+# path, size, mode, type, sha256
+Member = Tuple[str, int, Optional[int], str, Optional[str]]
+
+
+class ArchiveContentsIndex:
+    # Member lists of the downloaded archives (tar, compressed tar, zip and single compressed files), keyed by the
+    # checksum of the archive so that identical archives are only listed once. The worker processes that list the
+    # archives write their results themselves, WAL mode lets them and the crawl use the index at the same time.
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, timeout=60)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS archives (checksum TEXT PRIMARY KEY, format TEXT, members INTEGER, size INTEGER, error TEXT, indexed REAL)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS files (url TEXT PRIMARY KEY, checksum TEXT, path TEXT)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS members (checksum TEXT, path TEXT, size INTEGER, mode INTEGER, type TEXT, sha256 TEXT, '
+                         'PRIMARY KEY (checksum, path))')
+        self._db.execute('CREATE INDEX IF NOT EXISTS files_checksum ON files (checksum)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS members_sha256 ON members (sha256)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS members_path ON members (path)')
+
+    def add_file(self, url: str, checksum: str, path: str):
+        with self._db:
+            self._db.execute('REPLACE INTO files VALUES (?, ?, ?)', (url, checksum, path))
+
+    def indexed(self, checksum: str) -> bool:
+        return self._db.execute('SELECT 1 FROM archives WHERE checksum = ?', (checksum, )).fetchone() is not None
+
+    def add_archive(self, checksum: str, archive_format: str, members: List[Member], error: Optional[str] = None):
+        with self._db:
+            self._db.execute('DELETE FROM members WHERE checksum = ?', (checksum, ))
+            self._db.executemany('INSERT OR REPLACE INTO members VALUES (?, ?, ?, ?, ?, ?)', [(checksum, ) + member for member in members])
+            self._db.execute('REPLACE INTO archives VALUES (?, ?, ?, ?, ?, ?)',
+                             (checksum, archive_format, len(members), sum(member[1] or 0 for member in members), error, time()))
+
+    def members(self, checksum: str) -> List[Member]:
+        return self._db.execute('SELECT path, size, mode, type, sha256 FROM members WHERE checksum = ? ORDER BY path', (checksum, )).fetchall()
+
+    def containing(self, sha256: str) -> List[Tuple[str, str]]:
+        # URLs and member paths of the archives that contain a file with this sha256
+        return self._db.execute('SELECT files.url, members.path FROM members JOIN files ON files.checksum = members.checksum '
+                                'WHERE members.sha256 = ? ORDER BY files.url', (sha256, )).fetchall()
+
+    def close(self):
+        self._db.close()
+
+
+def archive_format(filename: str) -> Optional[str]:
+    with open(filename, 'rb') as archive:
+        head = archive.read(512)
+    if head.startswith(ZIP_MAGIC):
+        return 'zip'
+    for name, (magic, _) in COMPRESSED_FORMATS.items():
+        if head.startswith(magic):
+            return name
+    if head[TAR_MAGIC_OFFSET:TAR_MAGIC_OFFSET + 5] == b'ustar':
+        return 'tar'
+    return None
+
+
+def hash_stream(stream: IO[bytes]) -> Tuple[int, str]:
+    sha256, size = hashlib.sha256(), 0
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+        sha256.update(chunk)
+        size += len(chunk)
+    return size, sha256.hexdigest()
+
+
+def tar_members(filename: str) -> Iterator[Member]:
+    # stream mode reads the (compressed) archive once from start to end
+    with tarfile.open(filename, mode='r|*') as archive:
+        for info in archive:
+            sha256 = None
+            if info.isfile():
+                sha256 = hash_stream(archive.extractfile(info))[1]
+            member_type = 'file' if info.isfile() else 'dir' if info.isdir() else 'symlink' if info.issym() else 'link' if info.islnk() else 'other'
+            yield info.name, info.size, info.mode, member_type, sha256
+
+
+def zip_members(filename: str) -> Iterator[Member]:
+    with zipfile.ZipFile(filename) as archive:
+        for info in archive.infolist():
+            mode = info.external_attr >> 16 or None
+            sha256 = None
+            if not info.is_dir():
+                try:
+                    with archive.open(info) as member:
+                        sha256 = hash_stream(member)[1]
+                except (RuntimeError, NotImplementedError, zipfile.BadZipFile):
+                    # encrypted or unsupported compression, the member is listed without a hash
+                    pass
+            member_type = 'dir' if info.is_dir() else 'symlink' if mode is not None and stat.S_ISLNK(mode) else 'file'
+            yield info.filename, info.file_size, stat.S_IMODE(mode) if mode is not None else None, member_type, sha256
+
+
+def list_members(filename: str, name: str) -> Tuple[Optional[str], List[Member]]:
+    archive_type = archive_format(filename)
+    if archive_type is None:
+        return None, []
+    if archive_type == 'zip':
+        return archive_type, list(zip_members(filename))
+    members = []
+    try:
+        for member in tar_members(filename):
+            members.append(member)
+        return 'tar' if archive_type == 'tar' else f'tar.{archive_type}', members
+    except tarfile.ReadError:
+        if archive_type == 'tar' or members:
+            raise
+    # no tar inside, a single compressed file such as firmware.bin.gz
+    with COMPRESSED_FORMATS[archive_type][1](filename, 'rb') as stream:
+        size, sha256 = hash_stream(stream)
+    return archive_type, [(os.path.splitext(os.path.basename(name))[0], size, None, 'file', sha256)]
+
+
+def index_archive(index_path: str, filename: str, checksum: str, name: str) -> Tuple[Optional[str], int]:
+    # runs in a worker process, returns the format and the number of members
+    try:
+        archive_type, members = list_members(filename, name)
+        error = None
+    except (OSError, EOFError, tarfile.TarError, zipfile.BadZipFile, lzma.LZMAError) as exc:
+        archive_type, members, error = archive_format(filename), [], f'{type(exc).__name__}: {exc}'
+    if archive_type is None:
+        return None, 0
+    index = ArchiveContentsIndex(index_path)
+    try:
+        index.add_archive(checksum, archive_type, members, error=error)
+    finally:
+        index.close()
+    return archive_type, len(members)
@@ -0,0 +1,267 @@
+import argparse
+import json
+import os
+import platform
+from statistics import mean, median
+from time import perf_counter
+from typing import Dict, List, NamedTuple, Optional
+
+import scrapy
+from itemadapter import is_item
+from scrapy import Request
+from scrapy.http import HtmlResponse, TextResponse
+from scrapy.utils.spider import iterate_spider_output
+
+from firmware.custom_responses import FTPEntry, FTPListingResponse
+from firmware.spiders.asus import Asus
+from firmware.spiders.avm import AVM
+from firmware.spiders.avm_gpl import AVMGPL
+from firmware.spiders.dlink import DLink
+from firmware.spiders.dlink_gpl import DLinkGPL
+from firmware.spiders.hp import HewlettPackardSpider
+from firmware.spiders.linksys import Linksys
+from firmware.spiders.linksys_gpl import LinksysGPL
+from firmware.spiders.netgear import Netgear
+from firmware.spiders.netgear_gpl import NetgearGPL
+from firmware.spiders.tplink import TPLink
+from firmware.spiders.tplink_gpl import TPLinkGPL
+from firmware.spiders.zyxel import Zyxel
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(__file__), 'benchmarks')
+FIXTURE_DIR = os.path.join(BENCHMARK_DIR, 'fixtures')
+BASELINE = os.path.join(BENCHMARK_DIR, 'results.json')
+# parsed in every run to compare latencies between machines, see run_reference
+REFERENCE_FIXTURE = 'hp/document.html'
+
+RESPONSE_TYPES = {
+    '.html': (HtmlResponse, 'text/html; charset=utf-8'),
+    '.json': (TextResponse, 'application/json'),
+    '.txt': (TextResponse, 'text/plain; charset=iso-8859-1'),
+}
+
+
+class BenchmarkCase(NamedTuple):
+    spider: type
+    callback: str
+    fixture: str
+    url: str
+    cb_kwargs: dict = {}
+    # e.g. to switch off whitelists, so the whole fixture is parsed
+    spider_kwargs: dict = {}
+
+    @property
+    def name(self) -> str:
+        return f'{self.spider.name}.{self.callback}'
+
+
+# one case per spider callback, the fixtures are pages as the spiders receive them (after rendering for selenium spiders)
+CASES = [
+    BenchmarkCase(Asus, 'parse', 'asus/series_filter.json', Asus.start_urls[0]),
+    BenchmarkCase(Asus, 'parse_pdbios', 'asus/pdbios.json',
+                  'https://www.asus.com/support/api/product.asmx/GetPDBIOS?website=de&model=rt-ax58u&pdhashedid=h0000abcdef0000',
+                  cb_kwargs={'device_name': 'RT-AX58U WiFi Router'}),
+    BenchmarkCase(AVM, 'parse', 'avm/listing_fritzbox.json', 'ftp://ftp.avm.de/fritzbox/'),
+    BenchmarkCase(AVM, 'parse', 'avm/listing_fritz_os.json', 'ftp://ftp.avm.de/fritzbox/fritzbox-7590/deutschland/fritz.os/'),
+    BenchmarkCase(AVM, 'parse_metadata_and_download_image', 'avm/info_de.txt', 'ftp://ftp.avm.de/fritzbox/fritzbox-7590/deutschland/fritz.os/info_de.txt',
+                  cb_kwargs={'image_path': 'ftp://ftp.avm.de/fritzbox/fritzbox-7590/deutschland/fritz.os/FRITZ.Box_7590-07.29.image'},
+                  spider_kwargs={'filter_eol_products': False}),
+    BenchmarkCase(AVMGPL, 'parse', 'avm_gpl/index_fritzbox.html', 'https://osp.avm.de/fritzbox/'),
+    BenchmarkCase(DLink, 'parse', 'dlink/category.html', DLink.start_urls[0]),
+    BenchmarkCase(DLink, 'process_detail_page', 'dlink/detail_revision.html', 'https://eu.dlink.com/de/de/products/dir-842?revision=B1',
+                  cb_kwargs={'product_name': 'DIR-842', 'product_revision': 'B1'}),
+    BenchmarkCase(DLinkGPL, 'parse', 'dlink_gpl/dlist.html', DLinkGPL.start_urls[0]),
+    BenchmarkCase(DLinkGPL, 'parse_device_overview', 'dlink_gpl/ddetail.html', 'https://tsd.dlink.com.tw/ddetail',
+                  cb_kwargs={'product': 'DIR', 'model': '842'}),
+    BenchmarkCase(DLinkGPL, 'parse_gpl_download', 'dlink_gpl/ddgo.html', 'https://tsd.dlink.com.tw/ddgo',
+                  cb_kwargs={'product': 'DIR', 'model': '842', 'version': '3.13'}),
+    BenchmarkCase(HewlettPackardSpider, 'parse', 'hp/document.html', 'https://support.hp.com/za-en/document/c03933242'),
+    BenchmarkCase(HewlettPackardSpider, 'parse_firmware', 'hp/firmware.html', 'http://support.hp.com/us-en/drivers/selfservice/swdetails/lj-180000-0',
+                  cb_kwargs={'meta_data': {'vendor': 'HP', 'device_class': 'Printer', 'device_name': 'LaserJet Pro M404 series',
+                                           'release_date': '2019-01-01', 'firmware_version': '002.2030A'}}),
+    BenchmarkCase(Linksys, 'parse', 'linksys/category.html', Linksys.start_urls[1], cb_kwargs={'page': 0}),
+    BenchmarkCase(Linksys, 'move_to_support_page', 'linksys/product.html', 'https://www.linksys.com/de/p/P-EA7500/'),
+    BenchmarkCase(Linksys, 'move_to_download_page', 'linksys/support_product.html', 'https://www.linksys.com/de/support-product?rnId=3LSuSn3eA'),
+    BenchmarkCase(Linksys, 'parse_download_page', 'linksys/support_article.html', 'https://www.linksys.com/de/support-article?articleNum=148385',
+                  cb_kwargs={'device_name': 'EA7500'}),
+    BenchmarkCase(LinksysGPL, 'parse', 'linksys_gpl/support_article.html', LinksysGPL.start_urls[0], spider_kwargs={'whitelist_enabled': False}),
+    BenchmarkCase(Netgear, 'parse', 'netgear/category.html', Netgear.start_urls[0]),
+    BenchmarkCase(Netgear, 'consult_support_pages', 'netgear/support.html', 'https://www.netgear.de/support/download/default.aspx?model=RAX50',
+                  cb_kwargs={'device_name': 'RAX50'}),
+    BenchmarkCase(Netgear, 'parse_kb_article', 'netgear/kb_article.html', 'https://kb.netgear.com/000064998/RAX50-Firmware-Version-1-0-10-98',
+                  cb_kwargs={'device_name': 'RAX50', 'firmware_version': '1.0.10.98',
+                             'download_link': 'https://www.downloads.netgear.com/files/GDC/RAX50/RAX50-V1.0.10.98.zip'}),
+    BenchmarkCase(NetgearGPL, 'parse', 'netgear_gpl/gpl.html', NetgearGPL.start_urls[0], spider_kwargs={'whitelist_enabled': False}),
+    BenchmarkCase(TPLink, 'parse', 'tplink/category.html', TPLink.start_urls[0]),
+    BenchmarkCase(TPLink, 'parse_product_details', 'tplink/product.html', 'https://www.tp-link.com/de/home-networking/wifi-router/archer-ax55/'),
+    BenchmarkCase(TPLink, 'parse_firmware', 'tplink/support.html', 'https://www.tp-link.com/de/support/download/archer-ax55/',
+                  cb_kwargs={'device_name': 'Archer AX55', 'device_class': 'Router'}),
+    BenchmarkCase(TPLinkGPL, 'parse', 'tplink_gpl/gpl_code.html', TPLinkGPL.start_urls[0]),
+    BenchmarkCase(TPLinkGPL, 'parse_multi', 'tplink_gpl/gpl_res_list.html', 'https://www.tp-link.com/phppage/gpl-res-list.html?model=Archer%20AX20&appPath=de',
+                  cb_kwargs={'device': 'Archer AX20'}),
+    BenchmarkCase(Zyxel, 'parse', 'zyxel/category.html', Zyxel.start_urls[0]),
+    BenchmarkCase(Zyxel, 'move_to_firmware_downloads', 'zyxel/product_downloads.html', 'https://www.zyxel.com/de/de/products/home-networking/nbg7815/downloads',
+                  cb_kwargs={'device_name': 'NBG7815'}),
+    BenchmarkCase(Zyxel, 'parse_firmware_table', 'zyxel/firmware_tab.html',
+                  'https://www.zyxel.com/support/download_landing/product/nbg7815_2.shtml?c=gb&l=en&pid=20200730&tab=Firmware',
+                  cb_kwargs={'device_name': 'NBG7815'}),
+]
+
+
+def case_key(case: BenchmarkCase) -> str:
+    # a callback may be benchmarked with several fixtures
+    return f'{case.name}[{os.path.splitext(os.path.basename(case.fixture))[0]}]'
+
+
+def load_fixture(case: BenchmarkCase) -> bytes:
+    with open(os.path.join(FIXTURE_DIR, case.fixture), 'rb') as fixture:
+        return fixture.read()
+
+
+def build_response(case: BenchmarkCase, body: bytes):
+    # a fresh response per run, responses cache their parsed DOM
+    request = Request(case.url, cb_kwargs=case.cb_kwargs)
+    if case.url.startswith('ftp://') and case.fixture.endswith('.json'):
+        # the FTP handler hands the parsed listing to the spider, no JSON involved
+        entries = [FTPEntry(**entry) for entry in json.loads(body)]
+        return FTPListingResponse(url=case.url, entries=entries, request=request)
+    response_cls, content_type = RESPONSE_TYPES[os.path.splitext(case.fixture)[1]]
+    return response_cls(url=case.url, body=body, headers={'Content-Type': content_type}, request=request)
+
+
+def run_callback(case: BenchmarkCase, spider, body: bytes):
+    response = build_response(case, body)
+    callback = getattr(spider, case.callback)
+    start = perf_counter()
+    output = list(iterate_spider_output(callback(response, **case.cb_kwargs)))
+    return perf_counter() - start, output
+
+
+def run_reference(repeat: int = 50) -> float:
+    # Median milliseconds lxml needs to parse a fixed page and select its links and texts. Callback latencies are
+    # stored relative to it, so that a baseline recorded on one machine can be compared with a run on another
+    with open(os.path.join(FIXTURE_DIR, REFERENCE_FIXTURE), 'rb') as fixture:
+        body = fixture.read()
+    latencies = []
+    for _ in range(repeat + 1):
+        response = HtmlResponse(url='https://support.hp.com/', body=body, encoding='utf-8')
+        start = perf_counter()
+        response.xpath('//a/@href').getall()
+        response.xpath('//text()').getall()
+        latencies.append(perf_counter() - start)
+    return median(latencies[1:]) * 1000
+
+
+def run_case(case: BenchmarkCase, repeat: int = 50) -> dict:
+    spider = case.spider(**case.spider_kwargs)
+    body = load_fixture(case)
+    run_callback(case, spider, body)  # warm up imports and lxml
+
+    latencies = []
+    for _ in range(repeat):
+        latency, output = run_callback(case, spider, body)
+        latencies.append(latency)
+
+    items = sum(1 for result in output if is_item(result))
+    requests = sum(1 for result in output if isinstance(result, Request))
+    latencies.sort()
+    return {
+        'fixture': case.fixture,
+        'fixture_size': len(body),
+        'items': items,
+        'requests': requests,
+        'other': len(output) - items - requests,
+        'latency_ms': {
+            'mean': round(mean(latencies) * 1000, 3),
+            'median': round(median(latencies) * 1000, 3),
+            'p95': round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 3),
+        },
+        'responses_per_second': round(1 / mean(latencies), 1),
+        'items_per_second': round(items / mean(latencies), 1),
+    }
+
+
+def run(cases: List[BenchmarkCase], repeat: int = 50) -> dict:
+    reference = run_reference(repeat)
+    results = {case_key(case): run_case(case, repeat) for case in cases}
+    for result in results.values():
+        result['relative_latency'] = round(result['latency_ms']['median'] / reference, 3)
+    return {
+        'python': platform.python_version(),
+        'scrapy': scrapy.__version__,
+        'repeat': repeat,
+        'reference_ms': round(reference, 3),
+        'cases': results,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.25) -> List[str]:
+    # changed outputs are always reported, latencies only beyond the tolerance and relative to the reference page of
+    # each run, as absolute timings differ between machines
+    regressions = []
+    for key, result in results['cases'].items():
+        before = baseline.get('cases', {}).get(key)
+        if before is None:
+            continue
+        for count in ('items', 'requests', 'other'):
+            if result[count] != before[count]:
+                regressions.append(f'{key}: {count} per response changed from {before[count]} to {result[count]}')
+        if 'relative_latency' not in before:
+            continue
+        if result['relative_latency'] > before['relative_latency'] * (1 + tolerance):
+            regressions.append(f'{key}: median latency went up from {before["relative_latency"]} to {result["relative_latency"]} times the reference page')
+    return regressions
+
+
+def load_results(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as results:
+        return json.load(results)
+
+
+def save_results(results: dict, path: str):
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+        output.write('\n')
+
+
+def format_table(results: dict) -> str:
+    lines = [f'{"callback":<64} {"items":>5} {"reqs":>5} {"median ms":>10} {"p95 ms":>8} {"relative":>9} {"items/s":>9}']
+    for key, result in results['cases'].items():
+        latency = result['latency_ms']
+        lines.append(f'{key:<64} {result["items"]:>5} {result["requests"]:>5} {latency["median"]:>10.3f} {latency["p95"]:>8.3f} '
+                     f'{result["relative_latency"]:>9.3f} {result["items_per_second"]:>9.1f}')
+    lines.append(f'reference page: {results["reference_ms"]:.3f} ms')
+    return '\n'.join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Time the spider callbacks on recorded pages, fully offline')
+    parser.add_argument('-k', '--filter', default='', help='only run callbacks whose name contains this string, e.g. dlink_gpl.')
+    parser.add_argument('-n', '--repeat', type=int, default=50, help='runs per callback')
+    parser.add_argument('--baseline', default=BASELINE, help='results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed increase of the median latency relative to the reference page')
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    cases = [case for case in CASES if args.filter in case_key(case)]
+    results = run(cases, repeat=args.repeat)
+    print(format_table(results))
+
+    baseline: Dict = load_results(args.baseline) or {}
+    regressions = compare(results, baseline, tolerance=args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+
+    if args.save:
+        # keep the cases that were not run this time
+        results['cases'] = dict(baseline.get('cases', {}), **results['cases'])
+        save_results(results, args.baseline)
+    return 1 if regressions and not args.save else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
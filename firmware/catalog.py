@@ -0,0 +1,183 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+from dataclasses import fields
+from time import gmtime, strftime, time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # only needed to compact catalogs
+    pyarrow = None
+
+from firmware.items import FirmwareItem
+
+SUFFIXES = {'': '.jsonl', 'gzip': '.jsonl.gz'}
+
+# FirmwareItem fields that hold lists of strings, the others are kept as JSON in the columnar files
+LIST_FIELDS = [field.name for field in fields(FirmwareItem) if field.name != 'files']
+
+
+class CatalogWriter:
+    # Appends records as JSON lines to <directory>/<prefix>-<UTC time>-<sequence>.jsonl[.gz]. Records are written in
+    # batches of batch_size, or earlier once flush_interval seconds passed since the last write. Each batch of a gzip
+    # file is a complete gzip member, so readers (gzip.open, zcat) get every written record while the crawl is still
+    # running. A new file is started once the current one holds max_bytes or is older than max_seconds (0 for never).
+
+    def __init__(self, directory: str, prefix: str = 'catalog', compression: str = '', batch_size: int = 500,
+                 flush_interval: float = 0, max_bytes: int = 0, max_seconds: float = 0, clock=time):
+        if compression not in SUFFIXES:
+            raise ValueError(f'Unknown catalog compression {compression!r}, use one of {sorted(SUFFIXES)}')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.compression = compression
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.clock = clock
+
+        self.paths: List[str] = []
+        self.records = 0
+        self._batch: List[str] = []
+        self._file = None
+        self._opened = 0.0
+        self._flushed = clock()
+
+    def write(self, record: dict):
+        self._batch.append(json.dumps(record, default=str, ensure_ascii=False))
+        if len(self._batch) >= self.batch_size or (self.flush_interval and self.clock() - self._flushed >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        self._flushed = self.clock()
+        if not self._batch:
+            return
+        if self._file is None or self._rotation_due():
+            self._open_next()
+
+        data = ('\n'.join(self._batch) + '\n').encode('utf-8')
+        if self.compression == 'gzip':
+            data = gzip.compress(data)
+        self._file.write(data)
+        self._file.flush()
+        self.records += len(self._batch)
+        self._batch = []
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _rotation_due(self) -> bool:
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return bool(self.max_seconds) and self.clock() - self._opened >= self.max_seconds
+
+    def _open_next(self):
+        if self._file is not None:
+            self._file.close()
+        self._opened = self.clock()
+        name = f'{self.prefix}-{strftime("%Y%m%dT%H%M%S", gmtime(self._opened))}-{len(self.paths):04d}{SUFFIXES[self.compression]}'
+        path = os.path.join(self.directory, name)
+        # another run that started in the same second continues the file instead of overwriting it
+        self._file = open(path, 'ab')  # pylint: disable=consider-using-with
+        self.paths.append(path)
+
+
+def catalog_files(paths: Iterable[str]) -> List[str]:
+    # catalog files in the given files and directories, in the order they were written
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(tuple(SUFFIXES.values()))))
+        else:
+            found.append(path)
+    return found
+
+
+def read_records(path: str) -> Iterator[dict]:
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as file:
+        try:
+            for line in file:
+                # the last line or gzip member may still be written
+                if line.endswith('\n'):
+                    yield json.loads(line)
+        except EOFError:
+            return
+
+
+def columnar_schema():
+    columns = [(name, pyarrow.list_(pyarrow.string())) for name in LIST_FIELDS]
+    columns.extend([('files', pyarrow.string()), ('spider', pyarrow.string()), ('extra', pyarrow.string())])
+    return pyarrow.schema(columns)
+
+
+def to_columns(records: List[dict]) -> Dict[str, list]:
+    columns = {name: [] for name in LIST_FIELDS + ['files', 'spider', 'extra']}
+    for record in records:
+        record = dict(record)
+        for name in LIST_FIELDS:
+            values = record.pop(name, None)
+            columns[name].append(None if values is None else [str(value) for value in values])
+        files = record.pop('files', None)
+        columns['files'].append(None if files is None else json.dumps(files, default=str))
+        columns['spider'].append(record.pop('spider', None))
+        # keys that are not FirmwareItem fields, e.g. of older or newer catalogs
+        columns['extra'].append(json.dumps(record, default=str) if record else None)
+    return columns
+
+
+def compact(paths: Iterable[str], destination: str, batch_size: int = 50000) -> int:
+    # Writes the records of the given catalog files into one Parquet (.parquet) or Arrow IPC (.arrow, .feather) file
+    if pyarrow is None:
+        raise ImportError('Compacting catalogs needs the pyarrow package')
+    schema = columnar_schema()
+    if destination.endswith(('.arrow', '.feather')):
+        writer = pyarrow.ipc.new_file(destination, schema)
+    else:
+        writer = pyarrow.parquet.ParquetWriter(destination, schema, compression='zstd')
+
+    written = 0
+    batch = []
+    try:
+        for path in catalog_files(paths):
+            for record in read_records(path):
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    writer.write_table(pyarrow.Table.from_pydict(to_columns(batch), schema=schema))
+                    written += len(batch)
+                    batch = []
+        if batch:
+            writer.write_table(pyarrow.Table.from_pydict(to_columns(batch), schema=schema))
+            written += len(batch)
+    finally:
+        writer.close()
+    return written
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Compact JSON lines catalogs into one Parquet or Arrow file')
+    parser.add_argument('paths', nargs='+', help='catalog files or directories (e.g. CATALOG_DIR)')
+    parser.add_argument('-o', '--output', required=True, help='.parquet, .arrow or .feather file to write')
+    parser.add_argument('--batch-size', type=int, default=50000, help='records per row group')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    written = compact(args.paths, args.output, batch_size=args.batch_size)
+    logging.getLogger(__name__).info('Compacted %d records into %s', written, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
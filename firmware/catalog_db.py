@@ -0,0 +1,178 @@
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+from datetime import datetime
+from functools import lru_cache
+from time import time
+from typing import List, Optional
+
+# release dates as the spiders write them, day first where it is ambiguous
+RELEASE_DATE_FORMATS = ['%Y-%m-%d', '%d-%m-%Y', '%m-%d-%Y', '%d/%m/%Y', '%d.%m.%Y']
+# used by the GPL spiders for archives without a date
+UNKNOWN_RELEASE_DATE = '1970-01-01'
+
+COLUMNS = ['url', 'spider', 'vendor', 'device_name', 'firmware_version', 'device_class', 'release_date', 'released',
+           'path', 'checksum', 'digest', 'item', 'first_seen', 'last_seen', 'changed']
+# the columns the query CLI prints
+OUTPUT_COLUMNS = ['vendor', 'device_name', 'firmware_version', 'released', 'url', 'checksum']
+
+
+class CatalogDatabase:
+    # Queryable catalog of the firmware files the spiders found, one row per file URL. Rediscovered files update their
+    # row, `changed` is the time their metadata or checksum last differed from the previous crawl. Rows are written in
+    # batches, one transaction each.
+
+    def __init__(self, path: str):
+        # the pipeline writes from its own thread, one batch at a time
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS firmware (url TEXT PRIMARY KEY, spider TEXT, vendor TEXT COLLATE NOCASE, '
+                         'device_name TEXT COLLATE NOCASE, firmware_version TEXT, device_class TEXT, release_date TEXT, released TEXT, '
+                         'path TEXT, checksum TEXT, digest TEXT, item TEXT, first_seen REAL, last_seen REAL, changed REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS firmware_device ON firmware (vendor, device_name, released)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS firmware_device_name ON firmware (device_name)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS firmware_version ON firmware (firmware_version)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS firmware_released ON firmware (released)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS firmware_checksum ON firmware (checksum)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS firmware_changed ON firmware (vendor, changed)')
+
+    def upsert(self, rows: List[tuple]):
+        # rows as built by item_rows(). Files that were not downloaded in this crawl keep their path and checksum
+        with self._db:
+            self._db.executemany(
+                f'INSERT INTO firmware ({", ".join(COLUMNS)}) VALUES ({", ".join("?" * len(COLUMNS))}) '
+                'ON CONFLICT (url) DO UPDATE SET spider = excluded.spider, vendor = excluded.vendor, device_name = excluded.device_name, '
+                'firmware_version = excluded.firmware_version, device_class = excluded.device_class, release_date = excluded.release_date, '
+                'released = excluded.released, path = COALESCE(excluded.path, path), checksum = COALESCE(excluded.checksum, checksum), '
+                'digest = excluded.digest, item = excluded.item, last_seen = excluded.last_seen, '
+                'changed = CASE WHEN digest IS NOT excluded.digest OR excluded.checksum != checksum THEN excluded.last_seen ELSE changed END',
+                rows
+            )
+
+    def search(self, vendor: Optional[str] = None, device_name: Optional[str] = None, firmware_version: Optional[str] = None,
+               checksum: Optional[str] = None, url: Optional[str] = None, changed_since: Optional[float] = None,
+               limit: Optional[int] = None) -> List[sqlite3.Row]:
+        # device names may contain % and _ wildcards; newest releases first
+        conditions, parameters = [], []
+        for column, operator, value in [('vendor', '=', vendor), ('device_name', 'LIKE', device_name), ('firmware_version', '=', firmware_version),
+                                        ('checksum', '=', checksum), ('url', '=', url), ('changed', '>=', changed_since)]:
+            if value is not None:
+                conditions.append(f'{column} {operator} ?')
+                parameters.append(value)
+        query = 'SELECT * FROM firmware'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY released IS NULL, released DESC, last_seen DESC'
+        if limit:
+            query += ' LIMIT ?'
+            parameters.append(limit)
+        return self._db.execute(query, parameters).fetchall()
+
+    def latest(self, vendor: Optional[str] = None, device_name: Optional[str] = None) -> Optional[sqlite3.Row]:
+        rows = self.search(vendor=vendor, device_name=device_name, limit=1)
+        return rows[0] if rows else None
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM firmware').fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+
+def item_rows(spider: str, item: dict, now: Optional[float] = None) -> List[tuple]:
+    # one row per file URL of the item, with the first value of every metadata field
+    now = time() if now is None else now
+    metadata = {key: value for key, value in item.items() if key not in ('files', 'file_urls')}
+    serialized = json.dumps(metadata, default=str, sort_keys=True)
+    digest = hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+    release_date = first(item.get('release_date'))
+    released = normalize_release_date(release_date)
+    files = {result.get('url'): result for result in item.get('files') or []}
+
+    rows = []
+    for url in item.get('file_urls') or []:
+        result = files.get(url, {})
+        rows.append((url, spider, first(item.get('vendor')), first(item.get('device_name')), first(item.get('firmware_version')),
+                     first(item.get('device_class')), release_date, released, result.get('path'), result.get('checksum'),
+                     digest, serialized, now, now, now))
+    return rows
+
+
+def first(values):
+    if isinstance(values, (list, tuple)):
+        return str(values[0]) if values else None
+    return values
+
+
+@lru_cache(maxsize=4096)
+def normalize_release_date(release_date: Optional[str]) -> Optional[str]:
+    # ISO dates sort and compare as text. Most items of a crawl share few dates, strptime would dominate item_rows()
+    if not release_date:
+        return None
+    for date_format in RELEASE_DATE_FORMATS:
+        try:
+            released = datetime.strptime(release_date.strip(), date_format).date().isoformat()
+        except ValueError:
+            continue
+        return None if released == UNKNOWN_RELEASE_DATE else released
+    return None
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Query the firmware catalog database (CATALOG_DATABASE)')
+    parser.add_argument('database', help='catalog database file')
+    parser.add_argument('--json', action='store_true', help='print JSON lines with all columns instead of a table')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    latest = commands.add_parser('latest', help='newest release of a device')
+    latest.add_argument('device_name', help='device name, may contain %% and _ wildcards')
+    latest.add_argument('--vendor')
+
+    changed = commands.add_parser('changed', help='files that are new or changed in the last days')
+    changed.add_argument('--vendor')
+    changed.add_argument('--days', type=float, default=1.0)
+
+    search = commands.add_parser('search', help='files matching all given conditions')
+    search.add_argument('--vendor')
+    search.add_argument('--device', dest='device_name', help='device name, may contain %% and _ wildcards')
+    search.add_argument('--version', dest='firmware_version')
+    search.add_argument('--checksum')
+    search.add_argument('--url')
+    search.add_argument('--limit', type=int, default=100)
+    return parser.parse_args(argv)
+
+
+def query(database: CatalogDatabase, args) -> List[sqlite3.Row]:
+    if args.command == 'latest':
+        row = database.latest(vendor=args.vendor, device_name=args.device_name)
+        return [row] if row is not None else []
+    if args.command == 'changed':
+        return database.search(vendor=args.vendor, changed_since=time() - args.days * 24 * 60 * 60)
+    return database.search(vendor=args.vendor, device_name=args.device_name, firmware_version=args.firmware_version,
+                           checksum=args.checksum, url=args.url, limit=args.limit)
+
+
+def format_rows(rows: List[sqlite3.Row], as_json: bool = False) -> List[str]:
+    if as_json:
+        return [json.dumps(dict(row)) for row in rows]
+    return ['\t'.join('' if row[column] is None else str(row[column]) for column in OUTPUT_COLUMNS) for row in rows]
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    database = CatalogDatabase(args.database)
+    try:
+        rows = query(database, args)
+    finally:
+        database.close()
+    for line in format_rows(rows, as_json=args.json):
+        sys.stdout.write(line + '\n')
+    return 0 if rows else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,76 @@
+from json import dumps, loads
+from typing import List, Optional
+
+from scrapy.http import TextResponse
+from scrapy.http.common import obsolete_setter
+
+
+class FTPEntry:
+    __slots__ = ('filetype', 'perms', 'nlinks', 'owner', 'group', 'size', 'date', 'filename', 'linktarget')
+
+    def __init__(self, filetype: str, perms: str, nlinks: int, owner: str, group: str, size: int, date: str, filename: str, linktarget: Optional[str] = None):
+        self.filetype = filetype
+        self.perms = perms
+        self.nlinks = nlinks
+        self.owner = owner
+        self.group = group
+        self.size = size
+        self.date = date
+        self.filename = filename
+        self.linktarget = linktarget
+
+    @property
+    def is_dir(self) -> bool:
+        return self.filetype == 'd'
+
+    @property
+    def is_file(self) -> bool:
+        return self.filetype == '-'
+
+    def as_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __eq__(self, other):
+        return isinstance(other, FTPEntry) and all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __repr__(self):
+        return f'FTPEntry({self.filetype}, {self.filename!r})'
+
+
+class FTPListingResponse(TextResponse):
+    # Carries the parsed listing to the callback as it is. The JSON body is only built when something
+    # asks for it (HTTP cache storage, logging, tests) and vice versa.
+
+    def __init__(self, *args, entries: Optional[List[FTPEntry]] = None, **kwargs):
+        self._entries = entries
+        kwargs.setdefault('encoding', 'utf-8')
+        super().__init__(*args, **kwargs)
+
+    @property
+    def entries(self) -> List[FTPEntry]:
+        if self._entries is None:
+            self._entries = self.entries_from_body(self._body)
+        return self._entries
+
+    @staticmethod
+    def entries_from_body(body: bytes) -> List[FTPEntry]:
+        return [FTPEntry(**entry) for entry in loads(body)] if body else []
+
+    def _get_body(self):
+        if self._body is None:
+            self._body = dumps([entry.as_dict() for entry in self._entries]).encode('utf-8')
+        return self._body
+
+    def _set_body(self, body):
+        if not body and self._entries is not None:
+            self._body = None
+            return
+        super()._set_body(body)
+
+    body = property(_get_body, obsolete_setter(_set_body, 'body'))
+
+    def replace(self, *args, **kwargs):
+        kwargs.setdefault('entries', self._entries)
+        if self._entries is not None:
+            kwargs.setdefault('body', self._body)
+        return super().replace(*args, **kwargs)
@@ -1,10 +1,11 @@
 from abc import ABCMeta
-from typing import Generator
+from typing import Generator, List
 
 from scrapy import Spider
-from scrapy.loader import ItemLoader
+from scrapy.http import Response
 
 from firmware.custom_requests import FTPFileRequest, FTPListRequest
+from firmware.custom_responses import FTPEntry, FTPListingResponse
 from firmware.items import FirmwareItem
 
 
@@ -12,10 +13,7 @@ class FirmwareSpider(Spider, metaclass=ABCMeta):
 
     @staticmethod
     def item_pipeline(meta_data: dict) -> Generator[FirmwareItem, None, None]:
-        loader = ItemLoader(item=FirmwareItem(), selector=meta_data['file_urls'])
-        for key, value in meta_data.items():
-            loader.add_value(key, value)
-        yield loader.load_item()
+        yield FirmwareItem.from_meta_data(meta_data)
 
 
 class FTPSpider(FirmwareSpider, metaclass=ABCMeta):
@@ -23,3 +21,10 @@ class FTPSpider(FirmwareSpider, metaclass=ABCMeta):
     def start_requests(self):
         for url in self.start_urls:
             yield FTPListRequest(url) if url.endswith('/') else FTPFileRequest(url)
+
+    @staticmethod
+    def listing_entries(response: Response) -> List[FTPEntry]:
+        # responses restored by the HTTP cache only carry the JSON body
+        if isinstance(response, FTPListingResponse):
+            return response.entries
+        return FTPListingResponse.entries_from_body(response.body)
@@ -0,0 +1,110 @@
+import hashlib
+from typing import Dict, Iterable, List, Union
+
+try:
+    import tlsh
+except ImportError:  # only needed for tlsh digests
+    tlsh = None
+
+try:
+    import ssdeep
+except ImportError:  # only needed for ssdeep digests
+    ssdeep = None
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class Digests:
+    # Hashes of a downloaded file, updated in order while its bytes arrive. Bytes that arrive ahead of the hashed part
+    # (parallel segments, resumed downloads) are skipped and read from the complete file by catch_up(). A download
+    # that starts over from the beginning resets the hashes. md5 is the FilesPipeline checksum and sha256 names the
+    # objects of the content addressed store, so both are always computed.
+
+    REQUIRED = ('md5', 'sha256')
+
+    def __init__(self, algorithms: Iterable[str] = ()):
+        self.algorithms = list(dict.fromkeys(list(self.REQUIRED) + list(algorithms)))
+        self.position = 0
+        self._hashers = []
+        self.reset()
+
+    def reset(self):
+        # hashlib.new raises ValueError for unknown algorithms
+        self._hashers = [hashlib.new(algorithm) for algorithm in self.algorithms]
+        self.position = 0
+
+    def update(self, data: bytes, offset: int = None) -> bool:
+        if offset is None:
+            offset = self.position
+        if offset < self.position:
+            # the download started over
+            self.reset()
+        if offset != self.position:
+            return False
+        for hasher in self._hashers:
+            hasher.update(data)
+        self.position += len(data)
+        return True
+
+    def catch_up(self, filename: str) -> int:
+        # hashes what was not hashed while the file was written, returns the number of bytes read for that
+        start = self.position
+        with open(filename, 'rb') as local_file:
+            local_file.seek(start)
+            for chunk in iter(lambda: local_file.read(CHUNK_SIZE), b''):
+                self.update(chunk)
+        return self.position - start
+
+    def hexdigests(self) -> Dict[str, str]:
+        return {algorithm: hasher.hexdigest() for algorithm, hasher in zip(self.algorithms, self._hashers)}
+
+
+class TLSHDigest:
+    def __init__(self):
+        self._hasher = tlsh.Tlsh()
+
+    def update(self, data: bytes):
+        self._hasher.update(data)
+
+    def hexdigest(self):
+        self._hasher.final()
+        digest = self._hasher.hexdigest()
+        # files that are too small or too uniform have no TLSH
+        return None if digest in ('', 'TNULL') else digest
+
+
+class SSDeepDigest:
+    def __init__(self):
+        self._hasher = ssdeep.Hash()
+
+    def update(self, data: bytes):
+        self._hasher.update(data)
+
+    def hexdigest(self):
+        return self._hasher.digest()
+
+
+FUZZY_DIGESTS = {
+    'tlsh': TLSHDigest,
+    'ssdeep': SSDeepDigest,
+}
+
+
+def fuzzy_available(algorithm: str) -> bool:
+    if algorithm not in FUZZY_DIGESTS:
+        raise ValueError(f'Unknown fuzzy digest {algorithm!r}, use one of {sorted(FUZZY_DIGESTS)}')
+    return {'tlsh': tlsh, 'ssdeep': ssdeep}[algorithm] is not None
+
+
+def fuzzy_digests(source: Union[bytes, str], algorithms: List[str]) -> Dict[str, str]:
+    # runs in a worker process, source is the file content or the path of the stored file
+    hashers = {algorithm: FUZZY_DIGESTS[algorithm]() for algorithm in algorithms}
+    if isinstance(source, bytes):
+        for hasher in hashers.values():
+            hasher.update(source)
+    else:
+        with open(source, 'rb') as local_file:
+            for chunk in iter(lambda: local_file.read(CHUNK_SIZE), b''):
+                for hasher in hashers.values():
+                    hasher.update(chunk)
+    return {algorithm: hasher.hexdigest() for algorithm, hasher in hashers.items()}
@@ -0,0 +1,148 @@
+from time import time
+from typing import Dict, Optional
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+
+class SlotState:
+    # AIMD: after every window of `concurrency` fast responses the slot may run one more request in parallel (or, if
+    # it had been slowed down, waits half as long between requests again). 429/503 answers halve the concurrency and,
+    # once at the minimum, double the delay. Responses slower than target_latency halve the concurrency at most once
+    # per latency period.
+
+    def __init__(self, concurrency: int = 1, delay: float = 0, randomize_delay: Optional[bool] = None, adaptive: bool = False,
+                 min_concurrency: int = 1, max_concurrency: Optional[int] = None, target_latency: float = 2.0, max_delay: float = 60.0):
+        self.concurrency = concurrency
+        self.delay = delay
+        self.base_delay = delay
+        self.randomize_delay = randomize_delay
+        self.adaptive = adaptive
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max(concurrency, max_concurrency or concurrency)
+        self.target_latency = target_latency
+        self.max_delay = max_delay
+
+        self.slot = None
+        self._successes = 0
+        self._last_decrease = 0.0
+
+    def apply(self, slot):
+        self.slot = slot
+        slot.concurrency = self.concurrency
+        slot.delay = self.delay
+        if self.randomize_delay is not None:
+            slot.randomize_delay = self.randomize_delay
+
+    def observe(self, status: int, latency: Optional[float], backoff_statuses, now: float) -> bool:
+        # returns whether the slot was slowed down
+        if status in backoff_statuses:
+            if self.concurrency > self.min_concurrency:
+                self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+            else:
+                self.delay = min(self.max_delay, max(self.delay * 2, 0.5))
+            self._decreased(now)
+            return True
+
+        if latency is not None and latency > self.target_latency:
+            if self.concurrency > self.min_concurrency and now - self._last_decrease > latency:
+                self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+                self._decreased(now)
+                return True
+            return False
+
+        self._successes += 1
+        if self._successes >= self.concurrency:
+            self._successes = 0
+            if self.delay > self.base_delay:
+                self.delay = max(self.base_delay, self.delay / 2)
+            elif self.concurrency < self.max_concurrency:
+                self.concurrency += 1
+            self._sync()
+        return False
+
+    def _decreased(self, now: float):
+        self._successes = 0
+        self._last_decrease = now
+        self._sync()
+
+    def _sync(self):
+        if self.slot is not None:
+            self.slot.concurrency = self.concurrency
+            self.slot.delay = self.delay
+
+
+class DomainSlots:
+    # Configures the downloader slot of every host listed in the spider's `domain_slots`, e.g.
+    #   domain_slots = {'www.tp-link.com': {'concurrency': 1, 'delay': 0.75},
+    #                   'static.tp-link.com': {'concurrency': 4, 'max_concurrency': 16, 'adaptive': True}}
+    # Entries also match subdomains. Hosts that are not listed (robots.txt and redirect targets, other subdomains) keep
+    # the slot settings of the crawl, so spiders keep a conservative DOWNLOAD_DELAY and CONCURRENT_REQUESTS_PER_DOMAIN
+    # as their fallback. CONCURRENT_REQUESTS is raised to the sum of the listed maxima so that it does not cap the slots.
+
+    def __init__(self, crawler):
+        if not crawler.settings.getbool('DOMAIN_SLOTS_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.backoff_statuses = set(crawler.settings.getlist('DOMAIN_SLOTS_BACKOFF_HTTP_CODES', [429, 503]))
+        self.target_latency = crawler.settings.getfloat('DOMAIN_SLOTS_TARGET_LATENCY', 2.0)
+        self.max_delay = crawler.settings.getfloat('DOMAIN_SLOTS_MAX_DELAY', 60.0)
+        self.config: Dict[str, dict] = {}
+        self.states: Dict[str, SlotState] = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        extension = cls(crawler)
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(extension.response_downloaded, signal=signals.response_downloaded)
+        return extension
+
+    def spider_opened(self, spider):
+        self.config = {domain.lower(): dict(config) for domain, config in getattr(spider, 'domain_slots', {}).items()}
+        if not self.config:
+            return
+
+        downloader = self.crawler.engine.downloader
+        needed = sum(max(config.get('concurrency', 1), config.get('max_concurrency', 0)) for config in self.config.values())
+        downloader.total_concurrency = max(downloader.total_concurrency, needed)
+
+    def request_reached_downloader(self, request, spider):  # pylint: disable=unused-argument
+        key, slot = self._get_slot(request)
+        if slot is None:
+            return
+
+        state = self.states.get(key)
+        if state is None:
+            config = self._config_for(key)
+            if config is None:
+                return
+            state = SlotState(**dict({'target_latency': self.target_latency, 'max_delay': self.max_delay}, **config))
+            self.states[key] = state
+        if state.slot is not slot:
+            # new slot, or the downloader dropped the idle one and created a fresh one with the defaults
+            state.apply(slot)
+
+    def response_downloaded(self, response, request, spider):  # pylint: disable=unused-argument
+        key = request.meta.get('download_slot')
+        state = self.states.get(key)
+        if state is None or not state.adaptive:
+            return
+
+        if state.observe(response.status, request.meta.get('download_latency'), self.backoff_statuses, time()):
+            self.stats.inc_value(f'domain_slots/{key}/slowdowns')
+        self.stats.set_value(f'domain_slots/{key}/concurrency', state.concurrency)
+        self.stats.set_value(f'domain_slots/{key}/delay', state.delay)
+
+    def _config_for(self, host: str) -> Optional[dict]:
+        # the most specific entry wins
+        host = host.lower()
+        for domain in sorted(self.config, key=len, reverse=True):
+            if host == domain or host.endswith(f'.{domain}'):
+                return self.config[domain]
+        return None
+
+    def _get_slot(self, request):
+        key = request.meta.get('download_slot')
+        return key, self.crawler.engine.downloader.slots.get(key)
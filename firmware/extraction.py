@@ -0,0 +1,45 @@
+from typing import Dict, List, Optional
+
+from lxml import etree
+
+
+def tree(node):
+    # responses (and MockResponse) parse their body once and keep the selector, selectors wrap an lxml element
+    selector = getattr(node, 'selector', node)
+    return getattr(selector, 'root', selector)
+
+
+class XPath:
+    # An XPath expression compiled once, when the spider class is loaded. It is evaluated directly on the lxml tree of
+    # a response, or on an element found before to scope the query to that subtree, and returns plain strings and
+    # elements instead of wrapping every result in a Selector.
+
+    __slots__ = ('expression', '_compiled')
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self._compiled = etree.XPath(expression, smart_strings=False)
+
+    def nodes(self, node) -> list:
+        return self._compiled(tree(node))
+
+    def extract(self, node) -> List[str]:
+        return [result if isinstance(result, str) else serialize(result) for result in self.nodes(node)]
+
+    def get(self, node, default: Optional[str] = None) -> Optional[str]:
+        results = self.nodes(node)
+        if not results:
+            return default
+        return results[0] if isinstance(results[0], str) else serialize(results[0])
+
+    def __repr__(self):
+        return f'XPath({self.expression!r})'
+
+
+def compile_xpaths(expressions: Dict[str, str]) -> Dict[str, XPath]:
+    return {name: XPath(expression) for name, expression in expressions.items()}
+
+
+def serialize(element) -> str:
+    # same as Selector.get() for elements
+    return etree.tostring(element, method='html', encoding='unicode', with_tail=False)
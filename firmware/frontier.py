@@ -0,0 +1,145 @@
+import sqlite3
+from time import time
+from typing import Optional
+from urllib.parse import urlparse
+
+from scrapy.exceptions import NotConfigured
+
+try:
+    import redis
+except ImportError:  # only needed for redis:// frontiers
+    redis = None
+
+
+class SQLiteFrontier:
+    # Request queue, seen set and per-slot politeness clock of all workers crawling one spider, in a SQLite file. The
+    # workers have to run on the same machine: WAL mode relies on shared memory and does not work on network
+    # filesystems (NFS, SMB), workers on several machines share a RedisFrontier instead. Every operation is a single
+    # short transaction.
+
+    def __init__(self, path: str, timeout: float = 30):
+        self._db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS requests (id INTEGER PRIMARY KEY AUTOINCREMENT, spider TEXT, priority INTEGER, data BLOB)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS requests_order ON requests (spider, priority DESC, id)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS seen (spider TEXT, fingerprint TEXT, PRIMARY KEY (spider, fingerprint))')
+        self._db.execute('CREATE TABLE IF NOT EXISTS slots (spider TEXT, slot TEXT, next REAL, PRIMARY KEY (spider, slot))')
+
+    def push(self, spider: str, priority: int, data: bytes):
+        self._db.execute('INSERT INTO requests (spider, priority, data) VALUES (?, ?, ?)', (spider, priority, data))
+
+    def pop(self, spider: str) -> Optional[bytes]:
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            row = self._db.execute('SELECT id, data FROM requests WHERE spider = ? ORDER BY priority DESC, id LIMIT 1', (spider, )).fetchone()
+            if row is not None:
+                self._db.execute('DELETE FROM requests WHERE id = ?', (row[0], ))
+        finally:
+            self._db.execute('COMMIT')
+        return None if row is None else row[1]
+
+    def count(self, spider: str) -> int:
+        return self._db.execute('SELECT COUNT(*) FROM requests WHERE spider = ?', (spider, )).fetchone()[0]
+
+    def add_seen(self, spider: str, fingerprint: str) -> bool:
+        # True if no worker has seen the fingerprint before
+        return self._db.execute('INSERT OR IGNORE INTO seen VALUES (?, ?)', (spider, fingerprint)).rowcount == 1
+
+    def forget_seen(self, spider: str) -> bool:
+        # A new crawl starts with an empty seen set, it is only kept while requests are queued, i.e. by workers that
+        # join a running crawl and by the next run of an interrupted crawl. Returns whether the seen set was cleared
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            finished = self.count(spider) == 0
+            if finished:
+                self._db.execute('DELETE FROM seen WHERE spider = ?', (spider, ))
+        finally:
+            self._db.execute('COMMIT')
+        return finished
+
+    def reserve(self, spider: str, slot: str, delay: float) -> float:
+        # books the next free time of the slot for this worker and returns the seconds to wait for it
+        now = time()
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            row = self._db.execute('SELECT next FROM slots WHERE spider = ? AND slot = ?', (spider, slot)).fetchone()
+            start = max(now, row[0] if row else now)
+            self._db.execute('REPLACE INTO slots VALUES (?, ?, ?)', (spider, slot, start + delay))
+        finally:
+            self._db.execute('COMMIT')
+        return start - now
+
+    def close(self):
+        self._db.close()
+
+
+class RedisFrontier:
+    # Same as SQLiteFrontier for workers on different machines, on a Redis (or Redis protocol compatible) server
+
+    RESERVE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local start = math.max(now, tonumber(redis.call('GET', KEYS[1]) or now))
+redis.call('SET', KEYS[1], start + tonumber(ARGV[2]), 'EX', 3600)
+return tostring(start - now)
+"""
+
+    FORGET_SEEN_SCRIPT = """
+if redis.call('ZCARD', KEYS[1]) > 0 then
+  return 0
+end
+redis.call('DEL', KEYS[2])
+return 1
+"""
+
+    def __init__(self, url: str, prefix: str = 'firmware'):
+        if redis is None:
+            raise NotConfigured('redis:// frontiers need the redis package')
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._reserve = self._redis.register_script(self.RESERVE_SCRIPT)
+        self._forget_seen = self._redis.register_script(self.FORGET_SEEN_SCRIPT)
+
+    def push(self, spider: str, priority: int, data: bytes):
+        sequence = self._redis.incr(self._key(spider, 'sequence'))
+        # higher priorities first, FIFO within one priority
+        score = -priority * 10 ** 12 + sequence
+        self._redis.pipeline().hset(self._key(spider, 'data'), sequence, data).zadd(self._key(spider, 'queue'), {sequence: score}).execute()
+
+    def pop(self, spider: str) -> Optional[bytes]:
+        popped = self._redis.zpopmin(self._key(spider, 'queue'))
+        if not popped:
+            return None
+        sequence = popped[0][0]
+        data, _ = self._redis.pipeline().hget(self._key(spider, 'data'), sequence).hdel(self._key(spider, 'data'), sequence).execute()
+        return data
+
+    def count(self, spider: str) -> int:
+        return self._redis.zcard(self._key(spider, 'queue'))
+
+    def add_seen(self, spider: str, fingerprint: str) -> bool:
+        return self._redis.sadd(self._key(spider, 'seen'), fingerprint) == 1
+
+    def forget_seen(self, spider: str) -> bool:
+        return self._forget_seen(keys=[self._key(spider, 'queue'), self._key(spider, 'seen')]) == 1
+
+    def reserve(self, spider: str, slot: str, delay: float) -> float:
+        return float(self._reserve(keys=[self._key(spider, f'slot:{slot}')], args=[time(), delay]))
+
+    def close(self):
+        self._redis.close()
+
+    def _key(self, spider: str, name: str) -> str:
+        return f'{self.prefix}:{spider}:{name}'
+
+
+def frontier_from_settings(settings):
+    # FRONTIER_URL is sqlite:///path/to/frontier.db or redis://host:port/db
+    url = settings.get('FRONTIER_URL')
+    if not url:
+        return None
+    scheme = urlparse(url).scheme
+    if scheme == 'sqlite':
+        return SQLiteFrontier(url[len('sqlite://'):])
+    if scheme in ('redis', 'rediss', 'unix'):
+        return RedisFrontier(url)
+    raise NotConfigured(f'Unsupported FRONTIER_URL {url}')
@@ -0,0 +1,86 @@
+import os
+import sqlite3
+from json import dumps, loads
+from time import time
+from typing import Dict, List, Optional
+
+from scrapy.utils.project import data_path
+
+from firmware.custom_responses import FTPEntry
+
+
+class FTPListingCache:
+    # Directory listings are served from disk as long as the directory's own entry (size, date, link count)
+    # in the listing of its parent is unchanged. Only the start directories are listed unconditionally.
+    # A directory's date only changes with its direct entries, so FTP_LISTING_CACHE_MAX_AGE bounds how
+    # long changes further down an unchanged parent can go unnoticed.
+
+    COMMIT_EVERY = 100
+
+    def __init__(self, path: str, max_age: float = 0, stats=None):
+        self.max_age = max_age
+        self.stats = stats
+        self._observed: Dict[str, str] = {}
+        self._pending = 0
+
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS listing_entries (path TEXT PRIMARY KEY, fingerprint TEXT, stored REAL, files TEXT)')
+
+    @classmethod
+    def from_settings(cls, settings, stats=None) -> Optional['FTPListingCache']:
+        if not settings.getbool('FTP_LISTING_CACHE_ENABLED'):
+            return None
+        cache_dir = data_path(settings.get('FTP_LISTING_CACHE_DIR', 'ftplistingcache'), createdir=True)
+        return cls(os.path.join(cache_dir, 'listings.db'), max_age=settings.getfloat('FTP_LISTING_CACHE_MAX_AGE', 0), stats=stats)
+
+    def get(self, key: str) -> Optional[List[FTPEntry]]:
+        row = self._db.execute('SELECT fingerprint, stored, files FROM listing_entries WHERE path = ?', (key, )).fetchone()
+        if row is None:
+            self._inc_stat('ftp_listing_cache/miss')
+            return None
+
+        fingerprint, stored, files = row
+        observed = self._observed.get(key)
+        if observed is None or observed != fingerprint or self._expired(stored):
+            self._inc_stat('ftp_listing_cache/stale')
+            return None
+
+        self._inc_stat('ftp_listing_cache/hit')
+        entries = [FTPEntry(*entry) for entry in loads(files)]
+        self.observe(key, entries)
+        return entries
+
+    def put(self, key: str, entries: List[FTPEntry]):
+        files = dumps([[getattr(entry, slot) for slot in FTPEntry.__slots__] for entry in entries])
+        self._db.execute('REPLACE INTO listing_entries VALUES (?, ?, ?, ?)', (key, self._observed.get(key), time(), files))
+        self.observe(key, entries)
+
+        self._pending += 1
+        if self._pending >= self.COMMIT_EVERY:
+            self._db.commit()
+            self._pending = 0
+
+    def observe(self, key: str, entries: List[FTPEntry]):
+        for entry in entries:
+            if entry.is_dir and entry.filename not in ('.', '..'):
+                self._observed[f'{key}{entry.filename}/'] = self.fingerprint(entry)
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
+    @staticmethod
+    def key(host: str, port: int, path: str) -> str:
+        return f'{host}:{port}{path if path.endswith("/") else path + "/"}'
+
+    @staticmethod
+    def fingerprint(entry: FTPEntry) -> str:
+        return f'{entry.size}|{entry.date}|{entry.nlinks}'
+
+    def _expired(self, stored: float) -> bool:
+        return self.max_age > 0 and time() - stored > self.max_age
+
+    def _inc_stat(self, key: str):
+        if self.stats is not None:
+            self.stats.inc_value(key)
@@ -0,0 +1,181 @@
+from collections import defaultdict, deque
+from typing import Deque, Dict, NamedTuple, Optional, Tuple
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, fail
+from twisted.internet.interfaces import IDelayedCall
+from twisted.internet.protocol import ClientCreator
+from twisted.protocols.ftp import FTPClient
+
+
+class FTPPoolKey(NamedTuple):
+    host: str
+    port: int
+    user: str
+    password: str
+    passive: int
+
+
+class PooledFTPClient(FTPClient):
+    alive = False
+
+    def connectionMade(self):
+        self.alive = True
+        super().connectionMade()
+
+    def connectionLost(self, reason):
+        self.alive = False
+        super().connectionLost(reason)
+
+
+class FTPClientPool:
+    # Keeps logged-in FTP control connections per (host, port, credentials) so that
+    # consecutive LIST/RETR commands don't pay a TCP connect + login round trip each.
+
+    def __init__(self, size: int = 2, idle_timeout: float = 60.0, health_check: bool = True, stats=None, clock=None):
+        self.size = max(1, size)
+        self.idle_timeout = idle_timeout
+        self.health_check = health_check
+        self.stats = stats
+        self.clock = clock or reactor
+
+        self._idle: Dict[FTPPoolKey, Deque[Tuple[PooledFTPClient, Optional[IDelayedCall]]]] = defaultdict(deque)
+        self._leased: Dict[FTPPoolKey, int] = defaultdict(int)
+        self._waiting: Dict[FTPPoolKey, Deque[Deferred]] = defaultdict(deque)
+        self._closed = False
+
+    @classmethod
+    def from_settings(cls, settings, stats=None):
+        return cls(
+            size=settings.getint('FTP_POOL_SIZE', 2),
+            idle_timeout=settings.getfloat('FTP_POOL_IDLE_TIMEOUT', 60.0),
+            health_check=settings.getbool('FTP_POOL_HEALTH_CHECK', True),
+            stats=stats,
+        )
+
+    def acquire(self, key: FTPPoolKey) -> Deferred:
+        if self._closed:
+            return fail(RuntimeError('FTP client pool is closed'))
+
+        while self._idle[key]:
+            client, expiry = self._idle[key].pop()
+            if expiry is not None and expiry.active():
+                expiry.cancel()
+            if client.alive:
+                self._leased[key] += 1
+                return self._check_health(key, client)
+            self._inc_stat('ftp_pool/dropped_dead')
+
+        if self._leased[key] < self.size:
+            self._leased[key] += 1
+            return self._connect(key)
+
+        waiter = Deferred()
+        self._waiting[key].append(waiter)
+        return waiter
+
+    def release(self, key: FTPPoolKey, client: PooledFTPClient, reusable: bool = True):
+        if not reusable or not client.alive or self._closed:
+            self.discard(key, client)
+            return
+
+        if self._waiting[key]:
+            self._inc_stat('ftp_pool/reused')
+            self._update_reuse_ratio()
+            self._waiting[key].popleft().callback(client)
+            return
+
+        self._leased[key] -= 1
+        expiry = self.clock.callLater(self.idle_timeout, self._expire, key, client) if self.idle_timeout > 0 else None
+        self._idle[key].append((client, expiry))
+
+    def discard(self, key: FTPPoolKey, client: PooledFTPClient):
+        self._leased[key] -= 1
+        self._disconnect(client)
+        self._wake_waiter(key)
+
+    def close(self):
+        self._closed = True
+        for key, idle in self._idle.items():
+            for client, expiry in idle:
+                if expiry is not None and expiry.active():
+                    expiry.cancel()
+                self._disconnect(client)
+            idle.clear()
+        for waiting in self._waiting.values():
+            while waiting:
+                waiting.popleft().errback(RuntimeError('FTP client pool is closed'))
+
+    def idle_count(self, key: FTPPoolKey) -> int:
+        return len(self._idle[key])
+
+    def leased_count(self, key: FTPPoolKey) -> int:
+        return self._leased[key]
+
+    def _connect(self, key: FTPPoolKey) -> Deferred:
+        creator = ClientCreator(self.clock, PooledFTPClient, key.user, key.password, passive=key.passive)
+        dfd = creator.connectTCP(key.host, key.port)
+        return dfd.addCallbacks(self._logged_in, self._connect_failed, errbackArgs=(key, ))
+
+    def _logged_in(self, client: PooledFTPClient) -> PooledFTPClient:
+        self._inc_stat('ftp_pool/logins')
+        self._update_reuse_ratio()
+        return client
+
+    def _connect_failed(self, failure, key: FTPPoolKey):
+        self._leased[key] -= 1
+        self._wake_waiter(key)
+        return failure
+
+    def _check_health(self, key: FTPPoolKey, client: PooledFTPClient) -> Deferred:
+        if not self.health_check:
+            return self._reused(client)
+
+        dfd = client.queueStringCommand('NOOP')
+        dfd.addCallbacks(lambda _: self._reused(client), self._unhealthy, errbackArgs=(key, client))
+        return dfd
+
+    def _reused(self, client: PooledFTPClient):
+        self._inc_stat('ftp_pool/reused')
+        self._update_reuse_ratio()
+        return client
+
+    def _unhealthy(self, _, key: FTPPoolKey, client: PooledFTPClient) -> Deferred:
+        # the lease is kept and handed over to a fresh connection
+        self._inc_stat('ftp_pool/dropped_unhealthy')
+        self._disconnect(client)
+        return self._connect(key)
+
+    def _expire(self, key: FTPPoolKey, client: PooledFTPClient):
+        for entry in self._idle[key]:
+            if entry[0] is client:
+                self._idle[key].remove(entry)
+                break
+        self._inc_stat('ftp_pool/expired')
+        self._disconnect(client)
+
+    def _wake_waiter(self, key: FTPPoolKey):
+        if not self._waiting[key] or self._leased[key] >= self.size:
+            return
+        self._leased[key] += 1
+        waiter = self._waiting[key].popleft()
+        self._connect(key).chainDeferred(waiter)
+
+    @staticmethod
+    def _disconnect(client: PooledFTPClient):
+        if not client.alive:
+            return
+        client.quit().addErrback(lambda _: None)
+        client.transport.loseConnection()
+
+    def _inc_stat(self, key: str):
+        if self.stats is not None:
+            self.stats.inc_value(key)
+
+    def _update_reuse_ratio(self):
+        if self.stats is None:
+            return
+        logins = self.stats.get_value('ftp_pool/logins', 0)
+        reused = self.stats.get_value('ftp_pool/reused', 0)
+        self.stats.set_value('ftp_pool/logins_saved', reused)
+        self.stats.set_value('ftp_pool/reuse_ratio', round(reused / (logins + reused), 4) if logins + reused else 0.0)
@@ -1,39 +1,140 @@
-from json import dumps
+from urllib.parse import unquote
 
-from scrapy.core.downloader.handlers.ftp import FTPDownloadHandler
-from scrapy.http import TextResponse
+from scrapy.core.downloader.handlers.ftp import FTPDownloadHandler, ReceivedDataProtocol
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet.defer import succeed
 from twisted.protocols.ftp import FTPFileListProtocol
+from twisted.python.failure import Failure
+from twisted.web.client import Agent, BrowserLikeRedirectAgent
 
 from firmware.custom_requests import FTPListRequest
+from firmware.custom_responses import FTPEntry, FTPListingResponse
+from firmware.ftp_listing_cache import FTPListingCache
+from firmware.ftp_pool import FTPClientPool, FTPPoolKey
+from firmware.segmented_download import SegmentedDownload
 
 # Thanks to https://gearheart.io/articles/crawling-ftp-server-with-scrapy/
 
 
+class FTPEntryListProtocol(FTPFileListProtocol):
+
+    def addFile(self, info):
+        self.files.append(FTPEntry(**info))
+
+
+class DigestingDataProtocol(ReceivedDataProtocol):
+    # hashes the file while it is written, so that the pipeline does not have to read it again
+
+    def __init__(self, filename=None, digests=None):
+        super().__init__(filename)
+        self.digests = digests
+
+    def dataReceived(self, data):
+        if self.digests is not None:
+            self.digests.update(data, offset=self.size)
+        super().dataReceived(data)
+
+
 class FTPHandler(FTPDownloadHandler):
 
-    def __init__(self, settings):
+    def __init__(self, settings, stats=None):
         self.result = None
         super().__init__(settings)
+        self.pool = FTPClientPool.from_settings(settings, stats=stats)
+        self.listing_cache = FTPListingCache.from_settings(settings, stats=stats)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, stats=crawler.stats)
+
+    def download_request(self, request, spider):
+        parsed_url = urlparse_cached(request)
+        if isinstance(request, FTPListRequest) and self.listing_cache is not None:
+            entries = self.listing_cache.get(self._listing_key(request))
+            if entries is not None:
+                return succeed(FTPListingResponse(url=request.url, status=200, entries=entries, flags=['cached']))
+
+        key = FTPPoolKey(
+            host=parsed_url.hostname,
+            port=parsed_url.port or 21,
+            user=request.meta.get('ftp_user', self.default_user),
+            password=request.meta.get('ftp_password', self.default_password),
+            passive=1 if bool(request.meta.get('ftp_passive', self.passive_mode)) else 0,
+        )
+        dfd = self.pool.acquire(key)
+        return dfd.addCallback(self._got_pooled_client, key, request, unquote(parsed_url.path))
+
+    def _got_pooled_client(self, client, key, request, filepath):
+        result = self.gotClient(client, request, filepath)
+        # a failure that _failed could not map to a response leaves the control connection in an unknown state
+        return result.addBoth(self._release_client, key, client)
+
+    def _release_client(self, result, key, client):
+        self.pool.release(key, client, reusable=not isinstance(result, Failure))
+        return result
 
     def gotClient(self, client, request, filepath):
         # download file
         if isinstance(request, FTPListRequest):
             # ftp listings
-            proto = FTPFileListProtocol()
-            result = client.list(filepath, proto).addCallbacks(
+            proto = FTPEntryListProtocol()
+            return client.list(filepath, proto).addCallbacks(
                 callback=self._build_listing_response,
                 callbackArgs=[request, proto],
                 errback=self._failed,
                 errbackArgs=[request],
             )
-            client.quit()
-            return result
 
-        result = super().gotClient(client, request, filepath)
-        client.quit()
-        return result
+        self.client = client
+        protocol = DigestingDataProtocol(request.meta.get('ftp_local_filename'), request.meta.get('file_digests'))
+        return client.retrieveFile(filepath, protocol).addCallbacks(
+            callback=self._build_response,
+            callbackArgs=(request, protocol),
+            errback=self._failed,
+            errbackArgs=(request, ),
+        )
 
     def _build_listing_response(self, result, request, protocol):
-        # encode ftp listings in TextResponse JSON structure
         self.result = result
-        return TextResponse(url=request.url, status=200, body=dumps(protocol.files), encoding='utf-8')
+        if self.listing_cache is not None:
+            self.listing_cache.put(self._listing_key(request), protocol.files)
+        return FTPListingResponse(url=request.url, status=200, entries=protocol.files)
+
+    @staticmethod
+    def _listing_key(request):
+        parsed_url = urlparse_cached(request)
+        return FTPListingCache.key(parsed_url.hostname, parsed_url.port or 21, unquote(parsed_url.path))
+
+    def close(self):
+        self.pool.close()
+        if self.listing_cache is not None:
+            self.listing_cache.close()
+
+
+class SegmentedHTTPHandler(HTTP11DownloadHandler):
+
+    def __init__(self, settings, crawler=None):
+        super().__init__(settings, crawler)
+        self.segments = settings.getint('SEGMENTED_DOWNLOAD_SEGMENTS', 4)
+        self.min_segment_size = settings.getint('SEGMENTED_DOWNLOAD_MIN_SEGMENT_SIZE', 8 * 1024 * 1024)
+        self.retries = settings.getint('SEGMENTED_DOWNLOAD_RETRIES', 3)
+        self.checkpoint = settings.getint('SEGMENTED_DOWNLOAD_CHECKPOINT', 16 * 1024 * 1024)
+
+    def download_request(self, request, spider):
+        local_filename = request.meta.get('download_local_filename')
+        if local_filename is None:
+            return super().download_request(request, spider)
+
+        from twisted.internet import reactor
+        agent = BrowserLikeRedirectAgent(Agent(reactor, contextFactory=self._contextFactory, pool=self._pool))
+        download = SegmentedDownload(
+            agent, request, local_filename,
+            segments=self.segments,
+            min_segment_size=self.min_segment_size,
+            retries=self.retries,
+            checkpoint=self.checkpoint,
+            timeout=request.meta.get('download_timeout', 0),
+            maxsize=getattr(spider, 'download_maxsize', self._default_maxsize),
+        )
+        return download.start()
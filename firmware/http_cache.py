@@ -0,0 +1,151 @@
+import os
+import sqlite3
+import zlib
+from email.utils import formatdate
+from json import dumps, loads
+from time import time
+from typing import Optional
+
+from scrapy.extensions.httpcache import RFC2616Policy, rfc1123_to_epoch
+from scrapy.http import Headers, Response
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from scrapy.utils.request import request_fingerprint
+
+VALIDATORS = (b'ETag', b'Last-Modified')
+
+
+class ConditionalPolicy(RFC2616Policy):
+    # Discovery pages are revalidated instead of trusting their expiry headers, so that new firmware shows up on the
+    # next crawl: pages with an ETag or Last-Modified header are requested again with If-None-Match/If-Modified-Since
+    # once they are older than HTTPCACHE_REVALIDATE_AFTER seconds, unchanged pages then cost a 304 instead of their
+    # body. A conditional POST form (D-Link's tsd.dlink.com.tw) is answered with 412 instead. Pages without validators
+    # are reused for HTTPCACHE_UNVALIDATED_TTL seconds and downloaded in full after that.
+
+    CACHEABLE_CODES = (200, 203, 300, 301, 308)
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.revalidate_after = settings.getfloat('HTTPCACHE_REVALIDATE_AFTER', 0)
+        self.unvalidated_ttl = settings.getfloat('HTTPCACHE_UNVALIDATED_TTL', 0)
+        self.max_body_size = settings.getint('HTTPCACHE_MAX_BODY_SIZE', 0)
+        # recorded crawls need every response from the network
+        self.recording = settings.get('ARCHIVE_MODE') == 'record'
+
+    def should_cache_request(self, request):
+        return not self.recording and super().should_cache_request(request)
+
+    def should_cache_response(self, response, request):
+        # rendered and replayed pages pass this middleware on their way back, they have caches of their own
+        if 'selenium' in request.meta or 'archived' in response.flags:
+            return False
+        if b'no-store' in self._parse_cachecontrol(response) or response.status not in self.CACHEABLE_CODES:
+            return False
+        if 0 < self.max_body_size < len(response.body):
+            return False
+        return self._has_validators(response) or self.unvalidated_ttl > 0
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        age = self._compute_current_age(cachedresponse, request, time())
+        validated = self._has_validators(cachedresponse)
+        if b'no-cache' not in self._parse_cachecontrol(request) and age < (self.revalidate_after if validated else self.unvalidated_ttl):
+            return True
+        if validated:
+            self._set_conditional_validators(request, cachedresponse)
+        return False
+
+    def is_cached_response_valid(self, cachedresponse, response, request):
+        if response.status == 412 and request.method not in ('GET', 'HEAD') and b'If-None-Match' in request.headers:
+            # the precondition of the POST failed, i.e. the ETag still matches
+            return True
+        return super().is_cached_response_valid(cachedresponse, response, request)
+
+    @staticmethod
+    def _has_validators(response) -> bool:
+        return any(validator in response.headers for validator in VALIDATORS)
+
+
+class SQLiteCacheStorage:
+    # Responses of one spider in HTTPCACHE_DIR/<spider>.db, keyed by request fingerprint (method, URL and body, so
+    # every POST form gets its own entry) with zlib compressed bodies. Once the stored responses exceed
+    # HTTPCACHE_MAX_SIZE bytes the least recently used ones are evicted.
+
+    def __init__(self, settings):
+        self.cache_dir = data_path(settings.get('HTTPCACHE_DIR', 'httpcache'), createdir=True)
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS', 0)
+        self.max_size = settings.getint('HTTPCACHE_MAX_SIZE', 0)
+        self.stats = None
+        self._db = None
+        self._size = 0
+
+    def open_spider(self, spider):
+        self.stats = spider.crawler.stats if getattr(spider, 'crawler', None) is not None else None
+        self._db = sqlite3.connect(os.path.join(self.cache_dir, f'{spider.name}.db'))
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, url TEXT, status INTEGER, headers TEXT, body BLOB, '
+                         'size INTEGER, stored REAL, accessed REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self._size = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def close_spider(self, spider):  # pylint: disable=unused-argument
+        self._db.close()
+
+    def retrieve_response(self, spider, request) -> Optional[Response]:  # pylint: disable=unused-argument
+        key = request_fingerprint(request)
+        row = self._db.execute('SELECT url, status, headers, body, stored FROM responses WHERE key = ?', (key, )).fetchone()
+        if row is None:
+            return None
+
+        url, status, headers, body, stored = row
+        if 0 < self.expiration_secs < time() - stored:
+            self._delete([key])
+            return None
+
+        with self._db:
+            self._db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (time(), key))
+        headers = Headers({name: [value.encode('latin-1') for value in values] for name, values in loads(headers).items()})
+        if rfc1123_to_epoch(headers.get(b'Date')) is None:
+            # the age of a response is computed from its Date, without a usable one it would stay fresh forever
+            headers[b'Date'] = formatdate(stored, usegmt=True)
+        body = zlib.decompress(body)
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, status=status, headers=headers, body=body)
+
+    def store_response(self, spider, request, response):  # pylint: disable=unused-argument
+        key = request_fingerprint(request)
+        headers = dumps({name.decode('latin-1'): [value.decode('latin-1') for value in values] for name, values in response.headers.items()})
+        body = zlib.compress(response.body)
+        size = len(body) + len(headers)
+        now = time()
+        with self._db:
+            previous = self._db.execute('SELECT size FROM responses WHERE key = ?', (key, )).fetchone()
+            self._db.execute('REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (key, response.url, response.status, headers, body, size, now, now))
+        self._size += size - (previous[0] if previous else 0)
+        self._evict()
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def _evict(self):
+        if self.max_size <= 0 or self._size <= self.max_size:
+            return
+        excess, evicted = self._size - self.max_size, []
+        for key, size in self._db.execute('SELECT key, size FROM responses ORDER BY accessed'):
+            if excess <= 0:
+                break
+            evicted.append(key)
+            excess -= size
+        self._delete(evicted)
+        if self.stats is not None:
+            self.stats.inc_value('httpcache/evicted', len(evicted))
+
+    def _delete(self, keys):
+        with self._db:
+            freed = 0
+            for key in keys:
+                row = self._db.execute('SELECT size FROM responses WHERE key = ?', (key, )).fetchone()
+                if row is not None:
+                    freed += row[0]
+                    self._db.execute('DELETE FROM responses WHERE key = ?', (key, ))
+        self._size -= freed
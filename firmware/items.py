@@ -1,12 +1,37 @@
-from scrapy.item import Field, Item
+from dataclasses import dataclass
+from typing import List, Optional
 
+from scrapy.utils.misc import arg_to_iter
 
-class FirmwareItem(Item):
-    vendor = Field(default=None)
-    device_name = Field(default=None)
-    firmware_version = Field(default=None)
-    device_class = Field(default=None)
-    release_date = Field(default=None)
 
-    files = Field()
-    file_urls = Field()
+@dataclass(init=False)
+class FirmwareItem:
+    # Scrapy (itemadapter) takes dataclass items like scrapy.Item ones. With __slots__ and without an ItemLoader per
+    # item, an item costs about as much as a tuple of its values, which counts for GPL pages with thousands of archives.
+    # Every field holds a list of values, like the items the spiders used to build with ItemLoader.
+
+    __slots__ = ('vendor', 'device_name', 'firmware_version', 'device_class', 'release_date', 'files', 'file_urls')
+
+    vendor: Optional[List[str]]
+    device_name: Optional[List[str]]
+    firmware_version: Optional[List[str]]
+    device_class: Optional[List[str]]
+    release_date: Optional[List[str]]
+
+    files: Optional[List[dict]]
+    file_urls: List[str]
+
+    def __init__(self, vendor=None, device_name=None, firmware_version=None, device_class=None, release_date=None, files=None, file_urls=None):
+        self.vendor = vendor
+        self.device_name = device_name
+        self.firmware_version = firmware_version
+        self.device_class = device_class
+        self.release_date = release_date
+        self.files = files
+        # FilesPipeline iterates over the urls of every item
+        self.file_urls = file_urls if file_urls is not None else []
+
+    @classmethod
+    def from_meta_data(cls, meta_data: dict) -> 'FirmwareItem':
+        # the values ItemLoader.add_value produced: single values become one-element lists, None and [] stay unset
+        return cls(**{key: list(arg_to_iter(value)) or None for key, value in meta_data.items()})
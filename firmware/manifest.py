@@ -0,0 +1,71 @@
+import json
+import sqlite3
+from time import time
+from typing import Iterator, List, Optional, Tuple
+
+PENDING = 'pending'
+DOWNLOADED = 'downloaded'
+FAILED = 'failed'
+
+
+class Manifest:
+    # Discovery runs (MANIFEST_ONLY) record the FirmwareItems here instead of downloading their files. The
+    # manifest_download spider later works through the pending file URLs and records every result back, so
+    # discovery and the bulk downloads can be run, scheduled and scaled on their own.
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, spider TEXT, item TEXT, discovered REAL)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS files (url TEXT PRIMARY KEY, item_id INTEGER, status TEXT, attempts INTEGER, '
+                         'path TEXT, checksum TEXT, error TEXT, updated REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS files_status ON files (status, attempts)')
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional['Manifest']:
+        path = settings.get('FIRMWARE_MANIFEST')
+        return cls(path) if path else None
+
+    def add_item(self, spider: str, item: dict) -> int:
+        # files that are already downloaded keep their result, rediscovered ones just point to the newest item
+        now = time()
+        data = {key: value for key, value in item.items() if key != 'files'}
+        with self._db:
+            item_id = self._db.execute('INSERT INTO items (spider, item, discovered) VALUES (?, ?, ?)', (spider, json.dumps(data, default=str), now)).lastrowid
+            self._db.executemany(
+                'INSERT INTO files (url, item_id, status, attempts, updated) VALUES (?, ?, ?, 0, ?) '
+                'ON CONFLICT (url) DO UPDATE SET item_id = excluded.item_id',
+                [(url, item_id, PENDING, now) for url in item.get('file_urls') or []]
+            )
+        return item_id
+
+    def pending(self, max_attempts: int = 0, spider: Optional[str] = None) -> Iterator[Tuple[List[str], dict]]:
+        # one entry per item with the URLs of its files that still need to be downloaded
+        query = ('SELECT items.id, items.item, files.url FROM files JOIN items ON items.id = files.item_id '
+                 'WHERE files.status != ? AND (? <= 0 OR files.attempts < ?)')
+        parameters = [DOWNLOADED, max_attempts, max_attempts]
+        if spider is not None:
+            query += ' AND items.spider = ?'
+            parameters.append(spider)
+
+        grouped = {}
+        for item_id, item, url in self._db.execute(query + ' ORDER BY items.id', parameters).fetchall():
+            grouped.setdefault(item_id, (json.loads(item), []))[1].append(url)
+        for item, urls in grouped.values():
+            yield urls, item
+
+    def record(self, url: str, status: str, path: Optional[str] = None, checksum: Optional[str] = None, error: Optional[str] = None):
+        with self._db:
+            self._db.execute('UPDATE files SET status = ?, attempts = attempts + 1, path = ?, checksum = ?, error = ?, updated = ? WHERE url = ?',
+                             (status, path, checksum, error, time(), url))
+
+    def status(self, url: str) -> Optional[str]:
+        row = self._db.execute('SELECT status FROM files WHERE url = ?', (url, )).fetchone()
+        return None if row is None else row[0]
+
+    def counts(self) -> dict:
+        return dict(self._db.execute('SELECT status, COUNT(*) FROM files GROUP BY status').fetchall())
+
+    def close(self):
+        self._db.close()
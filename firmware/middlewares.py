@@ -1,14 +1,27 @@
-from os.path import isfile
-from time import sleep
-
-from scrapy import signals
-from scrapy.exceptions import IgnoreRequest
+import logging
+import os
+from functools import partial
+from time import time
+from types import MethodType
+from typing import Dict, List, Set
+
+from scrapy import Request, signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
 from scrapy.http import HtmlResponse
-from selenium import webdriver
-from selenium.common.exceptions import TimeoutException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions
-from selenium.webdriver.support.ui import WebDriverWait
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.project import data_path
+from scrapy.utils.request import request_fingerprint
+from scrapy.utils.spider import iterate_spider_output
+from twisted.internet import reactor
+from twisted.internet.task import deferLater
+from twisted.python.failure import Failure
+
+from firmware.archive import CrawlArchive
+from firmware.frontier import frontier_from_settings
+from firmware.render_cache import RenderCache
+from firmware.selenium_pool import SeleniumBrowser, SeleniumPool
+
+logger = logging.getLogger(__name__)
 
 
 class FirmwareSpiderMiddleware(object):
@@ -37,105 +50,175 @@ class FirmwareSpiderMiddleware(object):
         spider.logger.info('Spider opened: %s' % spider.name)
 
 
-class FirmwareDownloaderMiddleware(object):
+class RequestCoalescingMiddleware:
+    # Requests for a URL that is already on its way (same fingerprint, e.g. AVM's info_de.txt for every image of a
+    # folder) are not scheduled again, where the dupefilter would drop them together with their cb_kwargs. They wait
+    # for the first request's response instead, which is then passed to every waiting callback.
+    # If the first request fails (download error, IgnoreRequest, HTTP error) its errback passes the failure on to the
+    # errbacks of the waiting requests. If it never reaches the scheduler (filtered by the spider middlewares further
+    # out, e.g. offsite) or the dupefilter drops it, the URL is released and the next identical request goes out itself.
+    # That errback is a method the middleware adds to the spider, with the original errback's name in the meta, so that
+    # the first requests can still be serialized for JOBDIR and shared frontiers. The waiting requests stay in memory:
+    # if another worker of a shared frontier fetches the first request, they are dropped as its dupefilter would.
 
-    def __init__(self, driver_executable_path=None):
+    META_KEY = 'coalesce_key'
+    ERRBACK_KEY = 'coalesce_errback'
+    ERRBACK = 'coalesced_request_failed'
 
-        if isfile(driver_executable_path):
-            if 'geckodriver' in driver_executable_path:
-                options = webdriver.FirefoxOptions()
-                driver_cls = webdriver.Firefox
-            else:
-                options = webdriver.ChromeOptions()
-                driver_cls = webdriver.Chrome
+    def __init__(self, stats=None):
+        self.stats = stats
+        self.waiting: Dict[str, List[Request]] = {}
+        self.scheduled: Set[str] = set()
 
-            options.headless = True
-            self.driver = driver_cls(options=options, executable_path=driver_executable_path)
-            self.wait = WebDriverWait(self.driver, 15)
-        else:
-            print('Selenium driver path not set correctly')
-            exit()
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls(stats=crawler.stats)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(middleware.request_dropped, signal=signals.request_dropped)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def process_start_requests(self, start_requests, spider):
+        return self._coalesce(start_requests, spider)
+
+    def process_spider_output(self, response, result, spider):
+        yield from self._coalesce(result, spider)
+
+        for request in self._release(response.meta.get(self.META_KEY)):
+            shared_response = response.replace(request=request)
+            callback = request.callback or spider.parse
+            yield from self._coalesce(iterate_spider_output(callback(shared_response, **request.cb_kwargs)), spider)
+
+    def process_spider_exception(self, response, exception, spider):  # pylint: disable=unused-argument
+        dropped = self._release(response.meta.get(self.META_KEY))
+        self._inc_stat('coalesce/dropped', len(dropped))
+
+    def spider_opened(self, spider):
+        # requests deserialized from a JOBDIR or a shared frontier look their errback up before anything is coalesced
+        self._errback(spider)
+
+    def request_scheduled(self, request, spider):  # pylint: disable=unused-argument
+        if self.META_KEY in request.meta:
+            self.scheduled.add(request.meta[self.META_KEY])
+
+    def request_dropped(self, request, spider):  # pylint: disable=unused-argument
+        # the dupefilter drops the first request right when it is scheduled, before anything could wait for it
+        self._release(request.meta.get(self.META_KEY))
+
+    def spider_closed(self, spider):
+        orphaned = sum(len(requests) for requests in self.waiting.values())
+        if orphaned:
+            spider.logger.warning('%d coalesced requests never got a response', orphaned)
+            self._inc_stat('coalesce/dropped', orphaned)
+        self.waiting.clear()
+        self.scheduled.clear()
+
+    def _coalesce(self, result, spider):
+        errback = self._errback(spider)
+        for request in result:
+            if not isinstance(request, Request) or request.dont_filter:
+                yield request
+                continue
+
+            key = request_fingerprint(request)
+            if key in self.waiting:
+                self.waiting[key].append(request)
+                self._inc_stat('coalesce/coalesced')
+                continue
+
+            self.waiting[key] = []
+            request.meta[self.META_KEY] = key
+            if request.errback != errback:
+                # spider methods are kept by name, other callables cannot be serialized anyway
+                original = request.errback
+                is_method = getattr(original, '__self__', None) is spider
+                request.meta[self.ERRBACK_KEY] = original.__name__ if is_method else original
+                request.errback = errback
+            yield request
+
+            # the engine schedules every request before the next one is taken from here, unless a spider middleware
+            # further out dropped it
+            if key not in self.scheduled:
+                self._release(key)
+
+    def _errback(self, spider):
+        errback = getattr(spider, self.ERRBACK, None)
+        if errback is None:
+            def first_failed(spider, failure):
+                return self._first_failed(spider, failure)
+            errback = MethodType(first_failed, spider)
+            setattr(spider, self.ERRBACK, errback)
+        return errback
+
+    def _first_failed(self, spider, failure):
+        waiting = self._release(failure.request.meta.get(self.META_KEY))
+        self._inc_stat('coalesce/failed', len(waiting))
+        errback = failure.request.meta.get(self.ERRBACK_KEY)
+        if isinstance(errback, str):
+            errback = getattr(spider, errback)
+        output = list(iterate_spider_output(errback(failure))) if errback is not None else []
+        for request in waiting:
+            if request.errback is not None:
+                shared_failure = Failure(failure.value, failure.type, failure.getTracebackObject())
+                shared_failure.request = request
+                output.extend(iterate_spider_output(request.errback(shared_failure)))
+        if errback is None:
+            if not output:
+                # handled and logged like any failed request without errback
+                return failure
+            if not failure.check(IgnoreRequest):
+                logger.error('Error downloading %s, passed on to %d coalesced requests: %s', failure.request, len(waiting), failure.value)
+        return output
+
+    def _release(self, key) -> List[Request]:
+        self.scheduled.discard(key)
+        return self.waiting.pop(key, [])
+
+    def _inc_stat(self, key: str, count: int = 1):
+        if self.stats is not None and count:
+            self.stats.inc_value(key, count)
+
+
+class FirmwareDownloaderMiddleware(object):
+
+    def __init__(self, driver_executable_path=None, pool_size=2, default_wait=None, wait_timeout=10, cache=None, stats=None):
+        # browsers are launched on the first request with meta['selenium']
+        launch = partial(SeleniumBrowser.launch, driver_executable_path, default_wait=default_wait, wait_timeout=wait_timeout)
+        self.pool = SeleniumPool(launch, size=pool_size)
+        self.cache = cache
+        self.stats = stats
 
     @classmethod
     def from_crawler(cls, crawler):
-        driver_executable_path = crawler.settings.get('SELENIUM_DRIVER_EXECUTABLE_PATH')
-        settings = cls(driver_executable_path=driver_executable_path)
+        settings = cls(
+            driver_executable_path=crawler.settings.get('SELENIUM_DRIVER_EXECUTABLE_PATH'),
+            pool_size=crawler.settings.getint('SELENIUM_POOL_SIZE', 2),
+            default_wait=crawler.settings.get('SELENIUM_WAIT'),
+            wait_timeout=crawler.settings.getfloat('SELENIUM_WAIT_TIMEOUT', 10),
+            cache=RenderCache.from_settings(crawler.settings, stats=crawler.stats),
+            stats=crawler.stats,
+        )
         crawler.signals.connect(settings.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(settings.spider_closed, signal=signals.spider_closed)
 
         return settings
 
     def process_request(self, request, spider):
         if 'selenium' not in request.meta:
             return None
-        self.driver.get(request.url)
-
-        if 'hp' in request.meta:
-            body = self.hp_processor()
-        else:
-            sleep(2)
-            body = str.encode(self.driver.page_source)
-
-        return HtmlResponse(self.driver.current_url, body=body, encoding='utf-8', request=request)
-
-    def asus_processor(self):
-        try:
-            self.wait.until(
-                expected_conditions.presence_of_element_located((By.LINK_TEXT, 'DOWNLOAD'))
-            )
-        except TimeoutException:
-            print('No DOWNLOAD Field accessible for {}\nStop processing of {}'.format(self.driver.current_url, self.driver.current_url))
-            raise IgnoreRequest
-        finally:
-            return str.encode(self.driver.page_source)
-
-
-    def hp_processor(self):
-        self.driver.fullscreen_window()
-        self.handle_404()
-        self.choose_country()
-        self.choose_os()
-        self.choose_version()
-        self.update_os_version()
-
-        return str.encode(self.driver.page_source)
-
-    def handle_404(self):
-        if 'Oops!' in self.driver.find_element_by_xpath('//h1').text or 'Error 404' in self.driver.page_source:
-            print(self.driver.current_url, ': 404 Page Not Found - no firmware to find here')
-            raise IgnoreRequest
-
-    def choose_country(self):
-        element = self.wait.until(expected_conditions.element_to_be_clickable((By.LINK_TEXT, 'Australia')))
-        element.click()
-        try:
-            self.wait.until(expected_conditions.invisibility_of_element_located(element))
-        except TimeoutException:
-            element.click()
-            pass
-
-    def choose_os(self):
-        if self.wait.until(expected_conditions.element_to_be_clickable((By.ID, 'SelectDiffOS'))):
-            self.driver.find_element_by_id('SelectDiffOS').click()
-            self.wait.until(expected_conditions.element_to_be_clickable((By.ID, 'platform_dd_headerLink'))).click()
-
-            for element in self.driver.find_elements_by_xpath('//ul[@id="platform_dd_list"]/li'):
-                if element.text == 'OS Independent':
-                    element.click()
-                    break
-
-    def choose_version(self):
-        self.driver.find_element_by_id('versionnew_dd_headerValue').click()
-        for element in self.driver.find_elements_by_xpath(
-                '//ul[@id="versionnew_dd_list" and @class="dropdown-menu"]/li'):
-            if element.text == 'OS Independent':
-                element.click()
-                break
-
-    def update_os_version(self):
-        element = self.driver.find_element_by_id('os-update')
-        element.click()
-        if self.wait.until(expected_conditions.invisibility_of_element_located(element)):
-            pass
+
+        use_cache = self.cache is not None and not request.meta.get('dont_cache', False)
+        if use_cache:
+            cached = self.cache.get(request)
+            if cached is not None:
+                url, body = cached
+                return HtmlResponse(url, body=body, encoding='utf-8', request=request, flags=['cached'])
+
+        dfd = self.pool.render(request).addCallback(self._record_render, spider)
+        if use_cache:
+            dfd.addCallback(self._cache_render)
+        return dfd
 
     def process_response(self, request, response, spider):
         return response
@@ -147,4 +230,140 @@ class FirmwareDownloaderMiddleware(object):
         spider.logger.info('Spider opened: %s' % spider.name)
 
     def spider_closed(self):
-        self.driver.quit()
+        # renders that are under way still write into the cache
+        dfd = self.pool.close()
+        if self.cache is not None:
+            dfd.addBoth(lambda _: self.cache.close())
+        return dfd
+
+    def _record_render(self, response, spider):
+        meta = response.meta
+        spider.logger.debug('Rendered %s in %.2fs (ready after %.2fs)', response.url, meta['selenium_render_time'], meta.get('selenium_ready_time', 0))
+        if self.stats is not None:
+            self.stats.inc_value('selenium/renders')
+            self.stats.inc_value('selenium/render_time', meta['selenium_render_time'])
+            if 'selenium_ready_time' in meta:
+                self.stats.inc_value('selenium/ready_time', meta['selenium_ready_time'])
+            if meta.get('selenium_ready') is False:
+                self.stats.inc_value('selenium/ready_timeouts')
+        return response
+
+    def _cache_render(self, response):
+        # pages that never got ready may be incomplete
+        if response.meta.get('selenium_ready') is not False:
+            self.cache.put(response.request, response.url, response.body)
+        return response
+
+
+class SharedPolitenessMiddleware:
+    # With a shared frontier the download delay of a slot holds across all workers: every request books the next
+    # free time of its slot in the frontier and waits for it
+
+    def __init__(self, crawler, frontier):
+        self.crawler = crawler
+        self.frontier = frontier
+        self.default_delay = crawler.settings.getfloat('DOWNLOAD_DELAY')
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        frontier = frontier_from_settings(crawler.settings)
+        if frontier is None:
+            raise NotConfigured
+        middleware = cls(crawler, frontier)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def process_request(self, request, spider):
+        key = request.meta.get('download_slot') or urlparse_cached(request).hostname or ''
+        slot = self.crawler.engine.downloader.slots.get(key)
+        delay = slot.delay if slot is not None else getattr(spider, 'download_delay', self.default_delay)
+        if not delay:
+            return None
+
+        wait = self.frontier.reserve(spider.name, key, delay)
+        if wait <= 0:
+            return None
+        return deferLater(reactor, wait, lambda: None)
+
+    def spider_closed(self):
+        self.frontier.close()
+
+
+class ArchiveMiddleware:
+    # ARCHIVE_MODE = 'record' keeps every response of a crawl in a CrawlArchive, 'replay' answers all requests from
+    # it instead of downloading them, without download delays and at full speed. Requests that were not recorded are
+    # ignored, so replayed crawls never touch the network.
+    # Downloads are recorded as the handlers returned them (response_downloaded), before redirects, decompression etc.
+    # which then act on the replayed responses again. Rendered pages never reach a handler, they are recorded here,
+    # right before the Selenium middleware.
+
+    MODES = ('record', 'replay')
+    # downloads written to a local file: segmented HTTP downloads and streamed FTP files
+    LOCAL_FILE_KEYS = ('download_local_filename', 'ftp_local_filename')
+
+    def __init__(self, archive: CrawlArchive, mode: str, max_body_size: int = 0, stats=None):
+        self.archive = archive
+        self.mode = mode
+        self.max_body_size = max_body_size
+        self.stats = stats
+        self.started = time()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        mode = crawler.settings.get('ARCHIVE_MODE')
+        if not mode:
+            raise NotConfigured
+        if mode not in cls.MODES:
+            raise NotConfigured(f'Unsupported ARCHIVE_MODE {mode}')
+        path = crawler.settings.get('ARCHIVE_PATH') or os.path.join(data_path('archive', createdir=True), f'{crawler.spider.name}.db')
+        middleware = cls(CrawlArchive(path), mode, max_body_size=crawler.settings.getint('ARCHIVE_MAX_BODY_SIZE', 0), stats=crawler.stats)
+        if mode == 'record':
+            crawler.signals.connect(middleware.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def process_request(self, request, spider):  # pylint: disable=unused-argument
+        if self.mode != 'replay':
+            return None
+        response = self.archive.get(request)
+        if response is None:
+            self._inc_stat('archive/missing')
+            raise IgnoreRequest(f'{request.url} is not in the archive')
+        self._inc_stat('archive/replayed')
+        return response
+
+    def process_response(self, request, response, spider):  # pylint: disable=unused-argument
+        if self.mode == 'record' and 'selenium' in request.meta and 'archived' not in response.flags:
+            self._record(request, response)
+        return response
+
+    def response_downloaded(self, response, request, spider):  # pylint: disable=unused-argument
+        self._record(request, response)
+
+    def spider_opened(self, spider):  # pylint: disable=unused-argument
+        self.started = time()
+
+    def spider_closed(self, spider):
+        if self.mode == 'replay' and self.stats is not None:
+            elapsed = max(time() - self.started, 1e-6)
+            replayed = self.stats.get_value('archive/replayed', 0)
+            items = self.stats.get_value('item_scraped_count', 0)
+            self.stats.set_value('archive/responses_per_second', round(replayed / elapsed, 1))
+            self.stats.set_value('archive/items_per_second', round(items / elapsed, 1))
+            spider.logger.info('Replayed %d responses and scraped %d items in %.2fs (%.1f responses/s, %.1f items/s)',
+                               replayed, items, elapsed, replayed / elapsed, items / elapsed)
+        self.archive.close()
+
+    def _record(self, request, response):
+        # files written to disk while downloading (their body is the local path), and bodies above
+        # ARCHIVE_MAX_BODY_SIZE, stay out of the archive
+        if any(key in request.meta for key in self.LOCAL_FILE_KEYS) or 0 < self.max_body_size < len(response.body):
+            self._inc_stat('archive/skipped')
+            return
+        self.archive.put(request, response)
+        self._inc_stat('archive/recorded')
+
+    def _inc_stat(self, key: str):
+        if self.stats is not None:
+            self.stats.inc_value(key)
@@ -1,10 +1,436 @@
-from scrapy.pipelines.files import FilesPipeline
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import suppress
+from io import BytesIO
+from typing import Dict, Tuple
+from urllib.parse import unquote, urlparse
+
+from itemadapter import ItemAdapter
+from scrapy.exceptions import NotConfigured
+from scrapy.pipelines.files import FileException, FilesPipeline
+from scrapy.settings import Settings
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet import defer, reactor, task
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.failure import Failure
+from twisted.python.threadpool import ThreadPool
+
+from firmware.archive_contents import ArchiveContentsIndex, archive_format, index_archive
+from firmware.catalog import CatalogWriter
+from firmware.catalog_db import CatalogDatabase, item_rows
+from firmware.digests import Digests, fuzzy_available, fuzzy_digests
+from firmware.manifest import Manifest
+from firmware.stores import ContentAddressedFilesStore, FirmwareFilesStore
+
+logger = logging.getLogger(__name__)
 
 
 class FirmwarePipeline(FilesPipeline):
+    STORE_SCHEMES = dict(FilesPipeline.STORE_SCHEMES, **{'': FirmwareFilesStore, 'file': FirmwareFilesStore})
+
+    def __init__(self, store_uri, download_func=None, settings=None):
+        if not isinstance(settings, Settings):
+            settings = Settings(settings)
+        self.content_addressed = settings.getbool('FILES_STORE_CONTENT_ADDRESSED')
+        self.hardlinks = settings.getbool('FILES_STORE_HARDLINKS')
+        self.manifest_only = settings.getbool('MANIFEST_ONLY')
+        self.digest_algorithms = Digests(settings.getlist('FILES_DIGESTS')).algorithms
+        self.fuzzy_digests = []
+        for algorithm in settings.getlist('FILES_FUZZY_DIGESTS'):
+            if fuzzy_available(algorithm):
+                self.fuzzy_digests.append(algorithm)
+            else:
+                logger.warning('Fuzzy digest %s is not installed, files are not hashed with it', algorithm)
+        self.fuzzy_digest_workers = settings.getint('FILES_FUZZY_DIGEST_WORKERS', 2)
+        self._fuzzy_pool = None
+        self._reactor = reactor
+        # reads back what was not hashed while it arrived, e.g. all but the first segment of a segmented download
+        self._catch_up_pool = ThreadPool(minthreads=0, maxthreads=settings.getint('FILES_CATCH_UP_THREADS', 2), name='file_digests')
+        super().__init__(store_uri, download_func=download_func, settings=settings)
+        self.stream_downloads = settings.getbool('FTP_STREAM_DOWNLOADS') and isinstance(self.store, FirmwareFilesStore)
+        self.segmented_downloads = settings.getbool('SEGMENTED_DOWNLOADS_ENABLED') and isinstance(self.store, FirmwareFilesStore)
+
+    def _get_store(self, uri):
+        store = super()._get_store(uri)
+        if self.content_addressed and isinstance(store, FirmwareFilesStore):
+            return ContentAddressedFilesStore(uri, hardlinks=self.hardlinks)
+        return store
+
+    def close_spider(self, spider):  # pylint: disable=unused-argument
+        if self._fuzzy_pool is not None:
+            self._fuzzy_pool.shutdown()
+        if self._catch_up_pool.started:
+            self._catch_up_pool.stop()
+        if isinstance(self.store, FirmwareFilesStore):
+            self.store.close()
+
     def file_path(self, request, response=None, info=None, *, item=None):
+        if self.content_addressed:
+            # host and path keep same-named files of different vendors and folders apart
+            parsed_url = urlparse_cached(request)
+            return f'{parsed_url.hostname}{unquote(parsed_url.path)}'
         return request.url.split('/')[-1]
 
+    def get_media_requests(self, item, info):
+        if self.manifest_only:
+            # ManifestPipeline records the item, the files are fetched later by the manifest_download spider
+            return []
+        requests = super().get_media_requests(item, info)
+        segmented = self.segmented_downloads and getattr(info.spider, 'segmented_downloads', False)
+        for request in requests:
+            # the download handlers hash the file while it arrives, FilesPipeline keeps track of downloaded files itself
+            request.meta['file_digests'] = Digests(self.digest_algorithms)
+            request.meta['dont_cache'] = True
+            scheme = urlparse_cached(request).scheme
+            if self.stream_downloads and scheme == 'ftp':
+                # FTPDownloadHandler writes the data connection straight into this file
+                request.meta['ftp_local_filename'] = self.store.incomplete_path()
+            elif segmented and scheme in ('http', 'https'):
+                # SegmentedHTTPHandler fetches ranges into this file and resumes it after failures
+                request.meta['download_local_filename'] = self.store.partial_path(request.url)
+        return requests
+
+    def media_downloaded(self, response, request, info, *, item=None):
+        local_filename = request.meta.get('ftp_local_filename') or request.meta.get('download_local_filename')
+        digests = request.meta.get('file_digests')
+        missing = os.path.getsize(local_filename) - digests.position if local_filename and digests is not None and os.path.exists(local_filename) else 0
+        if response.status == 200 and missing > 0:
+            # up to the whole file (GBs for GPL archives) is hashed in a thread, without holding up the reactor
+            if not self._catch_up_pool.started:
+                self._catch_up_pool.start()
+            dfd = deferToThreadPool(self._reactor, self._catch_up_pool, digests.catch_up, local_filename)
+            dfd.addCallback(self._caught_up, info)
+            return dfd.addCallbacks(lambda _: self._media_downloaded(response, request, info, item=item), self._catch_up_failed,
+                                    errbackArgs=(request, ))
+        return self._media_downloaded(response, request, info, item=item)
+
+    def _media_downloaded(self, response, request, info, *, item=None):
+        try:
+            result = super().media_downloaded(response, request, info, item=item)
+        finally:
+            self._discard_incomplete(request)
+
+        digests = request.meta['file_digests'].hexdigests()
+        result['digests'] = digests
+        if not self.fuzzy_digests:
+            return result
+        if request.meta.get('ftp_local_filename') or request.meta.get('download_local_filename'):
+            source = self.store.stored_filename(result['path'], digests)
+        else:
+            source = response.body
+        return self._add_fuzzy_digests(result, source, info)
+
+    def media_failed(self, failure, request, info):
+        self._discard_incomplete(request)
+        return super().media_failed(failure, request, info)
+
+    def item_completed(self, results, item, info):
+        record_download = getattr(info.spider, 'record_download', None)
+        if record_download is not None:
+            for url, (ok, result) in zip(ItemAdapter(item).get(self.files_urls_field) or [], results):
+                record_download(url, ok, result)
+        return super().item_completed(results, item, info)
+
+    def file_downloaded(self, response, request, info, *, item=None):
+        digests = request.meta.setdefault('file_digests', Digests(self.digest_algorithms))
+        path = self.file_path(request, response=response, info=info, item=item)
+        local_filename = request.meta.get('ftp_local_filename') or request.meta.get('download_local_filename')
+        if local_filename is None:
+            digests.reset()
+            digests.update(response.body)
+            self.store.persist_file(path, BytesIO(response.body), info)
+            return digests.hexdigests()['md5']
+
+        if os.path.getsize(local_filename) == 0:
+            raise FileException('empty-content')
+
+        # media_downloaded already hashed the bytes that arrived out of order (other segments, resumed downloads)
+        self._caught_up(digests.catch_up(local_filename), info)
+        return self.store.persist_local_file(path, local_filename, info, digests=digests.hexdigests())
+
+    @staticmethod
+    def _caught_up(caught_up: int, info):
+        if caught_up:
+            info.spider.crawler.stats.inc_value('file_digests/catch_up_bytes', caught_up, spider=info.spider)
+
+    def _catch_up_failed(self, failure, request):
+        self._discard_incomplete(request)
+        return failure
+
+    def _add_fuzzy_digests(self, result: dict, source, info) -> defer.Deferred:
+        # fuzzy hashes are CPU bound, worker processes compute them without holding up the reactor
+        if self._fuzzy_pool is None:
+            self._fuzzy_pool = ProcessPoolExecutor(max_workers=self.fuzzy_digest_workers, mp_context=multiprocessing.get_context('spawn'))
+        dfd = defer.Deferred()
+        future = self._fuzzy_pool.submit(fuzzy_digests, source, self.fuzzy_digests)
+        future.add_done_callback(lambda done: reactor.callFromThread(self._fuzzy_done, done, dfd))
+
+        def add(fuzzy: dict):
+            result['digests'].update(fuzzy)
+            return result
+
+        def failed(failure):
+            logger.warning('Could not compute fuzzy digests of %s: %s', result['url'], failure.getErrorMessage(), extra={'spider': info.spider})
+            return result
+
+        return dfd.addCallbacks(add, failed)
+
+    @staticmethod
+    def _fuzzy_done(future, dfd: defer.Deferred):
+        if future.exception() is not None:
+            dfd.errback(Failure(future.exception()))
+        else:
+            dfd.callback(future.result())
+
+    @staticmethod
+    def _discard_incomplete(request):
+        # partial segmented downloads are kept for resuming
+        local_filename = request.meta.get('ftp_local_filename')
+        if local_filename is not None:
+            with suppress(FileNotFoundError):
+                os.remove(local_filename)
+
+
+class ManifestPipeline:
+    # Records every item of a MANIFEST_ONLY discovery run in FIRMWARE_MANIFEST
+
+    def __init__(self, manifest: Manifest, stats=None):
+        self.manifest = manifest
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('MANIFEST_ONLY'):
+            raise NotConfigured
+        manifest = Manifest.from_settings(crawler.settings)
+        if manifest is None:
+            raise NotConfigured('MANIFEST_ONLY needs FIRMWARE_MANIFEST to be set')
+        return cls(manifest, stats=crawler.stats)
+
+    def process_item(self, item, spider):
+        self.manifest.add_item(spider.name, ItemAdapter(item).asdict())
+        if self.stats is not None:
+            self.stats.inc_value('manifest/items')
+        return item
+
+    def close_spider(self, spider):  # pylint: disable=unused-argument
+        self.manifest.close()
+
+
+class ArchiveContentsPipeline:
+    # Lists the members of every downloaded archive into the ARCHIVE_CONTENTS_INDEX database, without extracting it.
+    # ARCHIVE_CONTENTS_WORKERS processes read the archives, the items go on right away. Archives that are already in
+    # the index (by checksum) are not read again
+
+    def __init__(self, index_path: str, store: FirmwareFilesStore, workers: int = 2, stats=None, reactor_=None):
+        self.index_path = index_path
+        self.index = ArchiveContentsIndex(index_path)
+        self.store = store
+        self.workers = max(1, workers)
+        self.stats = stats
+        self._reactor = reactor_ or reactor
+        self._pool = None
+        self._pending = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        index_path = settings.get('ARCHIVE_CONTENTS_INDEX')
+        if not index_path:
+            raise NotConfigured
+        store_uri = settings.get('FILES_STORE')
+        if not store_uri or (not os.path.isabs(store_uri) and urlparse(store_uri).scheme not in ('', 'file')):
+            raise NotConfigured('ARCHIVE_CONTENTS_INDEX needs a local FILES_STORE')
+        if settings.getbool('FILES_STORE_CONTENT_ADDRESSED'):
+            store = ContentAddressedFilesStore(store_uri)
+        else:
+            store = FirmwareFilesStore(store_uri)
+        return cls(index_path, store, workers=settings.getint('ARCHIVE_CONTENTS_WORKERS', 2), stats=crawler.stats)
+
+    def process_item(self, item, spider):  # pylint: disable=unused-argument
+        for result in ItemAdapter(item).get('files') or []:
+            self.index.add_file(result['url'], result['checksum'], result['path'])
+            if result['checksum'] in self._pending or self.index.indexed(result['checksum']):
+                continue
+            filename = self.store.stored_filename(result['path'], result.get('digests'))
+            if not os.path.exists(filename) or archive_format(filename) is None:
+                continue
+            self._pending[result['checksum']] = self._index(filename, result)
+        return item
+
+    def close_spider(self, spider) -> defer.Deferred:  # pylint: disable=unused-argument
+        return defer.DeferredList(list(self._pending.values())).addBoth(self._close)
+
+    def _index(self, filename: str, result: dict) -> defer.Deferred:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        dfd = defer.Deferred()
+        future = self._pool.submit(index_archive, self.index_path, filename, result['checksum'], result['path'])
+        future.add_done_callback(lambda done: self._reactor.callFromThread(self._indexed, done, dfd))
+        return dfd.addCallbacks(self._count, self._index_failed, errbackArgs=(result['url'], )).addBoth(self._done, result['checksum'])
+
+    @staticmethod
+    def _indexed(future, dfd: defer.Deferred):
+        if future.exception() is not None:
+            dfd.errback(Failure(future.exception()))
+        else:
+            dfd.callback(future.result())
+
+    def _count(self, indexed):
+        _, members = indexed
+        if self.stats is not None:
+            self.stats.inc_value('archive_contents/archives')
+            self.stats.inc_value('archive_contents/members', members)
+
+    def _index_failed(self, failure, url: str):
+        logger.warning('Could not list the members of %s: %s', url, failure.getErrorMessage())
+        if self.stats is not None:
+            self.stats.inc_value('archive_contents/failed')
+
+    def _done(self, result, checksum: str):
+        self._pending.pop(checksum, None)
+        return result
+
+    def _close(self, _):
+        if self._pool is not None:
+            self._pool.shutdown()
+        self.store.close()
+        self.index.close()
+
+
+class CatalogPipeline:
+    # Streams every item into the rotating JSON lines catalog in CATALOG_DIR, one series of files per spider. Runs after
+    # the files pipelines, so that the records include the downloaded files. With CATALOG_PREFIX all spiders of a process
+    # (e.g. firmware.runner) write one shared series of files instead, the last spider to close closes it
+
+    # (directory, prefix) -> [writer, flush task, open spiders], shared by the pipelines of all crawlers in the process
+    _shared: Dict[Tuple[str, str], list] = {}
+
+    def __init__(self, directory: str, settings, stats=None):
+        self.directory = directory
+        self.prefix = settings.get('CATALOG_PREFIX', '')
+        self.compression = settings.get('CATALOG_COMPRESSION', '')
+        self.batch_size = settings.getint('CATALOG_BATCH_SIZE', 500)
+        self.flush_interval = settings.getfloat('CATALOG_FLUSH_INTERVAL', 0)
+        self.max_bytes = settings.getint('CATALOG_ROTATE_BYTES', 0)
+        self.max_seconds = settings.getfloat('CATALOG_ROTATE_SECONDS', 0)
+        self.stats = stats
+        self.writer = None
+        self._key = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        directory = crawler.settings.get('CATALOG_DIR')
+        if not directory:
+            raise NotConfigured
+        return cls(directory, crawler.settings, stats=crawler.stats)
+
+    def open_spider(self, spider):
+        prefix = self.prefix or spider.name
+        self._key = (os.path.abspath(self.directory), prefix)
+        if self._key not in self._shared:
+            writer = CatalogWriter(self.directory, prefix=prefix, compression=self.compression, batch_size=self.batch_size,
+                                   flush_interval=self.flush_interval, max_bytes=self.max_bytes, max_seconds=self.max_seconds)
+            flush_task = None
+            if self.flush_interval:
+                # batches are also written while no items arrive, e.g. during long downloads
+                flush_task = task.LoopingCall(writer.flush)
+                flush_task.start(self.flush_interval, now=False)
+            self._shared[self._key] = [writer, flush_task, 0]
+        self._shared[self._key][2] += 1
+        self.writer = self._shared[self._key][0]
+
+    def process_item(self, item, spider):
+        # a shallow copy is enough to serialize the item, asdict() copies every nested value
+        self.writer.write(dict(ItemAdapter(item).items(), spider=spider.name))
+        if self.stats is not None:
+            self.stats.inc_value('catalog/items')
+        return item
+
+    def close_spider(self, spider):  # pylint: disable=unused-argument
+        shared = self._shared[self._key]
+        shared[2] -= 1
+        if shared[2]:
+            self.writer.flush()
+        else:
+            del self._shared[self._key]
+            if shared[1] is not None and shared[1].running:
+                shared[1].stop()
+            self.writer.close()
+        if self.stats is not None:
+            self.stats.set_value('catalog/files', len(self.writer.paths))
+
+
+class CatalogDatabasePipeline:
+    # Upserts every item into the CATALOG_DATABASE. Items are collected into batches of CATALOG_DATABASE_BATCH_SIZE
+    # (or whatever arrived within CATALOG_DATABASE_FLUSH_INTERVAL seconds) that one worker thread writes in a single
+    # transaction each, so that neither SQLite nor the disk hold up the reactor
+
+    def __init__(self, database: CatalogDatabase, batch_size: int = 1000, flush_interval: float = 0, stats=None, reactor_=None):
+        self.database = database
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.stats = stats
+        self._reactor = reactor_ or reactor
+        self._batch = []
+        self._pending = set()
+        self._flush_task = None
+        self._threadpool = ThreadPool(minthreads=0, maxthreads=1, name='catalog_database')
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('CATALOG_DATABASE')
+        if not path:
+            raise NotConfigured
+        return cls(CatalogDatabase(path), batch_size=crawler.settings.getint('CATALOG_DATABASE_BATCH_SIZE', 1000),
+                   flush_interval=crawler.settings.getfloat('CATALOG_DATABASE_FLUSH_INTERVAL', 0), stats=crawler.stats)
+
+    def open_spider(self, spider):  # pylint: disable=unused-argument
+        self._threadpool.start()
+        if self.flush_interval:
+            self._flush_task = task.LoopingCall(self.flush)
+            self._flush_task.start(self.flush_interval, now=False)
+
+    def process_item(self, item, spider):
+        self._batch.extend(item_rows(spider.name, dict(ItemAdapter(item).items())))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+        return item
+
+    def flush(self) -> defer.Deferred:
+        if self._batch:
+            rows, self._batch = self._batch, []
+            # a single thread writes the batches in order
+            dfd = deferToThreadPool(self._reactor, self._threadpool, self.database.upsert, rows)
+            dfd.addCallbacks(self._written, self._write_failed, callbackArgs=(len(rows), ), errbackArgs=(len(rows), ))
+            dfd.addBoth(self._done, dfd)
+            self._pending.add(dfd)
+        return defer.DeferredList(list(self._pending))
+
+    def close_spider(self, spider) -> defer.Deferred:  # pylint: disable=unused-argument
+        if self._flush_task is not None and self._flush_task.running:
+            self._flush_task.stop()
+        return self.flush().addBoth(self._close)
+
+    def _written(self, _, count: int):
+        if self.stats is not None:
+            self.stats.inc_value('catalog_database/rows', count)
+
+    def _write_failed(self, failure, count: int):
+        logger.error('Could not write %d rows to the catalog database: %s', count, failure.getErrorMessage())
+        if self.stats is not None:
+            self.stats.inc_value('catalog_database/failed_rows', count)
+
+    def _done(self, result, dfd: defer.Deferred):
+        self._pending.discard(dfd)
+        return result
+
+    def _close(self, _):
+        self._threadpool.stop()
+        self.database.close()
+
 
 class HpPipeline(FirmwarePipeline):
     pass
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import sqlite3
+import zlib
+from json import dumps
+from time import time
+from typing import Optional, Tuple
+
+from scrapy.utils.project import data_path
+
+
+class RenderCache:
+    # Rendered HTML of Selenium requests, kept on disk for SELENIUM_CACHE_TTL seconds. Once the stored bodies exceed
+    # SELENIUM_CACHE_MAX_SIZE bytes the least recently used pages are evicted.
+
+    # request.meta keys that change what the browser renders for a URL
+    RELEVANT_META = ('hp', 'selenium_wait')
+
+    def __init__(self, path: str, ttl: float = 0, max_size: int = 0, stats=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.stats = stats
+
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, url TEXT, body BLOB, size INTEGER, stored REAL, accessed REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed)')
+        self._size = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+
+    @classmethod
+    def from_settings(cls, settings, stats=None) -> Optional['RenderCache']:
+        if not settings.getbool('SELENIUM_CACHE_ENABLED'):
+            return None
+        cache_dir = data_path(settings.get('SELENIUM_CACHE_DIR', 'seleniumcache'), createdir=True)
+        return cls(os.path.join(cache_dir, 'pages.db'), ttl=settings.getfloat('SELENIUM_CACHE_TTL', 0),
+                   max_size=settings.getint('SELENIUM_CACHE_MAX_SIZE', 0), stats=stats)
+
+    def get(self, request) -> Optional[Tuple[str, bytes]]:
+        key = self.key(request)
+        row = self._db.execute('SELECT url, body, stored FROM pages WHERE key = ?', (key, )).fetchone()
+        if row is None:
+            self._inc_stat('selenium_cache/miss')
+            return None
+
+        url, body, stored = row
+        if self.ttl > 0 and time() - stored > self.ttl:
+            self._delete(key)
+            self._inc_stat('selenium_cache/expired')
+            return None
+
+        with self._db:
+            self._db.execute('UPDATE pages SET accessed = ? WHERE key = ?', (time(), key))
+        self._inc_stat('selenium_cache/hit')
+        return url, zlib.decompress(body)
+
+    def put(self, request, url: str, body: bytes):
+        key = self.key(request)
+        compressed = zlib.compress(body)
+        now = time()
+        with self._db:
+            previous = self._db.execute('SELECT size FROM pages WHERE key = ?', (key, )).fetchone()
+            self._db.execute('REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)', (key, url, compressed, len(compressed), now, now))
+        self._size += len(compressed) - (previous[0] if previous else 0)
+        self._evict()
+
+    def close(self):
+        self._db.close()
+
+    @classmethod
+    def key(cls, request) -> str:
+        meta = {name: request.meta[name] for name in cls.RELEVANT_META if name in request.meta}
+        return hashlib.sha1(f'{request.url} {dumps(meta, sort_keys=True)}'.encode('utf-8')).hexdigest()
+
+    def _evict(self):
+        if self.max_size <= 0:
+            return
+        while self._size > self.max_size:
+            row = self._db.execute('SELECT key FROM pages ORDER BY accessed LIMIT 1').fetchone()
+            if row is None:
+                break
+            self._delete(row[0])
+            self._inc_stat('selenium_cache/evicted')
+
+    def _delete(self, key: str):
+        with self._db:
+            row = self._db.execute('SELECT size FROM pages WHERE key = ?', (key, )).fetchone()
+            self._db.execute('DELETE FROM pages WHERE key = ?', (key, ))
+        if row is not None:
+            self._size -= row[0]
+
+    def _inc_stat(self, key: str):
+        if self.stats is not None:
+            self.stats.inc_value(key)
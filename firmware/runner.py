@@ -0,0 +1,58 @@
+import argparse
+import logging
+from typing import List, Optional
+
+from scrapy.crawler import Crawler, CrawlerProcess
+from scrapy.utils.project import get_project_settings
+
+# spiders that are not vendor crawls and only run when asked for explicitly
+EXCLUDED_SPIDERS = ['manifest_download']
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Run several firmware spiders concurrently in one process')
+    parser.add_argument('spiders', nargs='*', help='spider names, all vendor spiders if omitted')
+    parser.add_argument('--catalog', metavar='DIR', help='stream the items of all spiders into one catalog in this directory')
+    parser.add_argument('-s', '--set', action='append', default=[], metavar='NAME=VALUE', help='set or override a setting')
+    args = parser.parse_args(argv)
+
+    invalid = [setting for setting in args.set if '=' not in setting or setting.startswith('=')]
+    if invalid:
+        parser.error(f'settings must be given as NAME=VALUE: {", ".join(invalid)}')
+    args.overrides = dict(setting.split('=', 1) for setting in args.set)
+    return args
+
+
+def run(spiders: List[str], catalog: Optional[str] = None, overrides: Optional[dict] = None) -> List[Crawler]:
+    settings = get_project_settings()
+    settings.setdict(overrides or {}, priority='cmdline')
+    if catalog:
+        # the CatalogPipelines of all crawlers share one series of files, records keep their spider's name
+        settings.set('CATALOG_DIR', catalog, priority='cmdline')
+        settings.set('CATALOG_PREFIX', 'catalog', priority='cmdline')
+    process = CrawlerProcess(settings)
+
+    names = spiders or [name for name in process.spider_loader.list() if name not in EXCLUDED_SPIDERS]
+    crawlers = []
+    for name in names:
+        # every spider keeps its own crawler, i.e. its own custom_settings, slots and politeness
+        crawler = process.create_crawler(name)
+        process.crawl(crawler)
+        crawlers.append(crawler)
+
+    logging.getLogger(__name__).info('Running %d spiders in one process: %s', len(names), ', '.join(names))
+    process.start()
+    return crawlers
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    crawlers = run(args.spiders, catalog=args.catalog, overrides=args.overrides)
+    failed = [crawler.spidercls.name for crawler in crawlers if crawler.stats.get_value('finish_reason') != 'finished']
+    if failed:
+        logging.getLogger(__name__).error('Spiders that did not finish: %s', ', '.join(failed))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,115 @@
+import pickle
+from time import time
+
+from scrapy import signals
+from scrapy.core.scheduler import Scheduler
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.exceptions import DontCloseSpider
+from scrapy.utils.reqser import request_from_dict, request_to_dict
+
+from firmware.frontier import frontier_from_settings
+
+
+class FrontierQueue:
+    # Stands in for the scheduler's disk queue. Requests that cannot be serialized (e.g. with static method or lambda
+    # callbacks) raise ValueError in push and stay in this worker's memory queue, as with JOBDIR.
+
+    def __init__(self, frontier, spider):
+        self.frontier = frontier
+        self.spider = spider
+
+    def push(self, request):
+        try:
+            data = pickle.dumps(request_to_dict(request, self.spider), protocol=4)
+        except (pickle.PicklingError, AttributeError, TypeError) as error:
+            # e.g. a lambda in the meta, reported like Scrapy's disk queues do
+            raise ValueError(str(error)) from error
+        self.frontier.push(self.spider.name, request.priority, data)
+
+    def pop(self):
+        data = self.frontier.pop(self.spider.name)
+        return None if data is None else request_from_dict(pickle.loads(data), self.spider)
+
+    def close(self):
+        self.frontier.close()
+
+    def __len__(self):
+        return self.frontier.count(self.spider.name)
+
+
+class SharedScheduler(Scheduler):
+    # Lets several `scrapy crawl` workers, on one or many machines, work through the same frontier (FRONTIER_URL).
+    # Without FRONTIER_URL this is the stock scheduler. A worker whose frontier has run dry keeps waiting for
+    # FRONTIER_IDLE_TIMEOUT seconds, as the other workers may still add requests.
+
+    def __init__(self, dupefilter, frontier=None, idle_timeout: float = 0, **kwargs):
+        super().__init__(dupefilter, **kwargs)
+        self.frontier = frontier
+        self.idle_timeout = idle_timeout
+        self._idle_since = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        scheduler = super().from_crawler(crawler)
+        scheduler.frontier = frontier_from_settings(crawler.settings)
+        scheduler.idle_timeout = crawler.settings.getfloat('FRONTIER_IDLE_TIMEOUT', 0)
+        if scheduler.frontier is not None:
+            crawler.signals.connect(scheduler.spider_idle, signal=signals.spider_idle)
+        return scheduler
+
+    def open(self, spider):
+        if self.frontier is None:
+            return super().open(spider)
+        self.spider = spider
+        self.mqs = self._mq()
+        self.dqs = FrontierQueue(self.frontier, spider)
+        return self.df.open()
+
+    def close(self, reason):
+        if self.frontier is None:
+            return super().close(reason)
+        self.dqs.close()
+        return self.df.close(reason)
+
+    def next_request(self):
+        request = super().next_request()
+        if request is not None:
+            self._idle_since = None
+        return request
+
+    def spider_idle(self, spider):  # pylint: disable=unused-argument
+        if self._idle_since is None:
+            self._idle_since = time()
+        if time() - self._idle_since < self.idle_timeout:
+            raise DontCloseSpider
+
+
+class SharedDupeFilter(RFPDupeFilter):
+    # The seen set of all workers of a spider lives in the frontier, without FRONTIER_URL this is RFPDupeFilter. The
+    # seen set of a finished crawl is cleared when the next one opens, see SQLiteFrontier.forget_seen
+
+    def __init__(self, path=None, debug=False, frontier=None, spider_name=None):
+        super().__init__(path, debug)
+        self.frontier = frontier
+        self.spider_name = spider_name
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        dupefilter = cls.from_settings(crawler.settings)
+        dupefilter.frontier = frontier_from_settings(crawler.settings)
+        dupefilter.spider_name = crawler.spider.name
+        return dupefilter
+
+    def open(self):
+        if self.frontier is not None and self.frontier.forget_seen(self.spider_name):
+            self.logger.debug('Starting a new crawl of %s with an empty seen set', self.spider_name)
+
+    def request_seen(self, request):
+        if self.frontier is None:
+            return super().request_seen(request)
+        return not self.frontier.add_seen(self.spider_name, self.request_fingerprint(request))
+
+    def close(self, reason):
+        super().close(reason)
+        if self.frontier is not None:
+            self.frontier.close()
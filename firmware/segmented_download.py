@@ -0,0 +1,290 @@
+import json
+import os
+import re
+from contextlib import suppress
+from typing import List, Optional
+
+from scrapy.http import Headers, Response
+from scrapy.utils.python import to_bytes, to_unicode
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, DeferredList
+from twisted.internet.protocol import Protocol
+from twisted.web.client import ResponseDone
+from twisted.web.http import PotentialDataLoss
+from twisted.web.http_headers import Headers as TxHeaders
+
+CONTENT_RANGE_RE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+)')
+# the answer to the probe of an empty file, there is no first byte to return
+EMPTY_RANGE_RE = re.compile(r'bytes\s+\*/0$')
+
+
+class SegmentedDownloadError(Exception):
+    pass
+
+
+class Segment:
+    __slots__ = ('start', 'end', 'position')
+
+    def __init__(self, start: int, end: Optional[int], position: Optional[int] = None):
+        self.start = start
+        self.end = end  # inclusive, None while the length is unknown
+        self.position = start if position is None else position
+
+    @property
+    def done(self) -> bool:
+        return self.end is not None and self.position > self.end
+
+    @property
+    def remaining(self) -> Optional[int]:
+        return None if self.end is None else self.end - self.position + 1
+
+    @classmethod
+    def split(cls, total: int, count: int, min_size: int) -> List['Segment']:
+        if total <= 0:
+            return []
+        count = max(1, min(count, total // max(1, min_size)))
+        size = -(-total // count)
+        return [cls(start, min(start + size, total) - 1) for start in range(0, total, size)]
+
+
+class AbortBody(Protocol):
+    # drops the connection instead of reading a body nobody needs
+
+    def connectionMade(self):
+        self.transport.stopProducing()
+
+
+class SegmentWriter(Protocol):
+    # writes one (ranged) response body into the shared target file at the segment's position
+
+    def __init__(self, download: 'SegmentedDownload', segment: Segment, finished: Deferred):
+        self.download = download
+        self.segment = segment
+        self.finished = finished
+        self.file = open(download.filename, 'r+b')  # pylint: disable=consider-using-with
+        self.file.seek(segment.position)
+        self.idle_timer = None
+
+    def connectionMade(self):
+        self.download.writers.add(self)
+        if self.download.timeout:
+            self.idle_timer = self.download.clock.callLater(self.download.timeout, self.transport.stopProducing)
+
+    def dataReceived(self, data):
+        if self.download.cancelled:
+            # another segment failed, what is still in flight is dropped
+            return
+        if self.idle_timer is not None and self.idle_timer.active():
+            self.idle_timer.reset(self.download.timeout)
+
+        remaining = self.segment.remaining
+        if remaining is not None:
+            data = data[:remaining]
+        if self.download.digests is not None:
+            # only the segment at the hashed position is hashed while it arrives
+            self.download.digests.update(data, offset=self.segment.position)
+        self.file.write(data)
+        self.segment.position += len(data)
+        self.download.progress(len(data))
+
+    def connectionLost(self, reason=None):
+        self.download.writers.discard(self)
+        if self.idle_timer is not None and self.idle_timer.active():
+            self.idle_timer.cancel()
+        self.file.close()
+
+        if reason.check(ResponseDone) or (reason.check(PotentialDataLoss) and self.segment.end is None):
+            if self.segment.end is None:
+                self.segment.end = self.segment.position - 1
+            self.finished.callback(self.segment)
+        elif self.segment.done:
+            # the server kept sending after the requested range
+            self.finished.callback(self.segment)
+        else:
+            self.finished.errback(reason)
+
+
+class SegmentedDownload:
+    # Fetches one URL with parallel HTTP Range requests into a local file. Progress is kept in <file>.state so that
+    # a failed or interrupted download resumes where it stopped, as long as the server still reports the same
+    # length and validator (ETag or Last-Modified). Servers without range support get a single plain stream.
+    # The first segment that fails for good cancels the others, nothing is written into the file after that.
+
+    STATE_SUFFIX = '.state'
+
+    def __init__(self, agent, request, filename: str, segments: int = 4, min_segment_size: int = 8 * 1024 * 1024,
+                 retries: int = 3, checkpoint: int = 16 * 1024 * 1024, timeout: float = 0, maxsize: int = 0, clock=None):
+        self.agent = agent
+        self.request = request
+        self.filename = filename
+        self.segment_count = segments
+        self.min_segment_size = min_segment_size
+        self.retries = retries
+        self.checkpoint = checkpoint
+        self.timeout = timeout
+        self.maxsize = maxsize
+        self.clock = clock or reactor
+        self.digests = request.meta.get('file_digests') if request is not None else None
+
+        self.total: Optional[int] = None
+        self.validator: Optional[str] = None
+        self.segments: List[Segment] = []
+        self.resumed = 0
+        self.cancelled = False
+        self.writers = set()
+        self._requests = set()
+        self._unsaved = 0
+
+    @property
+    def state_filename(self) -> str:
+        return self.filename + self.STATE_SUFFIX
+
+    def start(self) -> Deferred:
+        dfd = self._request(b'bytes=0-0', if_range=False)
+        return dfd.addCallback(self._probed)
+
+    def progress(self, received: int):
+        self._unsaved += received
+        if self._unsaved >= self.checkpoint:
+            self._save_state()
+
+    def _probed(self, response):
+        if response.code == 200:
+            # no range support, the probe already streams the complete body
+            self.segments = [Segment(0, response.length - 1 if isinstance(response.length, int) else None)]
+            self._check_maxsize(response.length if isinstance(response.length, int) else 0)
+            self._truncate(0)
+            return self._write(response, self.segments[0]).addCallback(self._finished)
+
+        if response.code == 416 and EMPTY_RANGE_RE.match(to_unicode(self._header(response, b'Content-Range') or '')):
+            response.deliverBody(Protocol())
+            self._truncate(0)
+            return self._finished(None)
+
+        if response.code != 206:
+            response.deliverBody(Protocol())
+            return self._response(response.code, b'')
+
+        match = CONTENT_RANGE_RE.search(to_unicode(self._header(response, b'Content-Range') or ''))
+        response.deliverBody(Protocol())
+        if match is None:
+            raise SegmentedDownloadError(f'Unusable Content-Range for {self.request.url}')
+
+        self.total = int(match.group(3))
+        self._check_maxsize(self.total)
+        self.validator = self._header(response, b'ETag') or self._header(response, b'Last-Modified')
+
+        if not self._load_state():
+            self.segments = Segment.split(self.total, self.segment_count, self.min_segment_size)
+            self._truncate(self.total)
+        self._save_state()
+
+        pending = [self._fetch(segment, self.retries) for segment in self.segments if not segment.done]
+        dfd = DeferredList(pending, fireOnOneErrback=True, consumeErrors=True)
+        return dfd.addCallbacks(self._finished, self._failed)
+
+    def _fetch(self, segment: Segment, retries: int) -> Deferred:
+        dfd = self._request(to_bytes(f'bytes={segment.position}-{segment.end}'))
+        dfd.addCallback(self._check_partial, segment)
+
+        def retry(failure):
+            self._save_state()
+            if retries <= 0 or self.cancelled:
+                return failure
+            return self._fetch(segment, retries - 1)
+
+        return dfd.addErrback(retry)
+
+    def _check_partial(self, response, segment: Segment) -> Deferred:
+        if response.code != 206:
+            response.deliverBody(AbortBody())
+            raise SegmentedDownloadError(f'Expected 206 for {self.request.url} range {segment.position}-{segment.end}, got {response.code}')
+        return self._write(response, segment)
+
+    def _write(self, response, segment: Segment) -> Deferred:
+        finished = Deferred()
+        response.deliverBody(SegmentWriter(self, segment, finished))
+        return finished
+
+    def _finished(self, _):
+        with suppress(FileNotFoundError):
+            os.remove(self.state_filename)
+        size = os.path.getsize(self.filename)
+        headers = {'local filename': self.filename, 'size': size}
+        return self._response(200, to_bytes(self.filename), headers=headers, flags=['segmented'] + (['resumed'] if self.resumed else []))
+
+    def _failed(self, failure):
+        self._cancel()
+        self._save_state()
+        return failure.value.subFailure
+
+    def _cancel(self):
+        self.cancelled = True
+        for dfd in list(self._requests):
+            dfd.cancel()
+        for writer in list(self.writers):
+            writer.transport.stopProducing()
+
+    def _request(self, byte_range: bytes, if_range: bool = True) -> Deferred:
+        # the byte offsets of a compressed range would not match the file
+        headers = TxHeaders({key: values for key, values in self.request.headers.items() if key.lower() != b'accept-encoding'})
+        headers.setRawHeaders(b'Accept-Encoding', [b'identity'])
+        headers.setRawHeaders(b'Range', [byte_range])
+        if if_range and self.validator is not None:
+            headers.setRawHeaders(b'If-Range', [to_bytes(self.validator)])
+        dfd = self.agent.request(b'GET', to_bytes(self.request.url), headers, None)
+        self._requests.add(dfd)
+
+        def responded(result):
+            self._requests.discard(dfd)
+            return result
+
+        return dfd.addBoth(responded)
+
+    def _response(self, status: int, body: bytes, headers: dict = None, flags: list = None):
+        return Response(url=self.request.url, status=status, headers=Headers(headers or {}), body=body, flags=flags)
+
+    def _load_state(self) -> bool:
+        try:
+            with open(self.state_filename) as state_file:
+                state = json.load(state_file)
+        except (FileNotFoundError, ValueError):
+            return False
+
+        if state.get('total') != self.total or state.get('validator') != self.validator or not os.path.exists(self.filename):
+            return False
+
+        self.segments = [Segment(*segment) for segment in state['segments']]
+        self.resumed = sum(segment.position - segment.start for segment in self.segments)
+        return True
+
+    def _save_state(self):
+        if self.total is None:
+            return
+        # the recorded positions must not run ahead of what is on disk, or a resumed download would skip the bytes
+        # that were still buffered when the process died
+        for writer in list(self.writers):
+            writer.file.flush()
+            os.fsync(writer.file.fileno())
+        state = {'total': self.total, 'validator': self.validator, 'segments': [[s.start, s.end, s.position] for s in self.segments]}
+        # a crash while the state is written leaves the previous one
+        temporary = self.state_filename + '.tmp'
+        with open(temporary, 'w') as state_file:
+            json.dump(state, state_file)
+            state_file.flush()
+            os.fsync(state_file.fileno())
+        os.replace(temporary, self.state_filename)
+        self._unsaved = 0
+
+    def _truncate(self, size: int):
+        with open(self.filename, 'wb') as target:
+            target.truncate(size)
+
+    def _check_maxsize(self, size: int):
+        if self.maxsize and size > self.maxsize:
+            raise SegmentedDownloadError(f'{self.request.url} is {size} bytes, larger than download_maxsize {self.maxsize}')
+
+    @staticmethod
+    def _header(response, name: bytes) -> Optional[str]:
+        values = response.headers.getRawHeaders(name)
+        return to_unicode(values[0]) if values else None
@@ -0,0 +1,250 @@
+from os.path import isfile
+from time import monotonic
+from typing import Callable, List, Optional
+
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import HtmlResponse
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.support.ui import WebDriverWait
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, DeferredList, DeferredQueue
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+# records the time of the latest DOM mutation and returns the milliseconds since then
+DOM_QUIET_SCRIPT = """
+if (!window.__firmwareMutations) {
+    window.__firmwareMutations = {last: performance.now()};
+    new MutationObserver(function () { window.__firmwareMutations.last = performance.now(); })
+        .observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+}
+return performance.now() - window.__firmwareMutations.last;
+"""
+RESOURCE_COUNT_SCRIPT = "return performance.getEntriesByType('resource').length;"
+READY_STATE_SCRIPT = 'return document.readyState;'
+
+READINESS_STRATEGIES = ('xpath', 'network_idle', 'dom_quiet', 'load')
+
+
+class SeleniumBrowser:
+    # One WebDriver instance. Everything in here blocks and is only ever called from a SeleniumPool worker thread.
+
+    POLL_FREQUENCY = 0.1
+
+    def __init__(self, driver, timeout: float = 15, default_wait=None, wait_timeout: float = 10):
+        self.driver = driver
+        self.wait = WebDriverWait(self.driver, timeout)
+        self.default_wait = default_wait or {'dom_quiet': 0.5}
+        self.wait_timeout = wait_timeout
+
+    @classmethod
+    def launch(cls, driver_executable_path: str, **kwargs) -> 'SeleniumBrowser':
+        if not driver_executable_path or not isfile(driver_executable_path):
+            raise NotConfigured(f'Selenium driver path not set correctly: {driver_executable_path}')
+
+        if 'geckodriver' in driver_executable_path:
+            options = webdriver.FirefoxOptions()
+            driver_cls = webdriver.Firefox
+        else:
+            options = webdriver.ChromeOptions()
+            driver_cls = webdriver.Chrome
+
+        options.headless = True
+        return cls(driver_cls(options=options, executable_path=driver_executable_path), **kwargs)
+
+    def render(self, request) -> HtmlResponse:
+        started = monotonic()
+        self.driver.get(request.url)
+
+        if 'hp' in request.meta:
+            body = self.hp_processor()
+        else:
+            loaded = monotonic()
+            request.meta['selenium_ready'] = self.wait_until_ready(request.meta.get('selenium_wait', self.default_wait))
+            request.meta['selenium_ready_time'] = monotonic() - loaded
+            body = str.encode(self.driver.page_source)
+
+        request.meta['selenium_render_time'] = monotonic() - started
+        return HtmlResponse(self.driver.current_url, body=body, encoding='utf-8', request=request)
+
+    def wait_until_ready(self, wait) -> bool:
+        # meta['selenium_wait'] is a strategy name or a dict like {'xpath': '//table', 'timeout': 5}:
+        #   xpath: an element matching the XPath is present
+        #   network_idle: no further resources finished loading for the given seconds
+        #   dom_quiet: the DOM did not change for the given seconds
+        #   load: document.readyState is complete
+        if isinstance(wait, str):
+            wait = {wait: None}
+        timeout = wait.get('timeout', self.wait_timeout)
+        strategy = next((name for name in READINESS_STRATEGIES if name in wait), None)
+        if strategy is None:
+            raise ValueError(f'Unknown selenium_wait {wait}')
+
+        condition = getattr(self, f'_{strategy}_condition')(wait[strategy])
+        try:
+            WebDriverWait(self.driver, timeout, poll_frequency=self.POLL_FREQUENCY).until(condition)
+        except TimeoutException:
+            return False
+        return True
+
+    @staticmethod
+    def _xpath_condition(xpath: str):
+        return expected_conditions.presence_of_element_located((By.XPATH, xpath))
+
+    @staticmethod
+    def _load_condition(_):
+        return lambda driver: driver.execute_script(READY_STATE_SCRIPT) == 'complete'
+
+    @staticmethod
+    def _network_idle_condition(idle: Optional[float]):
+        # resource timing entries only show finished requests, a stable count is the closest we get to an idle network
+        idle = 0.5 if idle is None else idle
+        last = {'count': -1, 'since': monotonic()}
+
+        def condition(driver):
+            count = driver.execute_script(RESOURCE_COUNT_SCRIPT)
+            if count != last['count']:
+                last['count'], last['since'] = count, monotonic()
+                return False
+            return monotonic() - last['since'] >= idle and driver.execute_script(READY_STATE_SCRIPT) == 'complete'
+
+        return condition
+
+    @staticmethod
+    def _dom_quiet_condition(quiet: Optional[float]):
+        quiet = 0.5 if quiet is None else quiet
+        return lambda driver: driver.execute_script(DOM_QUIET_SCRIPT) >= quiet * 1000 and driver.execute_script(READY_STATE_SCRIPT) == 'complete'
+
+    def quit(self):
+        self.driver.quit()
+
+    def hp_processor(self):
+        self.driver.fullscreen_window()
+        self.handle_404()
+        self.choose_country()
+        self.choose_os()
+        self.choose_version()
+        self.update_os_version()
+
+        return str.encode(self.driver.page_source)
+
+    def handle_404(self):
+        if 'Oops!' in self.driver.find_element_by_xpath('//h1').text or 'Error 404' in self.driver.page_source:
+            print(self.driver.current_url, ': 404 Page Not Found - no firmware to find here')
+            raise IgnoreRequest
+
+    def choose_country(self):
+        element = self.wait.until(expected_conditions.element_to_be_clickable((By.LINK_TEXT, 'Australia')))
+        element.click()
+        try:
+            self.wait.until(expected_conditions.invisibility_of_element_located(element))
+        except TimeoutException:
+            element.click()
+            pass
+
+    def choose_os(self):
+        if self.wait.until(expected_conditions.element_to_be_clickable((By.ID, 'SelectDiffOS'))):
+            self.driver.find_element_by_id('SelectDiffOS').click()
+            self.wait.until(expected_conditions.element_to_be_clickable((By.ID, 'platform_dd_headerLink'))).click()
+
+            for element in self.driver.find_elements_by_xpath('//ul[@id="platform_dd_list"]/li'):
+                if element.text == 'OS Independent':
+                    element.click()
+                    break
+
+    def choose_version(self):
+        self.driver.find_element_by_id('versionnew_dd_headerValue').click()
+        for element in self.driver.find_elements_by_xpath(
+                '//ul[@id="versionnew_dd_list" and @class="dropdown-menu"]/li'):
+            if element.text == 'OS Independent':
+                element.click()
+                break
+
+    def update_os_version(self):
+        element = self.driver.find_element_by_id('os-update')
+        element.click()
+        if self.wait.until(expected_conditions.invisibility_of_element_located(element)):
+            pass
+
+
+class SeleniumPool:
+    # Renders requests on up to `size` browsers, each driven from its own worker thread, so that the reactor keeps
+    # serving other downloads while pages load. Browsers and their threads are only started once a request waits for
+    # one and no idle browser is left, so crawls that never render do not start any. close() lets the renders that
+    # are under way finish before the browsers are quit.
+
+    def __init__(self, launch: Callable[[], SeleniumBrowser], size: int = 2, reactor_=None):
+        self.launch = launch
+        self.size = max(1, size)
+        self.browsers: List[SeleniumBrowser] = []
+        self._reactor = reactor_ or reactor
+        self._idle = DeferredQueue()
+        self._launching = 0
+        self._busy = set()
+        self._closed = False
+        self._threadpool = ThreadPool(minthreads=0, maxthreads=self.size, name='selenium')
+
+    def render(self, request) -> Deferred:
+        if self._closed:
+            raise IgnoreRequest(f'Selenium pool closed before rendering {request.url}')
+        if not self._idle.pending and len(self.browsers) + self._launching < self.size:
+            self._launch()
+        dfd = self._idle.get()
+        return dfd.addCallback(self._render, request)
+
+    def close(self) -> Deferred:
+        self._closed = True
+        # requests still waiting for a browser will not get one
+        while self._idle.waiting:
+            self._idle.waiting.pop(0).errback(IgnoreRequest('Selenium pool closed'))
+        dfd = DeferredList(list(self._busy))
+        return dfd.addBoth(self._shutdown)
+
+    def _shutdown(self, _):
+        browsers, self.browsers = self.browsers, []
+        if not self._threadpool.started:
+            return None
+        quits = [deferToThreadPool(self._reactor, self._threadpool, browser.quit) for browser in browsers]
+        return DeferredList(quits, consumeErrors=True).addBoth(lambda _: self._threadpool.stop())
+
+    def _launch(self):
+        if not self._threadpool.started:
+            self._threadpool.start()
+        self._launching += 1
+        dfd = self._track(deferToThreadPool(self._reactor, self._threadpool, self.launch))
+        dfd.addCallbacks(self._launched, self._launch_failed)
+
+    def _launched(self, browser: SeleniumBrowser):
+        self._launching -= 1
+        self.browsers.append(browser)
+        if not self._closed:
+            self._idle.put(browser)
+
+    def _launch_failed(self, failure):
+        self._launching -= 1
+        if not self.browsers and not self._launching:
+            # nothing will ever become idle, fail the waiting requests instead of leaving them hanging
+            while self._idle.waiting:
+                self._idle.waiting.pop(0).errback(failure)
+
+    def _render(self, browser: SeleniumBrowser, request) -> Deferred:
+        dfd = self._track(deferToThreadPool(self._reactor, self._threadpool, browser.render, request))
+        return dfd.addBoth(self._release, browser)
+
+    def _release(self, result, browser: SeleniumBrowser):
+        # after close() the browser is quit together with the others
+        if not self._closed:
+            self._idle.put(browser)
+        return result
+
+    def _track(self, dfd: Deferred) -> Deferred:
+        self._busy.add(dfd)
+
+        def done(result):
+            self._busy.discard(dfd)
+            return result
+
+        return dfd.addBoth(done)
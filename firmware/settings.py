@@ -7,6 +7,11 @@ NEWSPIDER_MODULE = 'firmware.spiders'
 
 FILES_STORE = 'firmware_files/'
 
+# Store every distinct file once under FILES_STORE/objects/ by its sha256 and keep a name -> hash index in
+# FILES_STORE/index.db. With FILES_STORE_HARDLINKS the indexed names are also hard links to the objects
+FILES_STORE_CONTENT_ADDRESSED = False
+FILES_STORE_HARDLINKS = False
+
 # Obey robots.txt rules
 ROBOTSTXT_OBEY = True
 
@@ -17,20 +22,154 @@ LOG_LEVEL = 'DEBUG'
 FTP_USER = 'anonymous'
 FTP_PASSWORD = 'guest'
 
+# Logged-in FTP control connections are kept per host and reused across requests
+FTP_POOL_SIZE = 2
+FTP_POOL_IDLE_TIMEOUT = 60
+FTP_POOL_HEALTH_CHECK = True
+
+# FTP directory listings are kept on disk and reused while the directory's entry in its parent listing is unchanged.
+# Entries older than FTP_LISTING_CACHE_MAX_AGE seconds are listed again (0 keeps them forever)
+FTP_LISTING_CACHE_ENABLED = True
+FTP_LISTING_CACHE_DIR = 'ftplistingcache'
+FTP_LISTING_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+# FTP files collected by the FirmwarePipeline are written to FILES_STORE while they arrive instead of being buffered
+FTP_STREAM_DOWNLOADS = True
+
+# Digests of every downloaded file, recorded as 'digests' in the item's files. They are computed while the bytes arrive,
+# md5 (the files' checksum) and sha256 always. Other hashlib algorithms can be added, e.g. 'sha1' to look files up in
+# databases that index them by SHA-1 (NSRL, VirusTotal). Fuzzy digests ('tlsh' needs py-tlsh, 'ssdeep' needs ssdeep)
+# are computed by FILES_FUZZY_DIGEST_WORKERS processes. Bytes that could not be hashed while they arrived (all but the
+# first segment of segmented downloads, resumed downloads) are read back by FILES_CATCH_UP_THREADS threads
+FILES_DIGESTS = ['md5', 'sha256']
+FILES_FUZZY_DIGESTS = []
+FILES_FUZZY_DIGEST_WORKERS = 2
+FILES_CATCH_UP_THREADS = 2
+
+# Spiders with segmented_downloads = True fetch their files with parallel HTTP Range requests. Progress is kept
+# in FILES_STORE/.incomplete/ so that interrupted downloads resume
+SEGMENTED_DOWNLOADS_ENABLED = True
+SEGMENTED_DOWNLOAD_SEGMENTS = 4
+SEGMENTED_DOWNLOAD_MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+SEGMENTED_DOWNLOAD_RETRIES = 3
+SEGMENTED_DOWNLOAD_CHECKPOINT = 16 * 1024 * 1024
+
 DOWNLOAD_HANDLERS = {
-    'ftp': 'firmware.handlers.FTPHandler'
+    'ftp': 'firmware.handlers.FTPHandler',
+    'http': 'firmware.handlers.SegmentedHTTPHandler',
+    'https': 'firmware.handlers.SegmentedHTTPHandler',
+}
+
+# closest to the spider, so that the output of the coalesced callbacks passes all other spider middlewares
+SPIDER_MIDDLEWARES = {
+    'firmware.middlewares.RequestCoalescingMiddleware': 950,
+}
+
+# Spiders can declare per-host downloader slots in `domain_slots`. Adaptive slots grow their concurrency while
+# responses stay below DOMAIN_SLOTS_TARGET_LATENCY seconds and back off on slow responses and the codes below
+EXTENSIONS = {
+    'firmware.extensions.DomainSlots': 500,
 }
+DOMAIN_SLOTS_ENABLED = True
+DOMAIN_SLOTS_BACKOFF_HTTP_CODES = [429, 503]
+DOMAIN_SLOTS_TARGET_LATENCY = 2.0
+DOMAIN_SLOTS_MAX_DELAY = 60.0
 
 DOWNLOADER_MIDDLEWARES = {
+    'firmware.middlewares.ArchiveMiddleware': 540,
     'firmware.middlewares.FirmwareDownloaderMiddleware': 543,
+    'firmware.middlewares.SharedPolitenessMiddleware': 950,
 }
 
+# Discovery pages are kept in HTTPCACHE_DIR/<spider>.db with compressed bodies. Pages with an ETag or Last-Modified header
+# are revalidated with a conditional request once they are older than HTTPCACHE_REVALIDATE_AFTER seconds, unchanged pages
+# then cost a 304 instead of their body. Pages without validators are reused for HTTPCACHE_UNVALIDATED_TTL seconds. The
+# least recently used pages are dropped once the cache holds more than HTTPCACHE_MAX_SIZE bytes. Firmware files are
+# never cached and recorded crawls (ARCHIVE_MODE = 'record') bypass the cache
+HTTPCACHE_ENABLED = True
+HTTPCACHE_POLICY = 'firmware.http_cache.ConditionalPolicy'
+HTTPCACHE_STORAGE = 'firmware.http_cache.SQLiteCacheStorage'
+HTTPCACHE_DIR = 'httpcache'
+HTTPCACHE_IGNORE_SCHEMES = ['file', 'ftp', 's3']
+HTTPCACHE_REVALIDATE_AFTER = 0
+HTTPCACHE_UNVALIDATED_TTL = 12 * 60 * 60
+HTTPCACHE_MAX_SIZE = 512 * 1024 * 1024
+HTTPCACHE_MAX_BODY_SIZE = 16 * 1024 * 1024
+
+# ARCHIVE_MODE = 'record' keeps all responses of a crawl (HTTP, FTP, rendered pages) in the ARCHIVE_PATH database,
+# .scrapy/archive/<spider>.db by default. 'replay' crawls that archive again at full speed and without network access,
+# e.g. to compare the throughput of spider, middleware and pipeline changes on identical input. Bodies larger than
+# ARCHIVE_MAX_BODY_SIZE bytes and files written to disk during the download (streamed FTP files, segmented downloads)
+# are not archived, replayed crawls do not download them
+ARCHIVE_MODE = ''
+ARCHIVE_PATH = ''
+ARCHIVE_MAX_BODY_SIZE = 32 * 1024 * 1024
+
+# With FRONTIER_URL several `scrapy crawl` workers share one request queue, seen set and per-slot download delays:
+# sqlite:///path/to/frontier.db for workers on one machine (not on a network filesystem), redis://host:6379/0 for
+# workers on several machines. Idle workers wait FRONTIER_IDLE_TIMEOUT seconds for new requests from the others before
+# they finish. Without FRONTIER_URL the scheduler and dupefilter below behave exactly like Scrapy's defaults
+SCHEDULER = 'firmware.scheduler.SharedScheduler'
+DUPEFILTER_CLASS = 'firmware.scheduler.SharedDupeFilter'
+FRONTIER_URL = ''
+FRONTIER_IDLE_TIMEOUT = 30
+
+# Two-phase crawls: with MANIFEST_ONLY the spiders only record their items in the FIRMWARE_MANIFEST database and
+# download nothing. `scrapy crawl manifest_download` then fetches the pending files with its own settings and records
+# the results. Files that failed MANIFEST_MAX_ATTEMPTS times are no longer tried, 0 keeps retrying them
+MANIFEST_ONLY = False
+FIRMWARE_MANIFEST = ''
+MANIFEST_MAX_ATTEMPTS = 3
+
+# With ARCHIVE_CONTENTS_INDEX the members (path, size, mode, sha256) of every downloaded tar, compressed tar and zip file
+# are recorded in that SQLite database. ARCHIVE_CONTENTS_WORKERS processes stream through the archives without extracting
+# them, while the crawl goes on
+ARCHIVE_CONTENTS_INDEX = ''
+ARCHIVE_CONTENTS_WORKERS = 2
+
+# With CATALOG_DIR every item is appended as a JSON line to <CATALOG_DIR>/<spider>-<time>-<n>.jsonl ('.jsonl.gz' with
+# CATALOG_COMPRESSION = 'gzip'), which can be read while the crawl runs. Items are written in batches of
+# CATALOG_BATCH_SIZE or every CATALOG_FLUSH_INTERVAL seconds. A new file is started after CATALOG_ROTATE_BYTES bytes or
+# CATALOG_ROTATE_SECONDS seconds (0 for never). With CATALOG_PREFIX the spiders of one process share a single series
+# <CATALOG_DIR>/<prefix>-<time>-<n>.jsonl. `python -m firmware.catalog` compacts catalogs into Parquet/Arrow files
+CATALOG_DIR = ''
+CATALOG_PREFIX = ''
+CATALOG_COMPRESSION = ''
+CATALOG_BATCH_SIZE = 500
+CATALOG_FLUSH_INTERVAL = 10
+CATALOG_ROTATE_BYTES = 256 * 1024 * 1024
+CATALOG_ROTATE_SECONDS = 0
+
+# With CATALOG_DATABASE every file URL the spiders find is upserted into that SQLite database, together with the item's
+# metadata and download results, in batches of CATALOG_DATABASE_BATCH_SIZE rows or every CATALOG_DATABASE_FLUSH_INTERVAL
+# seconds. `python -m firmware.catalog_db` queries it
+CATALOG_DATABASE = ''
+CATALOG_DATABASE_BATCH_SIZE = 1000
+CATALOG_DATABASE_FLUSH_INTERVAL = 10
+
 ITEM_PIPELINES = {
+    'firmware.pipelines.ManifestPipeline': 0,
     'firmware.pipelines.HpPipeline': 300,
     'firmware.pipelines.AsusPipeline': 300,
     'firmware.pipelines.AvmPipeline': 1,
     'firmware.pipelines.LinksysPipeline': 1,
+    'firmware.pipelines.ArchiveContentsPipeline': 800,
+    'firmware.pipelines.CatalogPipeline': 900,
+    'firmware.pipelines.CatalogDatabasePipeline': 910,
 }
 
 # Enable to run with Selenium. Set to the driver executable path
 SELENIUM_DRIVER_EXECUTABLE_PATH = '/usr/local/bin/geckodriver'
+# Number of browsers rendering requests with meta['selenium'] in parallel, each driven from its own thread
+SELENIUM_POOL_SIZE = 2
+# How rendered pages are considered ready unless the request sets meta['selenium_wait']: 'load', 'dom_quiet',
+# 'network_idle' or a dict such as {'xpath': '//table', 'timeout': 5}. Pages that do not get ready are used as they are
+SELENIUM_WAIT = {'dom_quiet': 0.5}
+SELENIUM_WAIT_TIMEOUT = 10
+
+# Rendered pages are kept on disk and reused by later crawls for SELENIUM_CACHE_TTL seconds. The least recently used
+# pages are dropped once the cache holds more than SELENIUM_CACHE_MAX_SIZE compressed bytes
+SELENIUM_CACHE_ENABLED = True
+SELENIUM_CACHE_DIR = 'seleniumcache'
+SELENIUM_CACHE_TTL = 12 * 60 * 60
+SELENIUM_CACHE_MAX_SIZE = 256 * 1024 * 1024
@@ -1,12 +1,12 @@
 import os
 import re
-from json import loads
-from typing import Generator, Union
+from typing import Dict, Generator, List, Optional, Union
 
 from scrapy import Request
 from scrapy.http import Response
 
 from firmware.custom_requests import FTPFileRequest, FTPListRequest
+from firmware.custom_responses import FTPEntry
 from firmware.custom_spiders import FTPSpider
 from firmware.items import FirmwareItem
 
@@ -30,6 +30,13 @@ class AVM(FTPSpider):
 
     filter_eol_products = True
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # product page path -> still supported (None if that could not be checked), filled once per product and crawl
+        self.product_support: Dict[str, Optional[bool]] = {}
+        # product page path -> items waiting for the answer of the single request in flight
+        self.pending_support: Dict[str, List[dict]] = {}
+
     meta_regex = {
         'device_name': re.compile(r'^Produkt\s*:\s+(.*)$', flags=re.MULTILINE | re.IGNORECASE),
         'firmware_version': re.compile(r'^Version\s*:\s+(.*)$', flags=re.MULTILINE | re.IGNORECASE),
@@ -37,7 +44,7 @@ class AVM(FTPSpider):
     }
 
     def parse(self, response: Response, **kwargs):  # pylint: disable=unused-argument
-        folder = loads(response.body)
+        folder = self.listing_entries(response)
 
         yield from self.recurse_sub_folders(folder, base_url=response.url)
         yield from self.search_firmware_images(folder, base_url=response.url)
@@ -55,51 +62,91 @@ class AVM(FTPSpider):
         }
 
         if self.filter_eol_products:
-            product_path = image_path.split('/')[-4]
-            product_line = image_path.split('/')[-5]
-            yield Request(f'https://avm.de/produkte/{product_line}/{product_path}', callback=self.verify_support, cb_kwargs={'meta_data': meta_data})
+            yield from self.check_support(self.product_page(image_path), meta_data)
         else:
             yield from self.item_pipeline(meta_data)
 
-    def search_firmware_images(self, folder: list, base_url: str) -> Generator[FTPFileRequest, None, None]:
+    def check_support(self, product_page: str, meta_data: dict) -> Generator[Union[Request, FirmwareItem], None, None]:
+        if product_page in self.product_support:
+            if self.product_support[product_page] is not False:
+                yield from self.item_pipeline(meta_data)
+            return
+
+        if product_page in self.pending_support:
+            self.pending_support[product_page].append(meta_data)
+            return
+
+        self.pending_support[product_page] = [meta_data]
+        yield Request(product_page, callback=self.verify_support, errback=self.support_unknown, cb_kwargs={'product_page': product_page})
+
+    def search_firmware_images(self, folder: List[FTPEntry], base_url: str) -> Generator[FTPFileRequest, None, None]:
         for image in self._image_file_filter(folder):
-            image_path = os.path.join(base_url, image['filename'])
+            image_path = os.path.join(base_url, image.filename)
             info_path = os.path.join(base_url, 'info_de.txt')
             yield FTPFileRequest(info_path, callback=self.parse_metadata_and_download_image, cb_kwargs={'image_path': image_path})
 
-    def verify_support(self, response: Response, meta_data: dict, **kwargs):  # pylint: disable=unused-argument
-        if response.status == 200:
+    def verify_support(self, response: Response, product_page: str, **kwargs):  # pylint: disable=unused-argument
+        supported = response.status == 200
+        self.product_support[product_page] = supported
+        for meta_data in self.pending_support.pop(product_page, []):
+            if supported:
+                yield from self.item_pipeline(meta_data)
+
+    def support_unknown(self, failure):
+        # the RetryMiddleware already tried again. The product is memoised as unknown and its images are kept, the
+        # end-of-life filter must not lose the firmware of products that may well be supported
+        product_page = failure.request.cb_kwargs['product_page']
+        self.product_support[product_page] = None
+        waiting = self.pending_support.pop(product_page, [])
+        self.logger.warning('Could not check support of %s, keeping its images (%d so far): %s', product_page, len(waiting), failure.value)
+        for meta_data in waiting:
             yield from self.item_pipeline(meta_data)
 
+    def closed(self, reason):
+        # support checks that never came back, e.g. after the crawl was stopped
+        for product_page, waiting in self.pending_support.items():
+            self.logger.warning('Support check of %s did not finish (%s), %d images were not scraped', product_page, reason, len(waiting))
+        self.pending_support.clear()
+
     @staticmethod
-    def _folder_filter(entries):
+    def _folder_filter(entries: List[FTPEntry]):
         for entry in entries:
-            if any([entry['filetype'] != 'd',
-                    entry['filename'] in ['..', 'archive', 'beta', 'other', 'recover', 'belgium', 'tools', 'switzerland'],
-                    entry['linktarget'] is not None]):
+            if any([not entry.is_dir,
+                    entry.filename in ['..', 'archive', 'beta', 'other', 'recover', 'belgium', 'tools', 'switzerland'],
+                    entry.linktarget is not None]):
                 continue
             yield entry
 
     @staticmethod
-    def _image_file_filter(entries: list):
+    def _image_file_filter(entries: List[FTPEntry]):
         for entry in entries:
-            if any([entry['filetype'] != '-',
-                    not entry['filename'].endswith(('.image', '.zip')),
-                    entry['linktarget'] is not None]):
+            if any([not entry.is_file,
+                    not entry.filename.endswith(('.image', '.zip')),
+                    entry.linktarget is not None]):
                 continue
             yield entry
 
     @classmethod
-    def recurse_sub_folders(cls, folder: list, base_url: str):
+    def recurse_sub_folders(cls, folder: List[FTPEntry], base_url: str):
         for sub_folder in cls._folder_filter(folder):
-            name = sub_folder['filename']
+            name = sub_folder.filename
             recursive_path = f'{os.path.join(base_url, name)}/'
             yield FTPListRequest(recursive_path)
 
     @staticmethod
-    def map_device_class(image_path: str) -> str:
+    def product_page(image_path: str) -> str:
+        # /<product_line>/<product_path>/<locale>/fritz.os/<image>
+        product_path = image_path.split('/')[-4]
+        product_line = image_path.split('/')[-5]
+        return f'https://avm.de/produkte/{product_line}/{product_path}'
+
+    @classmethod
+    def map_device_class(cls, image_path: str) -> str:
         # /fritzbox/<PRODUCT_PARENT>/<locale>/fritz.os/<image>
-        product_parent = image_path.split('/')[-4]
+        return cls.map_product_device_class(image_path.split('/')[-4])
+
+    @staticmethod
+    def map_product_device_class(product_parent: str) -> str:
         if product_parent.startswith(('fritzrepeater', 'fritzwlan-repeater')):
             return 'Repeater'
         if product_parent.startswith('fritzwlan-usb'):
@@ -4,8 +4,8 @@ from typing import Generator, List, Tuple
 
 from scrapy import Request, Spider
 from scrapy.http import Response
-from scrapy.loader import ItemLoader
 
+from firmware.extraction import compile_xpaths
 from firmware.items import FirmwareItem
 from firmware.spiders.avm import AVM
 
@@ -25,11 +25,12 @@ class AVMGPL(Spider):
     ]
 
     download_maxsize = 2147483648  # 2GiB
+    segmented_downloads = True
 
-    XPATH = {
+    XPATH = compile_xpaths({
         'links': '//a[not(contains(@href, ".."))]/@href',
         'meta': '//a[not(contains(@href, ".."))]/following-sibling::text()',
-    }
+    })
 
     def parse(self, response: Response, **kwargs: {}) -> Generator[Request, None, None]:
         links = AVMGPL.extract_links(response)
@@ -50,14 +51,7 @@ class AVMGPL(Spider):
 
     @staticmethod
     def prepare_item_pipeline(meta_data: dict) -> Generator[FirmwareItem, None, None]:
-        loader = ItemLoader(item=FirmwareItem(), selector=meta_data['file_urls'])
-        loader.add_value('file_urls', meta_data['file_urls'])
-        loader.add_value('vendor', meta_data['vendor'])
-        loader.add_value('device_name', meta_data['device_name'])
-        loader.add_value('device_class', meta_data['device_class'])
-        loader.add_value('firmware_version', meta_data['firmware_version'])
-        loader.add_value('release_date', meta_data['release_date'])
-        yield loader.load_item()
+        yield FirmwareItem.from_meta_data(meta_data)
 
     @staticmethod
     def prepare_meta_data(archive: Tuple[str, Tuple[str, int, bool]]) -> dict:
@@ -70,7 +64,8 @@ class AVMGPL(Spider):
             'vendor': 'AVM',
             'device_name': device_name,
             'firmware_version': '0.0' if firmware_version is None else firmware_version.group(1),
-            'device_class': AVM.map_device_class(device_name),
+            # /<product_line>/<product>/<archive>
+            'device_class': AVM.map_product_device_class(file_url.split('/')[-2]),
             'release_date': archive[1][0],
         }
 
@@ -85,12 +80,12 @@ class AVMGPL(Spider):
 
     @staticmethod
     def extract_links(response: Response) -> List[str]:
-        return [response.urljoin(p) for p in response.xpath(AVMGPL.XPATH['links']).extract()]
+        return [response.urljoin(p) for p in AVMGPL.XPATH['links'].extract(response)]
 
     @staticmethod
     def extract_link_info(response: Response) -> List[Tuple[str, int, bool]]:
         infos = list()
-        for meta in response.xpath(AVMGPL.XPATH['meta']).extract():
+        for meta in AVMGPL.XPATH['meta'].extract(response):
             clean = sub(r' +', ' ', meta.strip())
 
             the_date, _, the_size = clean.split(' ')
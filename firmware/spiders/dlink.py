@@ -5,6 +5,7 @@ from scrapy import Request
 from scrapy.http import Response
 
 from firmware.custom_spiders import FirmwareSpider
+from firmware.extraction import compile_xpaths
 from firmware.items import FirmwareItem
 
 
@@ -31,15 +32,18 @@ class DLink(FirmwareSpider):
         'REFERER_ENABLED': True,
     }
 
-    xpath = {
-        'product_names_in_category': '//div[@class="product-item__number"]/text()',
-        'detail_pages_in_category': '//div[@class="product-item__number"]/parent::a/@href',
-        'detail_latest_revision_name': '//select[@id="supportRevision"]/option[last()]/text()',
-        'detail_latest_revision_param': '//select[@id="supportRevision"]/option[last()]/@value',
-        'version': '//div[@id="firmware"]//td[@data-table-header="Version"]/text()',
-        'date': '//div[@id="firmware"]//td[@data-table-header="Datum"]/text()',
-        'download_link': '//div[@id="firmware"]//td[@data-table-header=""]/a/@href',
-    }
+    xpath = compile_xpaths({
+        'products_in_category': '//div[@class="product-item__number"]',
+        'product_name': './text()',
+        'detail_page': './parent::a/@href',
+        'latest_revision': '//select[@id="supportRevision"]/option[last()]',
+        'revision_name': './text()',
+        'revision_param': './@value',
+        'firmware': '//div[@id="firmware"]',
+        'version': './/td[@data-table-header="Version"]/text()',
+        'date': './/td[@data-table-header="Datum"]/text()',
+        'download_link': './/td[@data-table-header=""]/a/@href',
+    })
 
     device_classes_dict = {
         'dba': 'Access Point', 'dap': 'Access Point',
@@ -61,27 +65,32 @@ class DLink(FirmwareSpider):
     }
 
     def parse(self, response: Response, **kwargs) -> Generator[Request, None, None]:  # pylint: disable=unused-argument
-        names = response.xpath(self.xpath['product_names_in_category']).extract()
-        detail_links = response.xpath(self.xpath['detail_pages_in_category']).extract()
-        for name, detail_link in zip(names, detail_links):
+        for product in self.xpath['products_in_category'].nodes(response):
+            name = self.xpath['product_name'].get(product)
+            detail_link = self.xpath['detail_page'].get(product)
+            if name is None or detail_link is None:
+                continue
             yield Request(url=response.urljoin(detail_link), callback=self.process_detail_page, cb_kwargs=dict(product_name=name))
 
     def process_detail_page(self, response: Response, product_name: str, product_revision: str = '') -> Generator[Union[Request, FirmwareItem], None, None]:
         if product_revision == '':
-            latest_revision_on_page = response.xpath(self.xpath['detail_latest_revision_name']).extract()
-            latest_revision_query_param = response.xpath(self.xpath['detail_latest_revision_param']).extract()
-
-            if len(latest_revision_on_page + latest_revision_query_param) > 0:
+            latest_revision = self.xpath['latest_revision'].nodes(response)
+            if latest_revision:
                 yield Request(
-                    url=response.urljoin(f'?revision={latest_revision_query_param[0]}'),
+                    url=response.urljoin(f'?revision={self.xpath["revision_param"].get(latest_revision[0])}'),
                     callback=self.process_detail_page,
-                    cb_kwargs=dict(product_name=product_name, product_revision=latest_revision_on_page[0])
+                    cb_kwargs=dict(product_name=product_name, product_revision=self.xpath['revision_name'].get(latest_revision[0]))
                 )
                 return
 
-        version = response.xpath(self.xpath['version']).extract()
-        release_date = response.xpath(self.xpath['date']).extract()
-        download_link = response.xpath(self.xpath['download_link']).extract()
+        # one scan for the firmware table, the cells are searched within it
+        firmware = self.xpath['firmware'].nodes(response)
+        if not firmware:
+            return
+
+        version = self.xpath['version'].extract(firmware[0])
+        release_date = self.xpath['date'].extract(firmware[0])
+        download_link = self.xpath['download_link'].extract(firmware[0])
 
         if len(download_link + release_date + version) != 3:
             yield from []
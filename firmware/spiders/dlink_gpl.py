@@ -2,10 +2,11 @@ import re
 from datetime import datetime
 from typing import Generator, List, Tuple, Union
 
-from scrapy import FormRequest, Request, Selector, Spider
+from lxml.html import HtmlElement
+from scrapy import FormRequest, Request, Spider
 from scrapy.http import Response
-from scrapy.loader import ItemLoader
 
+from firmware.extraction import compile_xpaths
 from firmware.items import FirmwareItem
 
 
@@ -27,8 +28,14 @@ class DLinkGPL(Spider):
     whitelist = ['COVR-1100']
 
     download_maxsize = 2147483648  # 2GiB
+    segmented_downloads = True
 
-    XPATH = {
+    domain_slots = {
+        'tsd.dlink.com.tw': {'concurrency': 1, 'delay': 0.75},
+        'dlink-gpl.s3.amazonaws.com': {'concurrency': 2, 'max_concurrency': 8, 'adaptive': True},
+    }
+
+    XPATH = compile_xpaths({
         'device_names': '//td[@class="pord_3"]//a/@title',
         'device_overview_rows': '//tr[contains(@onclick, "dwn(")]',
         'onclick': './@onclick',
@@ -37,7 +44,8 @@ class DLinkGPL(Spider):
         'download_link': './/a[contains(@href, "dlink-gpl.s3.amazonaws.com")]/@href',
         'current_page': '//input[@name="sel_PageNo"]/@value',
         'pagination': '//input[@name="sel_PageNo"]/parent::td/text()[position() = last()]',
-    }
+        'text': './/text()',
+    })
 
     IDENTIFIER_RE = re.compile(r'^dwn\(\'([A-Z]+)\',[\'\da-zA-Z]+\)$')
     VERSION_RE = re.compile(r'FW\sv(\d+\..+)')
@@ -104,11 +112,11 @@ class DLinkGPL(Spider):
     def construct_file_request(product: str, model: str, version: str, identifier: str) -> FormRequest:
         form_data = dict(Enter='OK', ModelCategory='0', ModelSno='0', ModelCategory_=product, ModelSno_=model, Model_Sno='', ModelVer='', docuSno=identifier, docuSource='1')
         cb_kwargs = dict(product=product, model=model, version=version)
-        yield FormRequest('https://tsd.dlink.com.tw/ddgo', callback=DLinkGPL.parse_gpl_download, cb_kwargs=cb_kwargs, formdata=form_data)
+        return FormRequest('https://tsd.dlink.com.tw/ddgo', callback=DLinkGPL.parse_gpl_download, cb_kwargs=cb_kwargs, formdata=form_data)
 
     @staticmethod
-    def extract_download_link(table_data: List[Selector]) -> str:
-        all_links = table_data[2].xpath(DLinkGPL.XPATH['download_link']).extract()
+    def extract_download_link(table_data: List[HtmlElement]) -> str:
+        all_links = DLinkGPL.XPATH['download_link'].extract(table_data[2])
         for link in all_links:
             if not link.endswith('.txt'):
                 return link
@@ -117,8 +125,8 @@ class DLinkGPL(Spider):
 
     @staticmethod
     def extract_pagination_next(response: Response) -> Union[str, None]:
-        current_page = int(response.xpath(DLinkGPL.XPATH['current_page']).extract()[0].strip())
-        pagination = response.xpath(DLinkGPL.XPATH['pagination']).extract()[0].strip()
+        current_page = int(DLinkGPL.XPATH['current_page'].extract(response)[0].strip())
+        pagination = DLinkGPL.XPATH['pagination'].extract(response)[0].strip()
 
         page_match = DLinkGPL.PAGINATION_RE.search(pagination)
 
@@ -136,46 +144,38 @@ class DLinkGPL(Spider):
         return str(current_page + 1)
 
     @staticmethod
-    def extract_date_from_table(table_data: List[Selector]) -> str:
-        return table_data[3].xpath('.//text()').extract()[0].strip()
+    def extract_date_from_table(table_data: List[HtmlElement]) -> str:
+        return DLinkGPL.XPATH['text'].extract(table_data[3])[0].strip()
 
     @staticmethod
-    def extract_table_data_from_download_page(response) -> List[Selector]:
-        return response.xpath(DLinkGPL.XPATH['download_td'])
+    def extract_table_data_from_download_page(response) -> List[HtmlElement]:
+        return DLinkGPL.XPATH['download_td'].nodes(response)
 
     @staticmethod
     def extract_devices(response: Response) -> Generator[Tuple[str, str], None, None]:
-        for device in response.xpath(DLinkGPL.XPATH['device_names']).extract():
+        for device in DLinkGPL.XPATH['device_names'].extract(response):
             product, model = device.split('-', 1)
             yield product, model
 
     @staticmethod
-    def extract_device_overview_rows(response: Response) -> Generator[Selector, None, None]:
-        for row in response.xpath(DLinkGPL.XPATH['device_overview_rows']):
-            yield row
+    def extract_device_overview_rows(response: Response) -> Generator[HtmlElement, None, None]:
+        yield from DLinkGPL.XPATH['device_overview_rows'].nodes(response)
 
     @staticmethod
     def prepare_item_pipeline(meta_data: dict) -> Generator[FirmwareItem, None, None]:
-        loader = ItemLoader(item=FirmwareItem(), selector=meta_data['file_urls'])
-        loader.add_value('file_urls', meta_data['file_urls'])
-        loader.add_value('vendor', meta_data['vendor'])
-        loader.add_value('device_name', meta_data['device_name'])
-        loader.add_value('device_class', meta_data['device_class'])
-        loader.add_value('firmware_version', meta_data['firmware_version'])
-        loader.add_value('release_date', meta_data['release_date'])
-        yield loader.load_item()
+        yield FirmwareItem.from_meta_data(meta_data)
 
     @staticmethod
-    def extract_version(row: Selector) -> str:
-        description = row.xpath(DLinkGPL.XPATH['version']).extract()[0].strip()
+    def extract_version(row: HtmlElement) -> str:
+        description = DLinkGPL.XPATH['version'].extract(row)[0].strip()
 
         version_match = DLinkGPL.VERSION_RE.search(description)
         version = version_match.group(1) if version_match is not None else '0.0'
         return version
 
     @staticmethod
-    def extract_firmware_identifier(row: Selector) -> str:
-        onclick = row.xpath(DLinkGPL.XPATH['onclick']).extract()[0]
+    def extract_firmware_identifier(row: HtmlElement) -> str:
+        onclick = DLinkGPL.XPATH['onclick'].extract(row)[0]
 
         identifier_match = DLinkGPL.IDENTIFIER_RE.search(onclick)
         if identifier_match is None:
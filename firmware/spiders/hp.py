@@ -3,13 +3,23 @@ from re import search
 
 from scrapy import Spider
 from scrapy.http import Request
-from scrapy.loader import ItemLoader
+
+from firmware.extraction import compile_xpaths
 from firmware.items import FirmwareItem
 
 
 class HewlettPackardSpider(Spider):
     name = 'hp'
 
+    XPATH = compile_xpaths({
+        'table_rows': '//div[@class="section expandable"]/div/div/div/table/tbody/tr',
+        'cells': 'td',
+        'cell_div': 'div',
+        'cell_text': 'div/text()',
+        'cell_link': 'div/a/@href',
+        'download_link': '//a[@class="button-sm primary hpdiaButton desktopHpdia"]/@href',
+    })
+
     def start_requests(self):
         urls = ['https://support.hp.com/za-en/document/c03933242']
         for url in urls:
@@ -17,47 +27,38 @@ class HewlettPackardSpider(Spider):
                           meta={'selenium': True, 'dont_redirect': True, 'handle_httpstatus_list': [302]})
 
     def parse(self, response):
-        for table_row in response.xpath('//div[@class="section expandable"]/div/div/div/table/tbody/tr'):
-            next_url = table_row.xpath('td')[4].xpath('div/a/@href').get()
+        for table_row in self.XPATH['table_rows'].nodes(response):
+            cells = self.XPATH['cells'].nodes(table_row)
+            next_url = self.XPATH['cell_link'].get(cells[4])
             if not next_url:
                 continue
             if 'http://' not in next_url:
                 next_url = 'http://' + next_url
 
-            meta_data = self.prepare_meta_data(table_row)
+            meta_data = self.prepare_meta_data(cells)
 
             yield Request(url=next_url, callback=self.parse_firmware, cb_kwargs=dict(meta_data=meta_data),
                           meta={'selenium': True, 'dont_redirect': True, 'handle_httpstatus_list': [302], 'hp': True})
 
     def parse_firmware(self, response, meta_data):
-        meta_data['file_urls'] = response.xpath(
-            '//a[@class="button-sm primary hpdiaButton desktopHpdia"]/@href').getall()
+        meta_data['file_urls'] = self.XPATH['download_link'].extract(response)
         return self.prepare_item_pipeline(response, meta_data)
 
     @staticmethod
-    def prepare_item_pipeline(response, meta_data):
-        loader = ItemLoader(item=FirmwareItem(), response=response, date_fmt=['%Y-%m-%d'])
-
-        loader.add_value('device_name', meta_data['device_name'])
-        loader.add_value('vendor', meta_data['vendor'])
-        loader.add_value('firmware_version', meta_data['firmware_version'])
-        loader.add_value('device_class', meta_data['device_class'])
-        loader.add_value('release_date', meta_data['release_date'])
-        loader.add_value("file_urls", meta_data['file_urls'])
+    def prepare_item_pipeline(response, meta_data):  # pylint: disable=unused-argument
+        return FirmwareItem.from_meta_data(meta_data)
 
-        return loader.load_item()
-
-    @staticmethod
-    def prepare_meta_data(table_row):
-        release_date = table_row.xpath('td')[3].xpath('div/text()').get()
+    @classmethod
+    def prepare_meta_data(cls, cells):
+        release_date = cls.XPATH['cell_text'].get(cells[3])
         if len(release_date) == 4:
             release_date = datetime.strptime(release_date, '%Y').date().isoformat()
         else:
             release_date = datetime.strptime(release_date, '%Y%m%d').date().isoformat()
-        device_name = table_row.xpath('td')[0].xpath('div').get()
+        device_name = cls.XPATH['cell_div'].get(cells[0])
         device_name = search(r'</a> ?(.*?)</div>', device_name).group(1)
 
         return {
             'vendor': 'HP', 'device_class': 'Printer', 'device_name': device_name,
             'release_date': release_date,
-            'firmware_version': table_row.xpath('td')[2].xpath('div/text()').get()}
+            'firmware_version': cls.XPATH['cell_text'].get(cells[2])}
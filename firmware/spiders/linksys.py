@@ -5,6 +5,7 @@ from scrapy import Request
 from scrapy.http import Response
 
 from firmware.custom_spiders import FirmwareSpider
+from firmware.extraction import compile_xpaths
 from firmware.items import FirmwareItem
 
 
@@ -53,22 +54,28 @@ class Linksys(FirmwareSpider):
     custom_settings = {
         # robots.txt is not an FTP concept
         'ROBOTSTXT_OBEY': False,
-        # being nice to AVM servers
+        # being nice to Linksys servers, also the fallback for every host without an entry in domain_slots
         'CONCURRENT_REQUESTS': 1,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 1,
         'CONCURRENT_ITEMS': 1,
         'DOWNLOAD_DELAY': 0.75,
         'RANDOMIZE_DOWNLOAD_DELAY': True,
         'REFERER_ENABLED': True
     }
 
-    xpath = {
+    domain_slots = {
+        'www.linksys.com': {'concurrency': 1, 'delay': 0.75},
+        'downloads.linksys.com': {'concurrency': 4, 'max_concurrency': 16, 'adaptive': True},
+    }
+
+    xpath = compile_xpaths({
         'product_urls_on_page': '//a[@class="thumb"]/@href',
         'get_download_page': '//*[contains(text(), "Firmware-Verbesserungen")]/following::p[1]/'
                              'a[contains(text(), "herunterladen")]/@href',
         'download_link': '//*[contains(text(), "Firmware")]//ancestor::*//a[contains(@href, "firmware")]/@href',
         'date_and_version': '//*[contains(text(), "Firmware")]//ancestor::*//*[contains(text(), "Ver. ") or contains(text(), "Version: ")]/text()',
         'product_name': '//*[@class="part-number"]/text()',
-    }
+    })
 
     start_urls = [
         'https://www.linksys.com/de/c/whole-home-mesh-wifi/?q=%3AsortByProductRank&page=0',
@@ -95,7 +102,7 @@ class Linksys(FirmwareSpider):
 
         page = kwargs['page']
 
-        for product_url in response.xpath(self.xpath['product_urls_on_page']).extract():
+        for product_url in self.xpath['product_urls_on_page'].extract(response):
             yield Request(url=response.urljoin(product_url), callback=self.move_to_support_page)
 
         # move to next page in product catalogue
@@ -111,7 +118,7 @@ class Linksys(FirmwareSpider):
 
     @classmethod
     def extract_date_and_version(cls, response: Response) -> Tuple[str, str]:
-        matches = response.xpath(cls.xpath['date_and_version']).extract()
+        matches = cls.xpath['date_and_version'].extract(response)
         if len(matches) < 2:
             return '', ''
 
@@ -120,11 +127,11 @@ class Linksys(FirmwareSpider):
         return firmware_version, release_date
 
     def move_to_download_page(self, response: Response) -> Optional[Request]:
-        download_page_matches = response.xpath(self.xpath['get_download_page']).extract()
+        download_page_matches = self.xpath['get_download_page'].extract(response)
         if len(download_page_matches) < 1:
             return None
 
-        product_name_matches = response.xpath(self.xpath['product_name']).extract()
+        product_name_matches = self.xpath['product_name'].extract(response)
         if len(product_name_matches) < 1:
             return None
 
@@ -133,7 +140,7 @@ class Linksys(FirmwareSpider):
                        cb_kwargs=dict(device_name=device_name), dont_filter=True)
 
     def parse_download_page(self, response: Response, device_name: str) -> Generator[FirmwareItem, None, None]:
-        download_matches = response.xpath(self.xpath['download_link']).extract()
+        download_matches = self.xpath['download_link'].extract(response)
         if len(download_matches) < 1:
             yield from []
             return
@@ -2,8 +2,8 @@ from typing import Generator, Tuple
 
 from scrapy import Request, Spider
 from scrapy.http import Response
-from scrapy.loader import ItemLoader
 
+from firmware.extraction import compile_xpaths
 from firmware.items import FirmwareItem
 
 
@@ -25,11 +25,14 @@ class LinksysGPL(Spider):
     whitelist = ['EA7500']
 
     download_maxsize = 2147483648  # 2GiB
+    segmented_downloads = True
 
-    XPATH = {
+    XPATH = compile_xpaths({
         'table_rows': '//table/thead/tr',
         'row_columns': './/td',
-    }
+        'text': './/text()',
+        'links': './/a/@href',
+    })
 
     def parse(self, response: Response, **kwargs: {}) -> Generator[Request, None, None]:
         firmware_extractor = LinksysGPL.extract_firmwares(response)
@@ -53,32 +56,25 @@ class LinksysGPL(Spider):
     @staticmethod
     def extract_firmwares(response: Response) -> Generator[Tuple[str, str, str], None, None]:
         device_names = []
-        table = response.xpath(LinksysGPL.XPATH['table_rows'])[1:]
+        table = LinksysGPL.XPATH['table_rows'].nodes(response)[1:]
         for row in table:
-            columns = row.xpath(LinksysGPL.XPATH['row_columns'])
+            columns = LinksysGPL.XPATH['row_columns'].nodes(row)
             if len(columns) not in [2, 3]:
                 continue
 
             offset = 0
             if len(columns) == 3:
-                device_names = columns[0].xpath('.//text()').extract()
+                device_names = LinksysGPL.XPATH['text'].extract(columns[0])
                 offset = 1
 
-            version = ''.join(columns[offset].xpath('.//text()').extract()).strip()
-            link = ''.join(columns[offset + 1].xpath('.//a/@href').extract()).strip()
+            version = ''.join(LinksysGPL.XPATH['text'].extract(columns[offset])).strip()
+            link = ''.join(LinksysGPL.XPATH['links'].extract(columns[offset + 1])).strip()
             for device in device_names:
                 yield device.strip(), version, link
 
     @staticmethod
     def prepare_item_pipeline(meta_data: dict) -> Generator[FirmwareItem, None, None]:
-        loader = ItemLoader(item=FirmwareItem(), selector=meta_data['file_urls'])
-        loader.add_value('file_urls', meta_data['file_urls'])
-        loader.add_value('vendor', meta_data['vendor'])
-        loader.add_value('device_name', meta_data['device_name'])
-        loader.add_value('device_class', meta_data['device_class'])
-        loader.add_value('firmware_version', meta_data['firmware_version'])
-        loader.add_value('release_date', meta_data['release_date'])
-        yield loader.load_item()
+        yield FirmwareItem.from_meta_data(meta_data)
 
     @staticmethod
     def prepare_meta_data(device_name: str, firmware_version: str, file_url: str) -> dict:
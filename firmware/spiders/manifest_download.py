@@ -0,0 +1,59 @@
+from dataclasses import fields
+from typing import Generator
+
+from scrapy import Spider, signals
+from scrapy.http import Response
+
+from firmware.items import FirmwareItem
+from firmware.manifest import DOWNLOADED, FAILED, Manifest
+
+FIELDS = {field.name for field in fields(FirmwareItem)}
+
+
+class ManifestDownload(Spider):
+    # Second phase of a two-phase crawl: downloads the pending files of FIRMWARE_MANIFEST. Concurrency, retries,
+    # timeouts etc. are the settings of this crawl, e.g.
+    #   scrapy crawl manifest_download -s FIRMWARE_MANIFEST=manifest.db -s CONCURRENT_REQUESTS=4 -a vendor_spider=avm
+    name = 'manifest_download'
+
+    start_urls = ['data:,']
+
+    download_maxsize = 2147483648  # 2GiB
+    segmented_downloads = True
+
+    custom_settings = {
+        'ROBOTSTXT_OBEY': False,
+        'ITEM_PIPELINES': {'firmware.pipelines.FirmwarePipeline': 1},
+    }
+
+    def __init__(self, *args, vendor_spider: str = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.vendor_spider = vendor_spider
+        self.manifest = None
+        self.max_attempts = 0
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.manifest = Manifest.from_settings(crawler.settings)
+        if spider.manifest is None:
+            raise ValueError('manifest_download needs FIRMWARE_MANIFEST to be set')
+        spider.max_attempts = crawler.settings.getint('MANIFEST_MAX_ATTEMPTS', 0)
+        crawler.signals.connect(spider.spider_closed, signal=signals.spider_closed)
+        return spider
+
+    def parse(self, response: Response, **kwargs) -> Generator[FirmwareItem, None, None]:  # pylint: disable=unused-argument
+        for file_urls, meta_data in self.manifest.pending(max_attempts=self.max_attempts, spider=self.vendor_spider):
+            yield FirmwareItem(**{key: value for key, value in meta_data.items() if key in FIELDS}, file_urls=file_urls)
+
+    def record_download(self, url: str, ok: bool, result):
+        if ok:
+            self.manifest.record(url, DOWNLOADED, path=result['path'], checksum=result['checksum'])
+            self.crawler.stats.inc_value('manifest/downloaded')
+        else:
+            self.manifest.record(url, FAILED, error=str(result.value))
+            self.crawler.stats.inc_value('manifest/failed')
+
+    def spider_closed(self):
+        self.crawler.stats.set_value('manifest/files', self.manifest.counts())
+        self.manifest.close()
@@ -6,6 +6,7 @@ from scrapy import Request
 from scrapy.http import Response
 
 from firmware.custom_spiders import FirmwareSpider
+from firmware.extraction import compile_xpaths
 from firmware.items import FirmwareItem
 
 
@@ -33,20 +34,21 @@ class Netgear(FirmwareSpider):
         'REFERER_ENABLED': False
     }
 
-    xpath = {
+    xpath = compile_xpaths({
         'get_product_text': '//p[@class="eyebrow-small"]/a/text()',
-        'get_kb_article': '//a/p[contains(text(), "Firmware")]/parent::a/following-sibling::a[contains(@href, "kb.netgear.com")]/@href',
-        'get_download_link': '//a/p[contains(text(), "Firmware")]/parent::a/@href',
-        'get_version': '//a/p[contains(text(), "Firmware")]/text()',
+        'get_firmware_link': '//a[p[contains(text(), "Firmware")]]',
+        'get_kb_article': './following-sibling::a[contains(@href, "kb.netgear.com")]/@href',
+        'get_download_link': './@href',
+        'get_version': './p[contains(text(), "Firmware")]/text()',
         'get_release_date': '//p[@class="last-updated"]/text()',
-    }
+    })
 
     regex = {
         'get_device_name': re.compile(r'\((\w+)\)$', flags=re.MULTILINE)
     }
 
     def parse(self, response: Response, **kwargs) -> Generator[Request, None, None]:
-        product_texts = response.xpath(self.xpath['get_product_text']).extract()
+        product_texts = self.xpath['get_product_text'].extract(response)
 
         for text in product_texts:
             device_name = self.regex['get_device_name'].findall(text)[0]
@@ -58,9 +60,15 @@ class Netgear(FirmwareSpider):
             )
 
     def consult_support_pages(self, response: Response, device_name: str) -> Generator[Request, None, None]:
-        kb_article_link = response.xpath(self.xpath['get_kb_article']).get()
-        download_link = response.xpath(self.xpath['get_download_link']).get()
-        dirty_version = response.xpath(self.xpath['get_version']).get()
+        kb_article_link, download_link, dirty_version = None, None, None
+        # the download link, its version and release notes hang off the first firmware link that has release notes,
+        # links without them (e.g. of other hardware versions) may come first
+        for firmware_link in self.xpath['get_firmware_link'].nodes(response):
+            kb_article_link = self.xpath['get_kb_article'].get(firmware_link)
+            if kb_article_link is not None:
+                download_link = self.xpath['get_download_link'].get(firmware_link)
+                dirty_version = self.xpath['get_version'].get(firmware_link)
+                break
 
         if None in [kb_article_link, download_link, dirty_version]:
             logging.warning([kb_article_link, download_link, dirty_version])
@@ -76,7 +84,7 @@ class Netgear(FirmwareSpider):
 
     def parse_kb_article(self, response: Response, device_name: str, firmware_version: str, download_link: str) -> Generator[FirmwareItem, None, None]:
 
-        dirty_release_date = response.xpath(self.xpath['get_release_date']).get()
+        dirty_release_date = self.xpath['get_release_date'].get(response)
 
         release_date = dirty_release_date.split(':')[-1].strip().replace('/', '-')
 
@@ -2,8 +2,8 @@ from typing import Generator, Tuple
 
 from scrapy import Request, Spider
 from scrapy.http import Response
-from scrapy.loader import ItemLoader
 
+from firmware.extraction import compile_xpaths
 from firmware.items import FirmwareItem
 
 
@@ -24,13 +24,14 @@ class NetgearGPL(Spider):
     whitelist = ['AC1450']
 
     download_maxsize = 2147483648  # 2GiB
+    segmented_downloads = True
 
-    XPATH = {
+    XPATH = compile_xpaths({
         'device_paragraph': '//div/p/strong/parent::*|//div/p/span[@style="FONT-WEIGHT: bold"]/parent::*',
         'device_name': './/strong/text()|.//span[@style="FONT-WEIGHT: bold"]/text()',
         'device_versions': './/a/text()',
         'device_links': './/a/@href'
-    }
+    })
 
     def parse(self, response: Response, **kwargs: {}) -> Generator[Request, None, None]:
         firmware_extractor = NetgearGPL.extract_firmwares(response)
@@ -53,24 +54,17 @@ class NetgearGPL(Spider):
 
     @staticmethod
     def extract_firmwares(response: Response) -> Generator[Tuple[str, str, str], None, None]:
-        for paragraph in response.xpath(NetgearGPL.XPATH['device_paragraph']):
-            device_name = paragraph.xpath(NetgearGPL.XPATH['device_name']).extract()
-            versions = paragraph.xpath(NetgearGPL.XPATH['device_versions']).extract()
-            links = paragraph.xpath(NetgearGPL.XPATH['device_links']).extract()
+        for paragraph in NetgearGPL.XPATH['device_paragraph'].nodes(response):
+            device_name = NetgearGPL.XPATH['device_name'].extract(paragraph)
+            versions = NetgearGPL.XPATH['device_versions'].extract(paragraph)
+            links = NetgearGPL.XPATH['device_links'].extract(paragraph)
 
             for version, link in zip(versions, links):
                 yield device_name, version, link
 
     @staticmethod
     def prepare_item_pipeline(meta_data: dict) -> Generator[FirmwareItem, None, None]:
-        loader = ItemLoader(item=FirmwareItem(), selector=meta_data['file_urls'])
-        loader.add_value('file_urls', meta_data['file_urls'])
-        loader.add_value('vendor', meta_data['vendor'])
-        loader.add_value('device_name', meta_data['device_name'])
-        loader.add_value('device_class', meta_data['device_class'])
-        loader.add_value('firmware_version', meta_data['firmware_version'])
-        loader.add_value('release_date', meta_data['release_date'])
-        yield loader.load_item()
+        yield FirmwareItem.from_meta_data(meta_data)
 
     @staticmethod
     def prepare_meta_data(device_name: str, firmware_version: str, file_url: str) -> dict:
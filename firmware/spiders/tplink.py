@@ -5,6 +5,7 @@ from scrapy import Request
 from scrapy.http import Response
 
 from firmware.custom_spiders import FirmwareSpider
+from firmware.extraction import compile_xpaths
 from firmware.items import FirmwareItem
 
 
@@ -29,14 +30,22 @@ class TPLink(FirmwareSpider):
 
     custom_settings = {
         'ROBOTSTXT_OBEY': True,
+        # the fallback for every host without an entry in domain_slots
         'CONCURRENT_REQUESTS': 1,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 1,
         'CONCURRENT_ITEMS': 1,
         'DOWNLOAD_DELAY': 0.75,
         'RANDOMIZE_DOWNLOAD_DELAY': True,
         'REFERER_ENABLED': True
     }
 
-    xpath = {
+    domain_slots = {
+        'www.tp-link.com': {'concurrency': 1, 'delay': 0.75},
+        # firmware images come from a CDN
+        'static.tp-link.com': {'concurrency': 4, 'max_concurrency': 16, 'adaptive': True},
+    }
+
+    xpath = compile_xpaths({
         'products_on_page': '//a[contains(@class,"tp-product-link")]/@href',
         'product_pages': '//li[@class="tp-product-pagination-item"]/a[@class="tp-product-pagination-btn"]/@href',
         'product_name': '//h2[@class="product-name"]/text()|//label[@class="model-select"]/p/span/text()',
@@ -45,8 +54,8 @@ class TPLink(FirmwareSpider):
                                   '(contains(@data-vars-event-category, "Firmware") or '
                                   'contains(@href, "firmware"))]/@href',
         'device_revision': '//span[@id="verison-hidden"]/text()',
-        'firmware_release_date': '//*[@id="content_Firmware"]/table//tr[@class="detail-info"][1]/td[1]/span[2]/text()[1]',   
-    }
+        'firmware_release_date': '//*[@id="content_Firmware"]/table//tr[@class="detail-info"][1]/td[1]/span[2]/text()[1]',
+    })
 
     def parse(self, response: Response, **kwargs: {}) -> Generator[Request, None, None]:
         for product_url in self.extract_products_on_page(response=response):
@@ -56,7 +65,7 @@ class TPLink(FirmwareSpider):
 
     @classmethod
     def parse_product_details(cls, product_page: Response) -> List[Request]:
-        device_name = product_page.xpath(cls.xpath['product_name']).extract()[0]
+        device_name = cls.xpath['product_name'].extract(product_page)[0]
         device_class = cls.map_device_class(product_page.url)
 
         support_link = cls.extract_product_support_link(product_page)
@@ -98,31 +107,31 @@ class TPLink(FirmwareSpider):
 
     @classmethod
     def extract_products_on_page(cls, response: Response) -> Generator[str, None, None]:
-        for result in response.xpath(cls.xpath['products_on_page']).extract():
+        for result in cls.xpath['products_on_page'].extract(response):
             yield response.urljoin(result)
 
     @classmethod
     def extract_product_support_link(cls, product_page: Response) -> str:
-        return product_page.urljoin(product_page.xpath(cls.xpath['product_support_link']).extract()[0])
+        return product_page.urljoin(cls.xpath['product_support_link'].extract(product_page)[0])
 
     @classmethod
     def extract_firmware_download_link(cls, support_page: Response) -> Optional[str]:
-        link_matches = support_page.xpath(cls.xpath['firmware_download_link']).extract()
+        link_matches = cls.xpath['firmware_download_link'].extract(support_page)
         if len(link_matches) < 1:
             return None
         return support_page.urljoin(link_matches[0])
 
     @classmethod
     def extract_device_revision(cls, support_page: Response) -> str:
-        return support_page.xpath(cls.xpath['device_revision']).extract()[0]
+        return cls.xpath['device_revision'].extract(support_page)[0]
 
     @classmethod
     def extract_firmware_release_date(cls, support_page: Response) -> str:
-        return support_page.xpath(cls.xpath['firmware_release_date']).extract()[0]
+        return cls.xpath['firmware_release_date'].extract(support_page)[0]
 
     @classmethod
     def extract_pages(cls, response: Response) -> Generator[str, None, None]:
-        for page in response.xpath(cls.xpath['product_pages']).extract():
+        for page in cls.xpath['product_pages'].extract(response):
             yield response.urljoin(page)
 
     @staticmethod
@@ -1,9 +1,9 @@
-from typing import Generator, Tuple, Union
+from typing import Generator, List, Tuple, Union
 
 from scrapy import Request, Spider
 from scrapy.http import Response
-from scrapy.loader import ItemLoader
 
+from firmware.extraction import compile_xpaths
 from firmware.items import FirmwareItem
 
 
@@ -25,23 +25,31 @@ class TPLinkGPL(Spider):
     whitelist = ['Archer AX20']
 
     download_maxsize = 2147483648  # 2GiB
+    segmented_downloads = True
 
-    XPATH = {
-        'device_names_ddl': '//div[@data-class="wi-fi-routers"]/div[@class="item-box"]//a[@class="ga-click"][contains(@href, "static")]/text()',
-        'device_links_ddl': '//div[@data-class="wi-fi-routers"]/div[@class="item-box"]//a[@class="ga-click"][contains(@href, "static")]/@href',
-        'device_names_multi': '//div[@data-class="wi-fi-routers"]/div[@class="item-box"]//a[@class="ga-click"][not(contains(@href, "static"))]/text()',
-        'device_links_multi': '//div[@data-class="wi-fi-routers"]/div[@class="item-box"]//a[@class="ga-click"][not(contains(@href, "static"))]/@href',
+    domain_slots = {
+        'www.tp-link.com': {'concurrency': 1, 'delay': 0.75},
+        'static.tp-link.com': {'concurrency': 2, 'max_concurrency': 8, 'adaptive': True},
+    }
+
+    XPATH = compile_xpaths({
+        'device_links': '//div[@data-class="wi-fi-routers"]/div[@class="item-box"]//a[@class="ga-click"]',
+        'device_name': './text()',
+        'device_link': './@href',
         'table_device_version': '//td[@class="model"]/following-sibling::td[1]/div/text()',
         'table_device_link': '//a[@class="bold ga-click"][text()="Download"]/@href',
-    }
+    })
 
     def parse(self, response: Response, **kwargs: {}) -> Generator[Request, None, None]:
-        ddl_extractor = TPLinkGPL.extract_ddl_firmware(response)
+        # devices with a direct download and with a list of versions are found in the same scan
+        device_links = TPLinkGPL.extract_device_links(response)
+
+        ddl_extractor = TPLinkGPL.extract_ddl_firmware(device_links)
         for device, link in self.firmware_filter(ddl_extractor):
             meta_data = TPLinkGPL.prepare_meta_data(device, None, link)
             yield from TPLinkGPL.prepare_item_pipeline(meta_data)
 
-        multi_fw_extractor = TPLinkGPL.extract_multi_firmware(response)
+        multi_fw_extractor = TPLinkGPL.extract_multi_firmware(device_links)
         for device, link in self.firmware_filter(multi_fw_extractor):
             cb_kwargs = dict(device=device)
             yield Request(url=link, callback=TPLinkGPL.parse_multi, cb_kwargs=cb_kwargs)
@@ -63,35 +71,37 @@ class TPLinkGPL(Spider):
 
     @staticmethod
     def extract_table(response: Response) -> Generator[Tuple[str, str], None, None]:
-        versions = response.xpath(TPLinkGPL.XPATH['table_device_version']).extract()
-        links = response.xpath(TPLinkGPL.XPATH['table_device_link']).extract()
+        versions = TPLinkGPL.XPATH['table_device_version'].extract(response)
+        links = TPLinkGPL.XPATH['table_device_link'].extract(response)
         for version, link in zip(versions, links):
             yield version.strip(), link.strip()
 
     @staticmethod
-    def extract_ddl_firmware(response: Response) -> Generator[Tuple[str, str], None, None]:
-        names = response.xpath(TPLinkGPL.XPATH['device_names_ddl']).extract()
-        links = response.xpath(TPLinkGPL.XPATH['device_links_ddl']).extract()
-        for device, link in zip(names, links):
-            yield device.strip(), link.strip()
+    def extract_device_links(response: Response) -> List[Tuple[str, str]]:
+        device_links = []
+        for anchor in TPLinkGPL.XPATH['device_links'].nodes(response):
+            device = TPLinkGPL.XPATH['device_name'].get(anchor)
+            link = TPLinkGPL.XPATH['device_link'].get(anchor)
+            if device is not None and link is not None:
+                device_links.append((device, link))
+        return device_links
+
+    @staticmethod
+    def extract_ddl_firmware(device_links: List[Tuple[str, str]]) -> Generator[Tuple[str, str], None, None]:
+        # direct downloads point to static.tp-link.com
+        for device, link in device_links:
+            if 'static' in link:
+                yield device.strip(), link.strip()
 
     @staticmethod
-    def extract_multi_firmware(response: Response) -> Generator[Tuple[str, str], None, None]:
-        names = response.xpath(TPLinkGPL.XPATH['device_names_multi']).extract()
-        links = response.xpath(TPLinkGPL.XPATH['device_links_multi']).extract()
-        for device, link in zip(names, links):
-            yield device.strip(), f'https://www.tp-link.com/phppage/gpl-res-list.html{link.strip()}&appPath=de'
+    def extract_multi_firmware(device_links: List[Tuple[str, str]]) -> Generator[Tuple[str, str], None, None]:
+        for device, link in device_links:
+            if 'static' not in link:
+                yield device.strip(), f'https://www.tp-link.com/phppage/gpl-res-list.html{link.strip()}&appPath=de'
 
     @staticmethod
     def prepare_item_pipeline(meta_data: dict) -> Generator[FirmwareItem, None, None]:
-        loader = ItemLoader(item=FirmwareItem(), selector=meta_data['file_urls'])
-        loader.add_value('file_urls', meta_data['file_urls'])
-        loader.add_value('vendor', meta_data['vendor'])
-        loader.add_value('device_name', meta_data['device_name'])
-        loader.add_value('device_class', meta_data['device_class'])
-        loader.add_value('firmware_version', meta_data['firmware_version'])
-        loader.add_value('release_date', meta_data['release_date'])
-        yield loader.load_item()
+        yield FirmwareItem.from_meta_data(meta_data)
 
     @staticmethod
     def prepare_meta_data(device: str, version: Union[str, None], file_url: str) -> dict:
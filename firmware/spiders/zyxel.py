@@ -5,6 +5,7 @@ from scrapy import Request
 from scrapy.http import Response
 
 from firmware.custom_spiders import FirmwareSpider
+from firmware.extraction import compile_xpaths
 from firmware.items import FirmwareItem
 
 
@@ -28,18 +29,19 @@ class Zyxel(FirmwareSpider):
         'REFERER_ENABLED': False,
     }
 
-    xpath = {
+    xpath = compile_xpaths({
         'get_product_urls': '//div[@class="card"]/a/@href',
         'get_device_name': '//p[@class="text-series"]/text()',
         'get_firmware_page_url': '//a[contains(@href, "&tab=Firmware")]/@href',
-        'get_download_link': '//a[contains(@data-filelink, "/firmware/") and contains(@data-filelink, ".zip")]/@data-filelink',
-        'get_firmware_version': '//a[contains(@data-filelink, "/firmware/") and contains(@data-filelink, ".zip")]/@data-version',
+        'get_firmware_link': '//a[contains(@data-filelink, "/firmware/") and contains(@data-filelink, ".zip")]',
+        'get_download_link': './@data-filelink',
+        'get_firmware_version': './@data-version',
         'get_release_date': '//td[contains(@class, "dateTd")]/span/text()',
-    }
+    })
 
     def parse(self, response: Response, **kwargs) -> Generator[Request, None, None]:
-        product_urls = response.xpath(self.xpath['get_product_urls']).extract()
-        device_names = response.xpath(self.xpath['get_device_name']).extract()
+        product_urls = self.xpath['get_product_urls'].extract(response)
+        device_names = self.xpath['get_device_name'].extract(response)
 
         for product_url, device_name in zip(product_urls, device_names):
             product_download_pages_url = f'{product_url}downloads'
@@ -50,7 +52,7 @@ class Zyxel(FirmwareSpider):
             )
 
     def move_to_firmware_downloads(self, response: Response, device_name: str) -> Generator[Request, None, None]:
-        firmware_page_url = response.xpath(self.xpath['get_firmware_page_url']).get()
+        firmware_page_url = self.xpath['get_firmware_page_url'].get(response)
         yield Request(
             url=response.urljoin(firmware_page_url),
             callback=self.parse_firmware_table,
@@ -58,9 +60,13 @@ class Zyxel(FirmwareSpider):
         )
 
     def parse_firmware_table(self, response: Response, device_name: str) -> Generator[FirmwareItem, None, None]:
-        download_link = response.xpath(self.xpath['get_download_link']).get()
-        firmware_version = response.xpath(self.xpath['get_firmware_version']).get()
-        dirty_release_date = response.xpath(self.xpath['get_release_date']).get()
+        firmware_links = self.xpath['get_firmware_link'].nodes(response)
+        if not firmware_links:
+            return
+
+        download_link = self.xpath['get_download_link'].get(firmware_links[0])
+        firmware_version = self.xpath['get_firmware_version'].get(firmware_links[0])
+        dirty_release_date = self.xpath['get_release_date'].get(response)
 
         if None in [download_link, firmware_version, dirty_release_date]:
             yield from []
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import sqlite3
+from contextlib import suppress
+from time import time
+from typing import Optional
+from uuid import uuid4
+
+from scrapy.pipelines.files import FSFilesStore
+from scrapy.utils.misc import md5sum
+
+
+class FirmwareFilesStore(FSFilesStore):
+    INCOMPLETE_DIR = '.incomplete'
+
+    def incomplete_path(self) -> str:
+        # partial downloads live inside the store so that finishing them is an atomic rename
+        incomplete_dir = os.path.join(self.basedir, self.INCOMPLETE_DIR)
+        self._mkdir(incomplete_dir)
+        return os.path.join(incomplete_dir, uuid4().hex)
+
+    def partial_path(self, url: str) -> str:
+        # stable per URL, so an interrupted download is picked up again by the next crawl
+        incomplete_dir = os.path.join(self.basedir, self.INCOMPLETE_DIR)
+        self._mkdir(incomplete_dir)
+        return os.path.join(incomplete_dir, hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+    def persist_local_file(self, path: str, local_filename: str, info, digests: Optional[dict] = None) -> str:
+        if digests is not None:
+            checksum = digests['md5']
+        else:
+            with open(local_filename, 'rb') as local_file:
+                checksum = md5sum(local_file)
+
+        absolute_path = self._get_filesystem_path(path)
+        self._mkdir(os.path.dirname(absolute_path), info)
+        os.replace(local_filename, absolute_path)
+        return checksum
+
+    def stored_filename(self, path: str, digests: Optional[dict] = None) -> str:  # pylint: disable=unused-argument
+        return self._get_filesystem_path(path)
+
+    def close(self):
+        pass
+
+
+class ContentAddressedFilesStore(FirmwareFilesStore):
+    # Every distinct file is stored once as objects/<aa>/<bb>/<sha256>. Human-readable paths only exist in the
+    # name index and, if enabled, as hard links to the object, so identical binaries never take up space twice.
+
+    OBJECTS_DIR = 'objects'
+    INDEX_FILE = 'index.db'
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, basedir, hardlinks=False):
+        super().__init__(basedir)
+        self.hardlinks = hardlinks
+        self._index = sqlite3.connect(os.path.join(self.basedir, self.INDEX_FILE))
+        self._index.execute('PRAGMA journal_mode=WAL')
+        self._index.execute('PRAGMA synchronous=NORMAL')
+        self._index.execute('CREATE TABLE IF NOT EXISTS names (path TEXT PRIMARY KEY, sha256 TEXT NOT NULL, checksum TEXT, size INTEGER, stored REAL)')
+        self._index.execute('CREATE INDEX IF NOT EXISTS names_sha256 ON names (sha256)')
+
+    def persist_file(self, path, buf, info, meta=None, headers=None):
+        data = buf.getvalue()
+        sha256 = hashlib.sha256(data).hexdigest()
+        object_path = self.object_path(sha256)
+        if not os.path.exists(object_path):
+            local_filename = self.incomplete_path()
+            with open(local_filename, 'wb') as local_file:
+                local_file.write(data)
+            self._store_object(local_filename, object_path, info)
+        self._add_name(path, sha256, hashlib.md5(data).hexdigest(), len(data), info)
+
+    def persist_local_file(self, path: str, local_filename: str, info, digests: Optional[dict] = None) -> str:
+        if digests is not None:
+            sha256, checksum, size = digests['sha256'], digests['md5'], os.path.getsize(local_filename)
+        else:
+            sha256, checksum, size = self._hash_file(local_filename)
+        object_path = self.object_path(sha256)
+        if os.path.exists(object_path):
+            os.remove(local_filename)
+        else:
+            self._store_object(local_filename, object_path, info)
+        self._add_name(path, sha256, checksum, size, info)
+        return checksum
+
+    def stat_file(self, path, info):
+        row = self._index.execute('SELECT sha256, checksum, stored FROM names WHERE path = ?', (path, )).fetchone()
+        if row is None or not os.path.exists(self.object_path(row[0])):
+            return {}
+        return {'last_modified': row[2], 'checksum': row[1]}
+
+    def stored_filename(self, path: str, digests: Optional[dict] = None) -> str:
+        # files that were up to date have no digests, their object is found through the name index
+        sha256 = digests['sha256'] if digests else self.lookup(path)
+        return self.object_path(sha256)
+
+    def lookup(self, path: str):
+        row = self._index.execute('SELECT sha256 FROM names WHERE path = ?', (path, )).fetchone()
+        return None if row is None else row[0]
+
+    def object_path(self, sha256: str) -> str:
+        return os.path.join(self.basedir, self.OBJECTS_DIR, sha256[:2], sha256[2:4], sha256)
+
+    def close(self):
+        self._index.close()
+
+    def _store_object(self, local_filename: str, object_path: str, info):
+        self._mkdir(os.path.dirname(object_path), info)
+        os.replace(local_filename, object_path)
+
+    def _add_name(self, path: str, sha256: str, checksum: str, size: int, info):
+        with self._index:
+            self._index.execute('REPLACE INTO names VALUES (?, ?, ?, ?, ?)', (path, sha256, checksum, size, time()))
+        if self.hardlinks:
+            self._link(path, sha256, info)
+
+    def _link(self, path: str, sha256: str, info):
+        absolute_path = self._get_filesystem_path(path)
+        self._mkdir(os.path.dirname(absolute_path), info)
+        with suppress(FileNotFoundError):
+            os.remove(absolute_path)
+        os.link(self.object_path(sha256), absolute_path)
+
+    @classmethod
+    def _hash_file(cls, filename: str):
+        sha256, md5, size = hashlib.sha256(), hashlib.md5(), 0
+        with open(filename, 'rb') as local_file:
+            for chunk in iter(lambda: local_file.read(cls.CHUNK_SIZE), b''):
+                sha256.update(chunk)
+                md5.update(chunk)
+                size += len(chunk)
+        return sha256.hexdigest(), md5.hexdigest(), size
@@ -8,13 +8,20 @@ class MockResponse:
         self.url = url
         self.body = body
         self.request = MockRequest(url, None)
+        self._selector = None
+
+    @property
+    def selector(self):
+        # parsed once, like the selector of a real response
+        if self._selector is None:
+            self._selector = Selector(text=self.body)
+        return self._selector
 
     def urljoin(self, url):
         return urljoin(self.url, url)
 
     def xpath(self, xpath):
-        selector = Selector(text=self.body)
-        return selector.xpath(xpath)
+        return self.selector.xpath(xpath)
 
 
 class MockRequest:
@@ -22,3 +29,17 @@ class MockRequest:
         self.url = url
         self.callback = callback
         self.cb_kwargs = cb_kwargs
+
+
+class MockStats:
+    def __init__(self):
+        self.stats = {}
+
+    def get_value(self, key, default=None):
+        return self.stats.get(key, default)
+
+    def set_value(self, key, value):
+        self.stats[key] = value
+
+    def inc_value(self, key, count=1, start=0):
+        self.stats[key] = self.stats.get(key, start) + count
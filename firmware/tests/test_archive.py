@@ -0,0 +1,63 @@
+import pytest
+from scrapy import Request
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import HtmlResponse, Response
+
+from firmware.archive import CrawlArchive
+from firmware.custom_responses import FTPEntry, FTPListingResponse
+from firmware.middlewares import ArchiveMiddleware
+from firmware.tests.mock_classes import MockStats
+
+URL = 'https://www.tp-link.com/de/support/download/archer-ax55/'
+FTP_URL = 'ftp://ftp.avm.de/fritzbox/fritzbox-7590/deutschland/fritz.os/FRITZ.Box_7590-07.29.image'
+
+
+@pytest.fixture(scope='function')
+def archive(tmp_path):
+    instance = CrawlArchive(str(tmp_path / 'archive.db'))
+    yield instance
+    instance.close()
+
+
+def test_response_round_trip(archive):
+    request = Request(URL)
+    archive.put(request, HtmlResponse(URL, status=200, headers={'Content-Encoding': 'gzip', 'Set-Cookie': ['a=1', 'b=2']}, body=b'\x1f\x8b'))
+
+    response = archive.get(Request(URL))
+
+    assert isinstance(response, HtmlResponse) and response.flags == ['archived']
+    assert response.body == b'\x1f\x8b'
+    assert response.headers.getlist('Set-Cookie') == [b'a=1', b'b=2']
+    assert archive.get(Request(URL + '?revision=2')) is None
+
+
+def test_ftp_listings_are_replayed_with_their_entries(archive):
+    url = 'ftp://ftp.avm.de/fritzbox/'
+    entries = [FTPEntry('d', 'rwxr-xr-x', 2, 'ftp', 'ftp', 4096, 'Aug 12  2019', 'fritzbox-7590')]
+    archive.put(Request(url), FTPListingResponse(url=url, status=200, entries=entries))
+
+    assert archive.get(Request(url)).entries == entries
+
+
+def test_rendered_pages_are_kept_apart(archive):
+    archive.put(Request(URL, meta={'selenium': True}), HtmlResponse(URL, body=b'<html>rendered</html>'))
+
+    assert archive.get(Request(URL)) is None
+    assert archive.get(Request(URL, meta={'selenium': True, 'download_slot': 'www.tp-link.com'})).body == b'<html>rendered</html>'
+
+
+def test_record_then_replay(archive):
+    recorder = ArchiveMiddleware(archive, 'record', max_body_size=10, stats=MockStats())
+    recorder.response_downloaded(Response(URL, body=b'small'), Request(URL), None)
+    recorder.response_downloaded(Response(URL + 'firmware.zip', body=b'too large for the archive'), Request(URL + 'firmware.zip'), None)
+    recorder.response_downloaded(Response(URL + 'gpl.tar.gz', body=b'/data/gpl'), Request(URL + 'gpl.tar.gz', meta={'download_local_filename': '/data/gpl'}), None)
+    recorder.response_downloaded(Response(FTP_URL, body=b'/store/.incomplete/abc'), Request(FTP_URL, meta={'ftp_local_filename': '/store/.incomplete/abc'}), None)
+    assert recorder.stats.stats == {'archive/recorded': 1, 'archive/skipped': 3}
+
+    replayer = ArchiveMiddleware(archive, 'replay', stats=MockStats())
+    assert replayer.process_request(Request(URL), None).body == b'small'
+    with pytest.raises(IgnoreRequest):
+        replayer.process_request(Request(URL + 'firmware.zip'), None)
+    with pytest.raises(IgnoreRequest):
+        replayer.process_request(Request(FTP_URL, meta={'ftp_local_filename': '/store/.incomplete/def'}), None)
+    assert replayer.stats.stats == {'archive/replayed': 1, 'archive/missing': 2}
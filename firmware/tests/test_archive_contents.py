@@ -0,0 +1,128 @@
+import gzip
+import hashlib
+import io
+import queue
+import tarfile
+import zipfile
+
+import pytest
+from scrapy import Spider
+
+from firmware.archive_contents import ArchiveContentsIndex, index_archive, list_members
+from firmware.pipelines import ArchiveContentsPipeline
+from firmware.stores import FirmwareFilesStore
+from firmware.tests.mock_classes import MockStats
+
+GPL_URL = 'https://osp.avm.de/fritzbox/fritzbox-7590/source-files-FRITZ.Box_7590-07.29.tar.gz'
+BUSYBOX = b'busybox 1.33.1' * 1000
+CONFIG = b'CONFIG_FEATURE_SH_STANDALONE=y\n'
+
+
+class MockReactor:
+    def __init__(self):
+        self.calls = queue.Queue()
+
+    def callFromThread(self, function, *args, **kwargs):  # pylint: disable=invalid-name
+        self.calls.put((function, args, kwargs))
+
+    def run_until(self, results: list):
+        while not results:
+            function, args, kwargs = self.calls.get(timeout=30)
+            function(*args, **kwargs)
+
+
+def tar_archive(mode: str) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as archive:
+        directory = tarfile.TarInfo('busybox-1.33.1')
+        directory.type, directory.mode = tarfile.DIRTYPE, 0o755
+        archive.addfile(directory)
+        for name, data, mode_bits in [('busybox-1.33.1/busybox', BUSYBOX, 0o755), ('busybox-1.33.1/.config', CONFIG, 0o644)]:
+            info = tarfile.TarInfo(name)
+            info.size, info.mode = len(data), mode_bits
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def zip_archive() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('busybox-1.33.1/busybox', BUSYBOX)
+        archive.writestr('busybox-1.33.1/.config', CONFIG)
+    return buffer.getvalue()
+
+
+EXPECTED_FILES = [
+    ('busybox-1.33.1/busybox', len(BUSYBOX), hashlib.sha256(BUSYBOX).hexdigest()),
+    ('busybox-1.33.1/.config', len(CONFIG), hashlib.sha256(CONFIG).hexdigest()),
+]
+
+
+@pytest.mark.parametrize('data, expected_format', [
+    (tar_archive('w'), 'tar'),
+    (tar_archive('w:gz'), 'tar.gz'),
+    (tar_archive('w:bz2'), 'tar.bz2'),
+    (tar_archive('w:xz'), 'tar.xz'),
+    (zip_archive(), 'zip'),
+])
+def test_members_are_listed_with_hashes(tmp_path, data, expected_format):
+    (tmp_path / 'archive').write_bytes(data)
+
+    archive_format, members = list_members(str(tmp_path / 'archive'), 'source.tar.gz')
+
+    assert archive_format == expected_format
+    assert [(path, size, sha256) for path, size, _, member_type, sha256 in members if member_type == 'file'] == EXPECTED_FILES
+    if archive_format != 'zip':
+        assert members[0] == ('busybox-1.33.1', 0, 0o755, 'dir', None)
+        assert members[1][2] == 0o755
+
+
+def test_single_compressed_files_and_other_files(tmp_path):
+    (tmp_path / 'firmware').write_bytes(gzip.compress(BUSYBOX))
+    (tmp_path / 'image').write_bytes(BUSYBOX)
+
+    assert list_members(str(tmp_path / 'firmware'), 'fritzbox/firmware.bin.gz') == (
+        'gz', [('firmware.bin', len(BUSYBOX), None, 'file', hashlib.sha256(BUSYBOX).hexdigest())]
+    )
+    assert list_members(str(tmp_path / 'image'), 'FRITZ.Box_7590-07.29.image') == (None, [])
+
+
+def test_broken_archives_are_recorded_with_their_error(tmp_path):
+    (tmp_path / 'archive').write_bytes(tar_archive('w:gz')[:-40])
+
+    assert index_archive(str(tmp_path / 'index.db'), str(tmp_path / 'archive'), 'abc', 'source.tar.gz') == ('gz', 0)
+
+    index = ArchiveContentsIndex(str(tmp_path / 'index.db'))
+    assert index.indexed('abc')
+    assert index.members('abc') == []
+    index.close()
+
+
+def test_pipeline_indexes_each_archive_once(tmp_path):
+    store = FirmwareFilesStore(str(tmp_path / 'files'))
+    (tmp_path / 'files' / 'source.tar.gz').write_bytes(tar_archive('w:gz'))
+    (tmp_path / 'files' / 'FRITZ.Box_7590-07.29.image').write_bytes(BUSYBOX)
+    stats = MockStats()
+    reactor = MockReactor()
+    pipeline = ArchiveContentsPipeline(str(tmp_path / 'index.db'), store, workers=1, stats=stats, reactor_=reactor)
+    spider = Spider(name='avm_gpl')
+
+    files = [
+        {'url': GPL_URL, 'path': 'source.tar.gz', 'checksum': 'abc', 'status': 'downloaded'},
+        {'url': GPL_URL.replace('osp', 'download'), 'path': 'source.tar.gz', 'checksum': 'abc', 'status': 'downloaded'},
+        {'url': 'ftp://ftp.avm.de/FRITZ.Box_7590-07.29.image', 'path': 'FRITZ.Box_7590-07.29.image', 'checksum': 'def', 'status': 'downloaded'},
+    ]
+    item = {'file_urls': [result['url'] for result in files], 'files': files}
+    assert pipeline.process_item(item, spider) is item
+    results = []
+    pipeline.close_spider(spider).addBoth(results.append)
+    reactor.run_until(results)
+
+    assert stats.get_value('archive_contents/archives') == 1
+    assert stats.get_value('archive_contents/members') == 3
+    index = ArchiveContentsIndex(str(tmp_path / 'index.db'))
+    assert sorted(index.containing(hashlib.sha256(CONFIG).hexdigest())) == [
+        (GPL_URL.replace('osp', 'download'), 'busybox-1.33.1/.config'), (GPL_URL, 'busybox-1.33.1/.config'),
+    ]
+    assert not index.indexed('def')
+    index.close()
@@ -0,0 +1,65 @@
+import pytest
+from scrapy import Request
+from scrapy.http import Response
+from twisted.python.failure import Failure
+
+from firmware.items import FirmwareItem
+from firmware.spiders.avm import AVM
+
+PRODUCT_PAGE = 'https://avm.de/produkte/fritzbox/fritzbox-7590'
+
+
+def image(name):
+    return {'vendor': 'AVM', 'file_urls': [f'ftp://ftp.avm.de/fritzbox/fritzbox-7590/deutschland/fritz.os/{name}'], 'device_name': 'FRITZ!Box 7590'}
+
+
+@pytest.fixture(scope='function')
+def spider():
+    return AVM()
+
+
+def test_product_page():
+    assert AVM.product_page('ftp://ftp.avm.de/fritzbox/fritzbox-7590/deutschland/fritz.os/FRITZ.Box_7590-07.29.image') == PRODUCT_PAGE
+
+
+def test_one_request_per_product(spider):
+    first = list(spider.check_support(PRODUCT_PAGE, image('a.image')))
+    second = list(spider.check_support(PRODUCT_PAGE, image('b.image')))
+
+    assert len(first) == 1 and isinstance(first[0], Request)
+    assert not second
+
+
+@pytest.mark.parametrize('status, items', [(200, 3), (404, 0)])
+def test_waiting_and_later_images_share_the_answer(spider, status, items):
+    request = next(spider.check_support(PRODUCT_PAGE, image('a.image')))
+    list(spider.check_support(PRODUCT_PAGE, image('b.image')))
+
+    answered = list(spider.verify_support(Response(PRODUCT_PAGE, status=status, request=request), **request.cb_kwargs))
+    later = list(spider.check_support(PRODUCT_PAGE, image('c.image')))
+
+    assert all(isinstance(item, FirmwareItem) for item in answered + later)
+    assert len(answered + later) == items
+
+
+def test_images_of_products_with_unknown_support_are_kept(spider):
+    request = next(spider.check_support(PRODUCT_PAGE, image('a.image')))
+    list(spider.check_support(PRODUCT_PAGE, image('b.image')))
+    failure = Failure(ConnectionRefusedError())
+    failure.request = request
+
+    waiting = list(spider.support_unknown(failure))
+    later = list(spider.check_support(PRODUCT_PAGE, image('c.image')))
+
+    assert [item.file_urls[0].split('/')[-1] for item in waiting + later] == ['a.image', 'b.image', 'c.image']
+    assert spider.product_support[PRODUCT_PAGE] is None
+
+
+def test_unanswered_checks_are_reported_on_close(spider, caplog):
+    list(spider.check_support(PRODUCT_PAGE, image('a.image')))
+    list(spider.check_support(PRODUCT_PAGE, image('b.image')))
+
+    spider.closed('shutdown')
+
+    assert f'Support check of {PRODUCT_PAGE} did not finish (shutdown), 2 images were not scraped' in caplog.text
+    assert not spider.pending_support
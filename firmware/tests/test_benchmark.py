@@ -0,0 +1,38 @@
+import pytest
+
+from firmware.benchmark import BASELINE, CASES, case_key, compare, load_results, run, run_case
+
+
+@pytest.fixture(scope='module')
+def baseline():
+    return load_results(BASELINE)
+
+
+# only the outputs per response are checked here, timings are compared by `python -m firmware.benchmark`
+@pytest.mark.parametrize('case', CASES, ids=case_key)
+def test_fixtures_match_the_baseline(case, baseline):
+    result = run_case(case, repeat=1)
+
+    expected = baseline['cases'][case_key(case)]
+    assert (result['items'], result['requests'], result['other']) == (expected['items'], expected['requests'], expected['other'])
+    assert result['items'] + result['requests'] > 0
+
+
+def test_compare_reports_changed_output_and_slower_callbacks():
+    def results(items, relative_latency):
+        return {'cases': {'avm.parse[listing]': {'items': items, 'requests': 3, 'other': 0, 'relative_latency': relative_latency}}}
+
+    assert compare(results(1, 1.2), results(1, 1.0)) == []
+    assert compare(results(1, 1.3), results(1, 1.0)) == ['avm.parse[listing]: median latency went up from 1.0 to 1.3 times the reference page']
+    assert compare(results(0, 1.0), results(1, 1.0)) == ['avm.parse[listing]: items per response changed from 1 to 0']
+    assert compare(results(1, 5.0), {}) == []
+
+
+def test_latencies_are_relative_to_the_reference_page():
+    results = run([case for case in CASES if case_key(case) == 'avm.parse[listing_fritzbox]'], repeat=3)
+    result = results['cases']['avm.parse[listing_fritzbox]']
+    assert results['reference_ms'] > 0 and result['relative_latency'] > 0
+
+    # baselines without relative latencies only have their outputs compared
+    old = {key: value for key, value in result.items() if key != 'relative_latency'}
+    assert compare(results, {'cases': {'avm.parse[listing_fritzbox]': dict(old, latency_ms={'median': 0.0001})}}) == []
@@ -0,0 +1,122 @@
+import gzip
+import os
+
+import pytest
+from scrapy import Spider
+from scrapy.settings import Settings
+
+from firmware.catalog import CatalogWriter, catalog_files, compact, read_records
+from firmware.items import FirmwareItem
+from firmware.pipelines import CatalogPipeline
+from firmware.tests.mock_classes import MockStats
+
+
+class MockClock:
+    def __init__(self):
+        self.now = 1600000000.0
+
+    def __call__(self):
+        return self.now
+
+
+def record(number: int) -> dict:
+    return {'vendor': ['AVM'], 'device_name': [f'FRITZ!Box {number}'], 'file_urls': [f'ftp://ftp.avm.de/{number}.image'], 'spider': 'avm'}
+
+
+@pytest.mark.parametrize('compression', ['', 'gzip'])
+def test_records_are_written_in_batches(tmp_path, compression):
+    writer = CatalogWriter(str(tmp_path), prefix='avm', compression=compression, batch_size=2)
+
+    writer.write(record(1))
+    assert writer.records == 0 and not writer.paths
+
+    writer.write(record(2))
+    writer.write(record(3))
+    # the file is readable while it is written, the pending third record is not in it yet
+    assert list(read_records(writer.paths[0])) == [record(1), record(2)]
+
+    writer.close()
+    assert list(read_records(writer.paths[0])) == [record(1), record(2), record(3)]
+    assert writer.paths[0].endswith('.jsonl.gz' if compression else '.jsonl')
+
+
+def test_unfinished_batches_are_read_up_to_the_last_complete_line(tmp_path):
+    path = tmp_path / 'avm-20200913T122640-0000.jsonl.gz'
+    complete = gzip.compress(b'{"vendor": ["AVM"]}\n')
+    # the trailer of the second member is missing, its last line is incomplete
+    path.write_bytes(complete + gzip.compress(b'{"vendor": ["D-Link"]}\n{"vendor": ')[:-8])
+
+    assert list(read_records(str(path))) == [{'vendor': ['AVM']}, {'vendor': ['D-Link']}]
+
+
+def test_files_are_rotated_by_size_and_age(tmp_path):
+    clock = MockClock()
+    writer = CatalogWriter(str(tmp_path), prefix='avm', batch_size=1, max_bytes=200, max_seconds=60, clock=clock)
+
+    for number in range(3):
+        writer.write(record(number))
+    assert len(writer.paths) == 2
+
+    clock.now += 60
+    writer.write(record(3))
+    writer.close()
+
+    assert len(writer.paths) == 3
+    assert catalog_files([str(tmp_path)]) == sorted(writer.paths)
+    assert [item['device_name'] for path in writer.paths for item in read_records(path)] == [[f'FRITZ!Box {number}'] for number in range(4)]
+
+
+def test_pipeline_streams_items_per_spider(tmp_path):
+    settings = Settings({'CATALOG_DIR': str(tmp_path), 'CATALOG_COMPRESSION': 'gzip', 'CATALOG_BATCH_SIZE': 10})
+    stats = MockStats()
+    pipeline = CatalogPipeline(settings.get('CATALOG_DIR'), settings, stats=stats)
+    spider = Spider(name='avm')
+
+    pipeline.open_spider(spider)
+    item = FirmwareItem.from_meta_data({'vendor': 'AVM', 'file_urls': 'ftp://ftp.avm.de/7590.image'})
+    assert pipeline.process_item(item, spider) is item
+    pipeline.close_spider(spider)
+
+    paths = catalog_files([str(tmp_path)])
+    assert [os.path.basename(path).split('-')[0] for path in paths] == ['avm']
+    assert list(read_records(paths[0])) == [{
+        'vendor': ['AVM'], 'device_name': None, 'firmware_version': None, 'device_class': None, 'release_date': None,
+        'files': None, 'file_urls': ['ftp://ftp.avm.de/7590.image'], 'spider': 'avm',
+    }]
+    assert stats.get_value('catalog/items') == 1 and stats.get_value('catalog/files') == 1
+
+
+def test_spiders_of_one_process_share_a_catalog_with_a_prefix(tmp_path):
+    settings = Settings({'CATALOG_DIR': str(tmp_path), 'CATALOG_PREFIX': 'catalog', 'CATALOG_BATCH_SIZE': 10})
+    pipelines = [CatalogPipeline(settings.get('CATALOG_DIR'), settings, stats=MockStats()) for _ in range(2)]
+    spiders = [Spider(name='avm'), Spider(name='dlink')]
+
+    for pipeline, spider in zip(pipelines, spiders):
+        pipeline.open_spider(spider)
+    for pipeline, spider in zip(pipelines, spiders):
+        pipeline.process_item(FirmwareItem.from_meta_data({'vendor': spider.name, 'file_urls': f'ftp://{spider.name}/1.bin'}), spider)
+    pipelines[0].close_spider(spiders[0])
+    pipelines[1].process_item(FirmwareItem.from_meta_data({'vendor': 'dlink', 'file_urls': 'ftp://dlink/2.bin'}), spiders[1])
+    pipelines[1].close_spider(spiders[1])
+
+    paths = catalog_files([str(tmp_path)])
+    assert [os.path.basename(path).split('-')[0] for path in paths] == ['catalog']
+    assert [(record['spider'], record['file_urls']) for record in read_records(paths[0])] == [
+        ('avm', ['ftp://avm/1.bin']), ('dlink', ['ftp://dlink/1.bin']), ('dlink', ['ftp://dlink/2.bin']),
+    ]
+    assert not CatalogPipeline._shared  # pylint: disable=protected-access
+
+
+def test_catalogs_are_compacted(tmp_path):
+    pyarrow = pytest.importorskip('pyarrow.parquet')
+    writer = CatalogWriter(str(tmp_path / 'catalog'), prefix='avm', compression='gzip', batch_size=2)
+    for number in range(5):
+        writer.write(dict(record(number), files=[{'url': f'ftp://ftp.avm.de/{number}.image', 'checksum': '0123'}]))
+    writer.close()
+
+    assert compact([str(tmp_path / 'catalog')], str(tmp_path / 'catalog.parquet'), batch_size=2) == 5
+
+    table = pyarrow.read_table(str(tmp_path / 'catalog.parquet'))
+    assert table.num_rows == 5
+    assert table.column('device_name').to_pylist()[4] == ['FRITZ!Box 4']
+    assert table.column('spider').to_pylist() == ['avm'] * 5
@@ -0,0 +1,101 @@
+import queue
+
+import pytest
+from scrapy import Spider
+
+from firmware.catalog_db import CatalogDatabase, item_rows, main, normalize_release_date
+from firmware.items import FirmwareItem
+from firmware.pipelines import CatalogDatabasePipeline
+from firmware.tests.mock_classes import MockStats
+
+IMAGE_URL = 'ftp://ftp.avm.de/fritzbox/fritzbox-7590/deutschland/fritz.os/FRITZ.Box_7590-07.29.image'
+
+
+class MockReactor:
+    # runs what the worker thread hands back to the reactor when the test drains the queue
+    def __init__(self):
+        self.calls = queue.Queue()
+
+    def callFromThread(self, function, *args, **kwargs):  # pylint: disable=invalid-name
+        self.calls.put((function, args, kwargs))
+
+    def run_until(self, results: list):
+        while not results:
+            function, args, kwargs = self.calls.get(timeout=5)
+            function(*args, **kwargs)
+
+
+def item(version: str, release_date: str, checksum=None) -> dict:
+    url = IMAGE_URL.replace('07.29', version)
+    return {'vendor': ['AVM'], 'device_name': ['FRITZ!Box 7590'], 'firmware_version': [version], 'device_class': ['Router'],
+            'release_date': [release_date], 'file_urls': [url], 'files': [{'url': url, 'path': url.split('/')[-1], 'checksum': checksum}] if checksum else None}
+
+
+@pytest.fixture(scope='function')
+def database(tmp_path):
+    instance = CatalogDatabase(str(tmp_path / 'catalog.db'))
+    instance.upsert(item_rows('avm', item('07.28', '12-05-2021', checksum='aaa'), now=100))
+    instance.upsert(item_rows('avm', item('07.29', '19-10-2021'), now=100))
+    yield instance
+    instance.close()
+
+
+@pytest.mark.parametrize('release_date, expected', [
+    ('19-10-2021', '2021-10-19'),
+    ('08-23-2022', '2022-08-23'),
+    ('2019-01-01', '2019-01-01'),
+    ('01/01/1970', None),
+    ('', None),
+    ('Q3 2020', None),
+])
+def test_normalize_release_date(release_date, expected):
+    assert normalize_release_date(release_date) == expected
+
+
+def test_latest_release(database):
+    latest = database.latest(vendor='avm', device_name='fritz!box 7590')
+
+    assert latest['firmware_version'] == '07.29'
+    assert latest['released'] == '2021-10-19'
+    assert database.latest(device_name='FRITZ!Box 75%')['url'] == latest['url']
+    assert database.latest(device_name='FRITZ!Box 6591') is None
+
+
+def test_rediscovered_files_are_updated(database):
+    database.upsert(item_rows('avm', item('07.28', '12-05-2021'), now=200))
+    database.upsert(item_rows('avm', item('07.29', '20-10-2021', checksum='bbb'), now=200))
+
+    assert len(database) == 2
+    # the download result of the earlier crawl is kept
+    assert database.search(checksum='aaa')[0]['last_seen'] == 200
+    assert [row['firmware_version'] for row in database.search(changed_since=150)] == ['07.29']
+
+    database.upsert(item_rows('avm', item('07.29', '20-10-2021', checksum='ccc'), now=300))
+    assert [row['firmware_version'] for row in database.search(changed_since=250)] == ['07.29']
+
+
+def test_query_cli(database, tmp_path, capsys):
+    assert main([str(tmp_path / 'catalog.db'), 'latest', 'FRITZ!Box 7590', '--vendor', 'AVM']) == 0
+    assert capsys.readouterr().out.split('\t')[:4] == ['AVM', 'FRITZ!Box 7590', '07.29', '2021-10-19']
+
+    assert main([str(tmp_path / 'catalog.db'), 'search', '--version', '07.30']) == 1
+
+
+def test_pipeline_writes_batches_in_a_thread(tmp_path):
+    stats = MockStats()
+    reactor = MockReactor()
+    pipeline = CatalogDatabasePipeline(CatalogDatabase(str(tmp_path / 'catalog.db')), batch_size=2, stats=stats, reactor_=reactor)
+    spider = Spider(name='avm')
+
+    pipeline.open_spider(spider)
+    for version in ['07.27', '07.28', '07.29']:
+        loaded = FirmwareItem(**item(version, '19-10-2021'))
+        assert pipeline.process_item(loaded, spider) is loaded
+    results = []
+    pipeline.close_spider(spider).addBoth(results.append)
+    reactor.run_until(results)
+
+    assert stats.get_value('catalog_database/rows') == 3
+    database = CatalogDatabase(str(tmp_path / 'catalog.db'))
+    assert sorted(row['firmware_version'] for row in database.search(vendor='AVM')) == ['07.27', '07.28', '07.29']
+    database.close()
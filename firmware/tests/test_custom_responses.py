@@ -0,0 +1,29 @@
+import pytest
+
+from firmware.custom_responses import FTPEntry, FTPListingResponse
+
+ENTRIES = [
+    FTPEntry(filetype='d', perms='rwxr-xr-x', nlinks=2, owner='ftp', group='ftp', size=4096, date='Aug 12 12:13', filename='fritz.os'),
+    FTPEntry(filetype='-', perms='rw-r--r--', nlinks=1, owner='ftp', group='ftp', size=47418, date='Sep 13 2017', filename='info_de.txt'),
+]
+
+
+@pytest.fixture(scope='function')
+def listing():
+    return FTPListingResponse(url='ftp://ftp.avm.de/fritzbox/', status=200, entries=list(ENTRIES))
+
+
+def test_entries_are_passed_without_serialisation(listing):
+    assert listing.entries == ENTRIES
+    assert listing._body is None  # pylint: disable=protected-access
+
+
+def test_body_round_trip(listing):
+    restored = FTPListingResponse(url=listing.url, status=200, body=listing.body)
+
+    assert restored.entries == ENTRIES
+    assert restored.text == listing.text
+
+
+def test_replace_keeps_entries(listing):
+    assert listing.replace(url='ftp://ftp.avm.de/fritzwlan/').entries == ENTRIES
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import queue
+
+import pytest
+from scrapy import Request, Spider
+from scrapy.http import Response
+from scrapy.pipelines.media import MediaPipeline
+from scrapy.utils.test import get_crawler
+
+from firmware.digests import Digests, fuzzy_digests
+from firmware.handlers import DigestingDataProtocol
+from firmware.pipelines import FirmwarePipeline
+from firmware.segmented_download import Segment, SegmentedDownload, SegmentWriter
+from firmware.tests.test_segmented_download import CONTENT, FakeAgent
+
+IMAGE_URL = 'ftp://ftp.avm.de/fritzbox/fritzbox-7590/deutschland/fritz.os/FRITZ.Box_7590-07.29.image'
+IMAGE = os.urandom(64 * 1024) + b'FRITZ.Box_7590-07.29.image' * 4096
+
+
+class MockReactor:
+    # runs what the worker thread hands back to the reactor when the test drains the queue
+    def __init__(self):
+        self.calls = queue.Queue()
+
+    def callFromThread(self, function, *args, **kwargs):  # pylint: disable=invalid-name
+        self.calls.put((function, args, kwargs))
+
+    def run_until(self, results: list):
+        while not results:
+            function, args, kwargs = self.calls.get(timeout=5)
+            function(*args, **kwargs)
+
+
+def expected_digests(data: bytes, algorithms=('md5', 'sha256', 'sha1')) -> dict:
+    return {algorithm: hashlib.new(algorithm, data).hexdigest() for algorithm in algorithms}
+
+
+def test_bytes_are_hashed_in_order(tmp_path):
+    digests = Digests(['sha1'])
+
+    assert digests.update(IMAGE[:1000])
+    assert not digests.update(IMAGE[5000:], offset=5000)
+    assert digests.update(IMAGE[1000:5000], offset=1000)
+
+    (tmp_path / 'image').write_bytes(IMAGE)
+    assert digests.catch_up(str(tmp_path / 'image')) == len(IMAGE) - 5000
+    assert digests.hexdigests() == expected_digests(IMAGE)
+
+
+def test_restarted_downloads_are_hashed_again():
+    digests = Digests()
+    digests.update(b'partial content of a failed attempt')
+
+    assert digests.update(IMAGE, offset=0)
+    assert digests.hexdigests() == expected_digests(IMAGE, algorithms=Digests.REQUIRED)
+
+
+def test_unknown_algorithms_are_rejected():
+    with pytest.raises(ValueError):
+        Digests(['sha257'])
+
+
+def test_streamed_ftp_downloads_need_no_catch_up_read(tmp_path):
+    digests = Digests(['sha1'])
+    protocol = DigestingDataProtocol(str(tmp_path / 'image'), digests)
+    for start in range(0, len(IMAGE), 4096):
+        protocol.dataReceived(IMAGE[start:start + 4096])
+    protocol.close()
+
+    # every byte was hashed on its way to the file
+    assert digests.position == len(IMAGE)
+    assert digests.catch_up(str(tmp_path / 'image')) == 0
+    assert digests.hexdigests() == expected_digests(IMAGE)
+
+
+def test_first_segment_is_hashed_while_written(tmp_path):
+    filename = str(tmp_path / 'partial')
+    request = Request('https://download.example.com/image.bin', meta={'file_digests': Digests()})
+    download = SegmentedDownload(agent=None, request=request, filename=filename)
+    download._truncate(len(IMAGE))  # pylint: disable=protected-access
+    segments = Segment.split(len(IMAGE), 4, 1)
+    writers = [SegmentWriter(download, segment, finished=None) for segment in segments]
+
+    # the segments arrive interleaved, in chunks of 1000 bytes
+    while not all(segment.done for segment in segments):
+        for writer in writers:
+            if not writer.segment.done:
+                writer.dataReceived(IMAGE[writer.segment.position:writer.segment.position + 1000])
+    for writer in writers:
+        writer.file.close()
+
+    assert download.digests.position == segments[1].start
+    assert download.digests.catch_up(filename) == len(IMAGE) - segments[1].start
+    assert download.digests.hexdigests() == expected_digests(IMAGE, algorithms=Digests.REQUIRED)
+
+
+@pytest.mark.parametrize('ranges, checkpoint, caught_up', [
+    (True, None, 0),
+    (False, None, 0),
+    # the resumed segments start behind the hashed position, the whole file is read once it is complete
+    (True, {'total': len(CONTENT), 'validator': '"abc"', 'segments': [[0, 511, 100], [512, 1023, 1024]]}, len(CONTENT)),
+])
+def test_segmented_downloads_are_hashed_while_written(tmp_path, ranges, checkpoint, caught_up):
+    filename = tmp_path / 'partial'
+    if checkpoint is not None:
+        filename.write_bytes(CONTENT[:100] + b'\0' * 412 + CONTENT[512:])
+        (tmp_path / 'partial.state').write_text(json.dumps(checkpoint))
+    request = Request('https://dlink-gpl.s3.amazonaws.com/GPL2000004/DIR-860L_A1_GPL.tar.gz', meta={'file_digests': Digests()})
+    download = SegmentedDownload(FakeAgent(ranges=ranges), request, str(filename), segments=4, min_segment_size=100)
+    download.start()
+
+    assert filename.read_bytes() == CONTENT
+    assert download.digests.catch_up(str(filename)) == caught_up
+    assert download.digests.hexdigests() == expected_digests(CONTENT, algorithms=Digests.REQUIRED)
+
+
+@pytest.mark.parametrize('streamed', [False, True])
+def test_digests_are_recorded_on_the_files(tmp_path, streamed):
+    settings = {'FILES_STORE': str(tmp_path / 'files'), 'FILES_DIGESTS': ['sha1'], 'FTP_STREAM_DOWNLOADS': True}
+    crawler = get_crawler(Spider, settings)
+    pipeline = FirmwarePipeline.from_crawler(crawler)
+    info = MediaPipeline.SpiderInfo(Spider.from_crawler(crawler, name='avm'))
+    request = pipeline.get_media_requests({'file_urls': [IMAGE_URL]}, info)[0]
+
+    if streamed:
+        protocol = DigestingDataProtocol(request.meta['ftp_local_filename'], request.meta['file_digests'])
+        protocol.dataReceived(IMAGE)
+        protocol.close()
+        response = Response(IMAGE_URL, body=request.meta['ftp_local_filename'].encode())
+    else:
+        request.meta.pop('ftp_local_filename')
+        response = Response(IMAGE_URL, body=IMAGE)
+
+    result = pipeline.media_downloaded(response, request, info)
+
+    assert result['checksum'] == hashlib.md5(IMAGE).hexdigest()
+    assert result['digests'] == expected_digests(IMAGE)
+    assert (tmp_path / 'files' / 'FRITZ.Box_7590-07.29.image').read_bytes() == IMAGE
+    assert crawler.stats.get_value('file_digests/catch_up_bytes') is None
+
+
+def test_fuzzy_digests(tmp_path):
+    tlsh = pytest.importorskip('tlsh')
+    (tmp_path / 'image').write_bytes(IMAGE)
+
+    assert fuzzy_digests(str(tmp_path / 'image'), ['tlsh']) == fuzzy_digests(IMAGE, ['tlsh']) == {'tlsh': tlsh.hash(IMAGE)}
+
+
+def test_segments_that_arrived_out_of_order_are_hashed_in_a_thread(tmp_path):
+    crawler = get_crawler(Spider, {'FILES_STORE': str(tmp_path / 'files'), 'SEGMENTED_DOWNLOADS_ENABLED': True})
+    pipeline = FirmwarePipeline.from_crawler(crawler)
+    pipeline._reactor = MockReactor()  # pylint: disable=protected-access
+    spider = Spider.from_crawler(crawler, name='dlink_gpl')
+    spider.segmented_downloads = True
+    info = MediaPipeline.SpiderInfo(spider)
+    request = pipeline.get_media_requests({'file_urls': ['https://dlink-gpl.s3.amazonaws.com/GPL2000004/image.bin']}, info)[0]
+    local_filename = request.meta['download_local_filename']
+    os.makedirs(os.path.dirname(local_filename), exist_ok=True)
+    with open(local_filename, 'wb') as local_file:
+        local_file.write(IMAGE)
+    # only the first segment was hashed while it arrived
+    request.meta['file_digests'].update(IMAGE[:1000])
+
+    results = []
+    pipeline.media_downloaded(Response(request.url, body=local_filename.encode(), request=request), request, info).addBoth(results.append)
+    pipeline._reactor.run_until(results)  # pylint: disable=protected-access
+    pipeline.close_spider(spider)
+
+    assert results[0]['digests'] == expected_digests(IMAGE, algorithms=Digests.REQUIRED)
+    assert results[0]['checksum'] == hashlib.md5(IMAGE).hexdigest()
+    assert crawler.stats.get_value('file_digests/catch_up_bytes') == len(IMAGE) - 1000
@@ -0,0 +1,127 @@
+import pytest
+from scrapy import Request
+from scrapy.core.downloader import Downloader, Slot
+from scrapy.http import Response
+from scrapy.settings import Settings
+from scrapy.utils.test import get_crawler
+
+from firmware.extensions import DomainSlots, SlotState
+from firmware.spiders.linksys import Linksys
+from firmware.spiders.tplink import TPLink
+from firmware.tests.mock_classes import MockStats
+
+BACKOFF = {429, 503}
+
+
+class MockDownloader:
+    def __init__(self):
+        self.total_concurrency = 1
+        self.slots = {}
+
+
+class MockCrawler:
+    def __init__(self):
+        self.settings = Settings({'DOMAIN_SLOTS_ENABLED': True})
+        self.stats = MockStats()
+        self.engine = type('MockEngine', (), {'downloader': MockDownloader()})()
+
+
+class MockSpider:
+    domain_slots = {
+        'tp-link.com': {'concurrency': 2, 'max_concurrency': 4, 'adaptive': True},
+        'www.tp-link.com': {'concurrency': 1, 'delay': 0.75},
+    }
+
+
+def responses(state, count, status=200, latency=0.1):
+    for _ in range(count):
+        state.observe(status, latency, BACKOFF, now=100)
+
+
+def test_concurrency_grows_one_per_window():
+    state = SlotState(concurrency=2, max_concurrency=4, adaptive=True)
+
+    responses(state, 2)
+    assert state.concurrency == 3
+    responses(state, 3 + 4 + 4)
+    assert state.concurrency == 4
+
+
+def test_backoff_halves_concurrency_then_raises_delay():
+    state = SlotState(concurrency=4, max_concurrency=8, adaptive=True)
+
+    responses(state, 1, status=503)
+    assert (state.concurrency, state.delay) == (2, 0)
+    responses(state, 2, status=429)
+    assert (state.concurrency, state.delay) == (1, 0.5)
+
+    responses(state, 1)
+    assert (state.concurrency, state.delay) == (1, 0.25)
+
+
+def test_slow_responses_decrease_once_per_latency_period():
+    state = SlotState(concurrency=8, max_concurrency=8, adaptive=True, target_latency=1)
+
+    assert state.observe(200, 5, BACKOFF, now=100)
+    assert not state.observe(200, 5, BACKOFF, now=102)
+    assert state.observe(200, 5, BACKOFF, now=106)
+    assert state.concurrency == 2
+
+
+def test_declared_slots_are_applied():
+    crawler = MockCrawler()
+    extension = DomainSlots(crawler)
+    extension.spider_opened(MockSpider())
+    slots = crawler.engine.downloader.slots
+    slots.update({'www.tp-link.com': Slot(8, 0, True), 'static.tp-link.com': Slot(8, 0, True), 'example.com': Slot(8, 0, True)})
+
+    for host in slots:
+        extension.request_reached_downloader(Request(f'https://{host}/', meta={'download_slot': host}), spider=None)
+
+    assert crawler.engine.downloader.total_concurrency == 5
+    assert (slots['www.tp-link.com'].concurrency, slots['www.tp-link.com'].delay) == (1, 0.75)
+    assert slots['static.tp-link.com'].concurrency == 2
+    assert slots['example.com'].concurrency == 8
+
+
+@pytest.mark.parametrize('status, concurrency', [(200, 3), (503, 1)])
+def test_adaptive_slot_follows_responses(status, concurrency):
+    crawler = MockCrawler()
+    extension = DomainSlots(crawler)
+    extension.spider_opened(MockSpider())
+    slot = crawler.engine.downloader.slots['static.tp-link.com'] = Slot(8, 0, True)
+    request = Request('https://static.tp-link.com/image.bin', meta={'download_slot': 'static.tp-link.com', 'download_latency': 0.2})
+    extension.request_reached_downloader(request, spider=None)
+
+    for _ in range(2):
+        extension.response_downloaded(Response(request.url, status=status), request, spider=None)
+
+    assert slot.concurrency == concurrency
+    assert crawler.stats.get_value('domain_slots/static.tp-link.com/concurrency') == concurrency
+
+
+@pytest.mark.parametrize('spider_cls, listed, unlisted', [
+    (TPLink, 'https://static.tp-link.com/upload/firmware/archer.zip', 'https://service-provider.tp-link.com/robots.txt'),
+    (Linksys, 'https://downloads.linksys.com/downloads/firmware/ea8300.img', 'https://support.linksys.com/kb/'),
+])
+def test_unlisted_hosts_keep_the_spiders_politeness(spider_cls, listed, unlisted):
+    crawler = get_crawler(spider_cls, {'DOMAIN_SLOTS_ENABLED': True})
+    spider = spider_cls.from_crawler(crawler)
+    downloader = Downloader(crawler)
+    crawler.engine = type('MockEngine', (), {'downloader': downloader})()
+    extension = DomainSlots(crawler)
+    extension.spider_opened(spider)
+
+    slots = []
+    for url in [listed, unlisted]:
+        request = Request(url)
+        key, slot = downloader._get_slot(request, spider)  # pylint: disable=protected-access
+        request.meta['download_slot'] = key
+        extension.request_reached_downloader(request, spider)
+        slots.append(slot)
+    downloader.close()
+
+    # the total concurrency is raised for the listed slots, everything else stays at one request every 0.75 seconds
+    assert downloader.total_concurrency == 17
+    assert (slots[0].concurrency, slots[0].delay) == (4, 0)
+    assert (slots[1].concurrency, slots[1].delay) == (1, 0.75)
@@ -0,0 +1,46 @@
+from scrapy.http import HtmlResponse
+
+from firmware.extraction import XPath, compile_xpaths
+from firmware.tests.mock_classes import MockResponse
+
+BODY = b'''<html><body>
+    <div id="firmware">
+        <table>
+            <tr><td class="version">1.02</td><td><a href="/fw/1.02.zip">Download</a></td></tr>
+            <tr><td class="version">1.01</td><td><a href="/fw/1.01.zip">Download</a> <b>old</b></td></tr>
+        </table>
+    </div>
+</body></html>'''
+
+XPATHS = compile_xpaths({
+    'rows': '//div[@id="firmware"]//tr',
+    'version': './td[@class="version"]/text()',
+    'link': './/a/@href',
+    'cell': './td[2]',
+})
+
+
+def test_results_match_selectors():
+    response = HtmlResponse('https://eu.dlink.com/de/de/products/dir-842', body=BODY)
+
+    for expression in ['//td[@class="version"]/text()', '//a/@href', '//td[2]', '//span/text()']:
+        assert XPath(expression).extract(response) == response.xpath(expression).extract()
+        assert XPath(expression).get(response) == response.xpath(expression).get()
+
+
+def test_queries_are_scoped_to_located_nodes():
+    response = HtmlResponse('https://eu.dlink.com/de/de/products/dir-842', body=BODY)
+
+    rows = XPATHS['rows'].nodes(response)
+
+    assert [(XPATHS['version'].get(row), XPATHS['link'].get(row)) for row in rows] == [('1.02', '/fw/1.02.zip'), ('1.01', '/fw/1.01.zip')]
+    assert XPATHS['cell'].get(rows[1]) == '<td><a href="/fw/1.01.zip">Download</a> <b>old</b></td>'
+    assert XPATHS['version'].get(rows[0].getparent(), default='') == ''
+
+
+def test_mock_responses_are_parsed_once():
+    response = MockResponse('https://eu.dlink.com/de/de/products/dir-842', BODY.decode())
+
+    assert XPATHS['version'].extract(response) == []
+    assert response.xpath('//a/@href').extract() == ['/fw/1.02.zip', '/fw/1.01.zip']
+    assert response.selector is response.selector
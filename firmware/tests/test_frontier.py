@@ -0,0 +1,148 @@
+import os
+
+import pytest
+from scrapy import Request, Spider, signals
+from scrapy.core.scheduler import Scheduler
+from scrapy.core.spidermw import SpiderMiddlewareManager
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.http import TextResponse
+from scrapy.utils.test import get_crawler
+
+from firmware import settings as project_settings
+from firmware.custom_requests import FTPListRequest
+from firmware.frontier import SQLiteFrontier
+from firmware.scheduler import FrontierQueue, SharedScheduler
+
+
+class FolderSpider(Spider):
+    name = 'folders'
+
+    def parse(self, response, **kwargs):
+        for image in ('a.image', 'b.image'):
+            yield Request(response.urljoin('info_de.txt'), callback=self.parse_info, cb_kwargs={'image': image})
+
+    def parse_info(self, response, image):
+        pass
+
+
+@pytest.fixture(scope='function')
+def frontier(tmp_path):
+    instance = SQLiteFrontier(str(tmp_path / 'frontier.db'))
+    yield instance
+    instance.close()
+
+
+def test_workers_share_the_queue(tmp_path, frontier):
+    other_worker = SQLiteFrontier(str(tmp_path / 'frontier.db'))
+    frontier.push('avm', 0, b'first')
+    frontier.push('avm', 10, b'important')
+    frontier.push('avm', 0, b'second')
+    frontier.push('dlink', 0, b'other spider')
+
+    assert other_worker.pop('avm') == b'important'
+    assert frontier.pop('avm') == b'first'
+    assert other_worker.count('avm') == 1
+    assert other_worker.pop('avm') == b'second'
+    assert frontier.pop('avm') is None
+    other_worker.close()
+
+
+def test_seen_set_is_per_spider(frontier):
+    assert frontier.add_seen('avm', 'abc')
+    assert not frontier.add_seen('avm', 'abc')
+    assert frontier.add_seen('dlink', 'abc')
+
+
+def test_seen_set_is_kept_until_the_crawl_finished(frontier):
+    frontier.add_seen('avm', 'abc')
+    frontier.push('avm', 0, b'interrupted')
+    assert not frontier.forget_seen('avm')
+    assert not frontier.add_seen('avm', 'abc')
+
+    frontier.pop('avm')
+    frontier.add_seen('dlink', 'abc')
+    assert frontier.forget_seen('avm')
+    assert frontier.add_seen('avm', 'abc')
+    assert not frontier.add_seen('dlink', 'abc')
+
+
+def test_reservations_are_spaced_by_the_delay(frontier, monkeypatch):
+    monkeypatch.setattr('firmware.frontier.time', lambda: 1000.0)
+
+    assert [frontier.reserve('avm', 'ftp.avm.de', 0.75) for _ in range(3)] == [0, 0.75, 1.5]
+    assert frontier.reserve('avm', 'avm.de', 0.75) == 0
+
+
+def test_queue_round_trip(frontier):
+    spider = FolderSpider()
+    queue = FrontierQueue(frontier, spider)
+    queue.push(FTPListRequest('ftp://ftp.avm.de/fritzbox/', priority=1))
+    queue.push(Request('ftp://ftp.avm.de/fritzbox/info_de.txt', callback=spider.parse_info, cb_kwargs={'image': 'a.image'}))
+
+    listing, info = queue.pop(), queue.pop()
+
+    assert isinstance(listing, FTPListRequest)
+    assert info.callback == spider.parse_info and info.cb_kwargs == {'image': 'a.image'}
+    assert len(queue) == 0
+
+
+def test_static_callbacks_cannot_be_shared(frontier):
+    queue = FrontierQueue(frontier, FolderSpider())
+
+    with pytest.raises(ValueError):
+        queue.push(Request('https://www.tp-link.com/', callback=lambda response: None))
+    with pytest.raises(ValueError):
+        queue.push(Request('https://www.tp-link.com/', meta={'errback': lambda failure: None}))
+
+
+def make_scheduler(scheduler_cls, jobdir=None):
+    settings = {'SCHEDULER': scheduler_cls, 'DUPEFILTER_CLASS': 'firmware.scheduler.SharedDupeFilter'}
+    if jobdir is not None:
+        settings['JOBDIR'] = str(jobdir)
+    crawler = get_crawler(FolderSpider, settings)
+    crawler.spider = FolderSpider.from_crawler(crawler)
+    scheduler = crawler.settings.get('SCHEDULER').from_crawler(crawler)
+    scheduler.open(crawler.spider)
+    return scheduler
+
+
+@pytest.mark.parametrize('jobdir', [False, True])
+def test_without_frontier_the_stock_scheduler_is_used(tmp_path, jobdir):
+    scheduler = make_scheduler(SharedScheduler, tmp_path / 'shared' if jobdir else None)
+    stock = make_scheduler(Scheduler, tmp_path / 'stock' if jobdir else None)
+    requests = [Request('ftp://ftp.avm.de/fritzbox/'), Request('ftp://ftp.avm.de/fritzbox/'), Request('ftp://ftp.avm.de/fritzbox/', dont_filter=True)]
+
+    assert [scheduler.enqueue_request(request) for request in requests] == [stock.enqueue_request(request) for request in requests] == [True, False, True]
+    assert type(scheduler.dqs) is type(stock.dqs)  # pylint: disable=unidiomatic-typecheck
+    assert isinstance(scheduler.df, RFPDupeFilter) and scheduler.frontier is None and scheduler.df.frontier is None
+    assert len(scheduler) == len(stock) == 2
+    scheduler.close('finished')
+    stock.close('finished')
+    assert os.path.exists(tmp_path / 'shared' / 'requests.seen') is os.path.exists(tmp_path / 'stock' / 'requests.seen') is jobdir
+
+
+def test_spider_requests_reach_the_frontier(tmp_path):
+    settings = {'SCHEDULER': 'firmware.scheduler.SharedScheduler', 'DUPEFILTER_CLASS': 'firmware.scheduler.SharedDupeFilter',
+                'SPIDER_MIDDLEWARES': project_settings.SPIDER_MIDDLEWARES, 'FRONTIER_URL': f'sqlite:///{tmp_path}/frontier.db'}
+    crawler = get_crawler(FolderSpider, settings)
+    crawler.spider = spider = FolderSpider.from_crawler(crawler)
+    scheduler = SharedScheduler.from_crawler(crawler)
+    scheduler.open(spider)
+    spider_middlewares = SpiderMiddlewareManager.from_crawler(crawler)
+    crawler.signals.send_catch_log(signal=signals.spider_opened, spider=spider)
+
+    folder = TextResponse('ftp://ftp.avm.de/fritzbox/', body=b'', request=Request('ftp://ftp.avm.de/fritzbox/'))
+    output = []
+    # the engine schedules every request before the next one is taken from the spider middlewares
+    for request in spider_middlewares._process_callback_output(folder, spider, spider.parse(folder)):  # pylint: disable=protected-access
+        assert scheduler.enqueue_request(request)
+        crawler.signals.send_catch_log(signal=signals.request_scheduled, request=request, spider=spider)
+        output.append(request)
+
+    # the second request waits for the first one, which went to the frontier instead of this worker's memory
+    assert len(output) == 1
+    assert len(scheduler.mqs) == 0 and len(scheduler.dqs) == 1
+    assert scheduler.frontier.count(spider.name) == 1
+    shared = scheduler.next_request()
+    assert shared.callback == spider.parse_info and shared.errback == spider.coalesced_request_failed
+    scheduler.close('finished')
@@ -0,0 +1,65 @@
+import pytest
+
+from firmware.custom_responses import FTPEntry
+from firmware.ftp_listing_cache import FTPListingCache
+from firmware.tests.mock_classes import MockStats
+
+ROOT = 'ftp.avm.de:21/'
+
+
+def entry(filename, filetype='d', size=4096, date='Aug 12 12:13', nlinks=2):
+    return FTPEntry(filetype=filetype, perms='rwxr-xr-x', nlinks=nlinks, owner='ftp', group='ftp', size=size, date=date, filename=filename)
+
+
+@pytest.fixture(scope='function')
+def cache_path(tmp_path):
+    return str(tmp_path / 'listings.db')
+
+
+def previous_crawl(cache_path, root_listing, child_listing):
+    cache = FTPListingCache(cache_path)
+    cache.put(ROOT, root_listing)
+    cache.put(f'{ROOT}fritzbox/', child_listing)
+    cache.close()
+
+
+def test_unchanged_directory_is_served_from_cache(cache_path):
+    previous_crawl(cache_path, [entry('fritzbox')], [entry('info_de.txt', filetype='-', size=47418)])
+
+    cache = FTPListingCache(cache_path, stats=MockStats())
+    cache.observe(ROOT, [entry('fritzbox')])
+
+    assert cache.get(f'{ROOT}fritzbox/') == [entry('info_de.txt', filetype='-', size=47418)]
+    assert cache.stats.get_value('ftp_listing_cache/hit') == 1
+
+
+@pytest.mark.parametrize('changed', [entry('fritzbox', date='Sep 13 21:18'), entry('fritzbox', nlinks=3), entry('fritzbox', size=8192)])
+def test_changed_parent_entry_invalidates(cache_path, changed):
+    previous_crawl(cache_path, [entry('fritzbox')], [])
+
+    cache = FTPListingCache(cache_path, stats=MockStats())
+    cache.observe(ROOT, [changed])
+
+    assert cache.get(f'{ROOT}fritzbox/') is None
+    assert cache.stats.get_value('ftp_listing_cache/stale') == 1
+
+
+def test_unobserved_directory_is_listed(cache_path):
+    previous_crawl(cache_path, [entry('fritzbox')], [])
+
+    assert FTPListingCache(cache_path).get(ROOT) is None
+
+
+def test_expired_listing_is_not_served(cache_path, monkeypatch):
+    previous_crawl(cache_path, [entry('fritzbox')], [])
+
+    cache = FTPListingCache(cache_path, max_age=60)
+    cache.observe(ROOT, [entry('fritzbox')])
+    monkeypatch.setattr('firmware.ftp_listing_cache.time', lambda: 10 ** 12)
+
+    assert cache.get(f'{ROOT}fritzbox/') is None
+
+
+@pytest.mark.parametrize('path, expected', [('/fritzbox/', 'ftp.avm.de:21/fritzbox/'), ('/fritzbox', 'ftp.avm.de:21/fritzbox/')])
+def test_key(path, expected):
+    assert FTPListingCache.key('ftp.avm.de', 21, path) == expected
@@ -0,0 +1,95 @@
+import pytest
+from twisted.internet.defer import fail, succeed
+from twisted.internet.task import Clock
+from twisted.protocols.ftp import CommandFailed
+
+from firmware.ftp_pool import FTPClientPool, FTPPoolKey
+from firmware.tests.mock_classes import MockStats
+
+KEY = FTPPoolKey(host='ftp.avm.de', port=21, user='anonymous', password='guest', passive=1)
+
+
+class MockTransport:
+    def __init__(self, client):
+        self.client = client
+
+    def loseConnection(self):
+        self.client.alive = False
+
+
+class MockFTPClient:
+    def __init__(self, healthy=True):
+        self.alive = True
+        self.healthy = healthy
+        self.transport = MockTransport(self)
+
+    def queueStringCommand(self, command):
+        return succeed(['200 NOOP ok']) if self.healthy else fail(CommandFailed(['421 Timeout']))
+
+    def quit(self):
+        return succeed(['221 Goodbye'])
+
+
+@pytest.fixture(scope='function')
+def pool(monkeypatch):
+    instance = FTPClientPool(size=2, idle_timeout=30, stats=MockStats(), clock=Clock())
+    monkeypatch.setattr(instance, '_connect', lambda key: succeed(MockFTPClient()).addCallback(instance._logged_in))
+    return instance
+
+
+def acquire(pool_instance):
+    clients = []
+    pool_instance.acquire(KEY).addCallback(clients.append)
+    return clients[0] if clients else None
+
+
+def test_released_client_is_reused(pool):
+    client = acquire(pool)
+    pool.release(KEY, client)
+
+    assert acquire(pool) is client
+    assert pool.stats.get_value('ftp_pool/logins') == 1
+    assert pool.stats.get_value('ftp_pool/logins_saved') == 1
+    assert pool.stats.get_value('ftp_pool/reuse_ratio') == 0.5
+
+
+def test_pool_size_limits_parallel_logins(pool):
+    first, second = acquire(pool), acquire(pool)
+    waiting = []
+    pool.acquire(KEY).addCallback(waiting.append)
+
+    assert first is not second
+    assert waiting == []
+
+    pool.release(KEY, first)
+    assert waiting == [first]
+    assert pool.leased_count(KEY) == 2
+
+
+def test_idle_client_expires(pool):
+    client = acquire(pool)
+    pool.release(KEY, client)
+    pool.clock.advance(31)
+
+    assert pool.idle_count(KEY) == 0
+    assert not client.alive
+    assert acquire(pool) is not client
+
+
+def test_unhealthy_client_is_replaced(pool):
+    client = acquire(pool)
+    client.healthy = False
+    pool.release(KEY, client)
+
+    assert acquire(pool) is not client
+    assert not client.alive
+    assert pool.stats.get_value('ftp_pool/dropped_unhealthy') == 1
+
+
+def test_failed_transfer_discards_client(pool):
+    client = acquire(pool)
+    pool.release(KEY, client, reusable=False)
+
+    assert pool.idle_count(KEY) == 0
+    assert pool.leased_count(KEY) == 0
+    assert not client.alive
@@ -0,0 +1,123 @@
+import os
+from email.utils import formatdate
+
+import pytest
+from scrapy import FormRequest, Request, Spider
+from scrapy.downloadermiddlewares.httpcache import HttpCacheMiddleware
+from scrapy.http import HtmlResponse, Response
+from scrapy.utils.test import get_crawler
+
+TPLINK_URL = 'https://www.tp-link.com/de/support/download/archer-c7/'
+DLINK_URL = 'https://tsd.dlink.com.tw/ddetail'
+PAGE = b'<html><body><a href="/de/support/download/archer-c7/v5/">V5</a></body></html>'
+
+
+def make_middleware(tmp_path, **settings):
+    settings = dict({
+        'HTTPCACHE_ENABLED': True,
+        'HTTPCACHE_POLICY': 'firmware.http_cache.ConditionalPolicy',
+        'HTTPCACHE_STORAGE': 'firmware.http_cache.SQLiteCacheStorage',
+        'HTTPCACHE_DIR': str(tmp_path / 'httpcache'),
+        'HTTPCACHE_UNVALIDATED_TTL': 60,
+    }, **settings)
+    crawler = get_crawler(Spider, settings)
+    spider = Spider.from_crawler(crawler, name='tplink')
+    middleware = HttpCacheMiddleware.from_crawler(crawler)
+    middleware.spider_opened(spider)
+    return middleware, spider
+
+
+def download(middleware, spider, request, response):
+    # the request passes the cache on its way to the downloader, the response on its way back
+    assert middleware.process_request(request, spider) is None
+    return middleware.process_response(request, response.replace(request=request), spider)
+
+
+@pytest.fixture(scope='function')
+def cache(tmp_path):
+    middleware, spider = make_middleware(tmp_path)
+    yield middleware, spider
+    middleware.spider_closed(spider)
+
+
+def test_unchanged_pages_are_revalidated(cache):
+    middleware, spider = cache
+    headers = {'ETag': '"5f3a"', 'Last-Modified': formatdate(usegmt=True), 'Content-Type': 'text/html'}
+    download(middleware, spider, Request(TPLINK_URL), HtmlResponse(TPLINK_URL, headers=headers, body=PAGE))
+
+    request = Request(TPLINK_URL)
+    response = download(middleware, spider, request, Response(TPLINK_URL, status=304))
+
+    assert request.headers['If-None-Match'] == b'"5f3a"'
+    assert b'If-Modified-Since' in request.headers
+    assert isinstance(response, HtmlResponse) and response.body == PAGE and 'cached' in response.flags
+    assert middleware.stats.get_value('httpcache/revalidate') == 1
+
+    changed = download(middleware, spider, Request(TPLINK_URL), HtmlResponse(TPLINK_URL, headers={'ETag': '"5f3b"'}, body=PAGE + b'V6'))
+    assert changed.body == PAGE + b'V6'
+    assert middleware.stats.get_value('httpcache/invalidate') == 1
+    assert middleware.storage.retrieve_response(spider, Request(TPLINK_URL)).headers['ETag'] == b'"5f3b"'
+
+
+def test_post_forms_are_cached_per_form(cache):
+    middleware, spider = cache
+    for model in ['DIR-860L', 'COVR-1100']:
+        request = FormRequest(DLINK_URL, formdata={'ModelCategory_': 'DIR', 'ModelSno_': model})
+        download(middleware, spider, request, HtmlResponse(DLINK_URL, headers={'ETag': f'"{model}"'}, body=model.encode()))
+    assert len(middleware.storage) == 2
+
+    request = FormRequest(DLINK_URL, formdata={'ModelCategory_': 'DIR', 'ModelSno_': 'COVR-1100'})
+    response = download(middleware, spider, request, Response(DLINK_URL, status=412))
+
+    assert request.headers['If-None-Match'] == b'"COVR-1100"'
+    assert response.body == b'COVR-1100'
+
+
+def test_pages_without_validators_are_reused_for_a_while(tmp_path):
+    middleware, spider = make_middleware(tmp_path)
+    download(middleware, spider, Request(TPLINK_URL), HtmlResponse(TPLINK_URL, body=PAGE))
+
+    request = Request(TPLINK_URL)
+    assert middleware.process_request(request, spider).body == PAGE
+    assert b'If-None-Match' not in request.headers
+    middleware.spider_closed(spider)
+
+    middleware, spider = make_middleware(tmp_path, HTTPCACHE_UNVALIDATED_TTL=0)
+    assert middleware.process_request(Request(TPLINK_URL), spider) is None
+    download(middleware, spider, Request(TPLINK_URL + 'v5/'), HtmlResponse(TPLINK_URL + 'v5/', body=PAGE))
+    assert middleware.stats.get_value('httpcache/uncacheable') == 1
+    middleware.spider_closed(spider)
+
+
+@pytest.mark.parametrize('date', [None, 'garbage'])
+def test_pages_without_a_usable_date_expire_after_they_were_stored(cache, monkeypatch, date):
+    middleware, spider = cache
+    monkeypatch.setattr('firmware.http_cache.time', lambda: 1000.0)
+    headers = {} if date is None else {'Date': date}
+    # HttpCacheMiddleware adds a Date to responses without one, other writers of the storage may not
+    middleware.storage.store_response(spider, Request(TPLINK_URL), HtmlResponse(TPLINK_URL, headers=headers, body=PAGE))
+    assert middleware.process_request(Request(TPLINK_URL), spider).body == PAGE
+
+    monkeypatch.setattr('firmware.http_cache.time', lambda: 1061.0)
+    assert middleware.process_request(Request(TPLINK_URL), spider) is None
+
+
+def test_least_recently_used_pages_are_evicted(tmp_path):
+    middleware, spider = make_middleware(tmp_path, HTTPCACHE_MAX_SIZE=1000)
+    pages = [f'{TPLINK_URL}v{version}/' for version in range(4)]
+    for page in pages:
+        download(middleware, spider, Request(page), HtmlResponse(page, headers={'ETag': page}, body=os.urandom(300)))
+        assert middleware.storage.retrieve_response(spider, Request(pages[0])) is not None
+
+    # the first page is used all the time, its successors are dropped
+    assert middleware.stats.get_value('httpcache/evicted') == 2
+    assert [middleware.storage.retrieve_response(spider, Request(page)) is not None for page in pages] == [True, False, False, True]
+    middleware.spider_closed(spider)
+
+
+def test_rendered_pages_and_file_downloads_are_not_cached(cache):
+    middleware, spider = cache
+    download(middleware, spider, Request(TPLINK_URL, meta={'selenium': True}), HtmlResponse(TPLINK_URL, headers={'ETag': '"5f3a"'}, body=PAGE))
+    download(middleware, spider, Request(TPLINK_URL + 'firmware.bin', meta={'dont_cache': True}), Response(TPLINK_URL + 'firmware.bin', body=PAGE))
+
+    assert len(middleware.storage) == 0
@@ -0,0 +1,43 @@
+import pickle
+
+from itemadapter import ItemAdapter, is_item
+from scrapy.loader import ItemLoader
+
+from firmware.items import FirmwareItem
+
+META_DATA = {
+    'vendor': 'AVM',
+    'device_name': 'FRITZ!Box 7590',
+    'firmware_version': ['07.29', '07.28'],
+    'device_class': 'Router',
+    'release_date': None,
+    'file_urls': ['ftp://ftp.avm.de/fritzbox/fritzbox-7590/deutschland/fritz.os/FRITZ.Box_7590-07.29.image'],
+}
+
+
+def test_from_meta_data_matches_item_loader():
+    loader = ItemLoader(item=FirmwareItem())
+    for key, value in META_DATA.items():
+        loader.add_value(key, value)
+
+    item = FirmwareItem.from_meta_data(META_DATA)
+
+    loaded = {key: value for key, value in ItemAdapter(loader.load_item()).items() if value}
+    assert {key: value for key, value in ItemAdapter(item).items() if value is not None} == loaded
+    assert item.vendor == ['AVM']
+    assert item.firmware_version == ['07.29', '07.28']
+    assert item.release_date is None and item.files is None
+
+
+def test_items_work_with_item_adapter():
+    item = FirmwareItem.from_meta_data({'device_name': 'DIR-842', 'file_urls': []})
+
+    assert is_item(item)
+    assert item.file_urls == []
+
+    adapter = ItemAdapter(item)
+    adapter['files'] = [{'url': 'https://eu.dlink.com/fw.zip', 'checksum': '0123'}]
+
+    assert item.files == [{'url': 'https://eu.dlink.com/fw.zip', 'checksum': '0123'}]
+    assert not hasattr(item, '__dict__')
+    assert ItemAdapter(pickle.loads(pickle.dumps(item))).asdict() == adapter.asdict()
@@ -0,0 +1,43 @@
+import pytest
+
+from firmware.manifest import DOWNLOADED, FAILED, PENDING, Manifest
+
+IMAGE_URL = 'ftp://ftp.avm.de/fritzbox/fritzbox-7590/deutschland/fritz.os/FRITZ.Box_7590-07.29.image'
+GPL_URL = 'https://osp.avm.de/fritzbox/fritzbox-7590/source-files-FRITZ.Box_7590-07.29.tar.gz'
+
+
+@pytest.fixture(scope='function')
+def manifest(tmp_path):
+    instance = Manifest(str(tmp_path / 'manifest.db'))
+    instance.add_item('avm', {'vendor': ['AVM'], 'device_name': ['FRITZ!Box 7590'], 'file_urls': [IMAGE_URL], 'files': []})
+    instance.add_item('avm_gpl', {'vendor': ['AVM'], 'file_urls': [GPL_URL]})
+    yield instance
+    instance.close()
+
+
+def test_pending_files_are_grouped_by_item(manifest):
+    assert list(manifest.pending()) == [
+        ([IMAGE_URL], {'vendor': ['AVM'], 'device_name': ['FRITZ!Box 7590'], 'file_urls': [IMAGE_URL]}),
+        ([GPL_URL], {'vendor': ['AVM'], 'file_urls': [GPL_URL]}),
+    ]
+    assert [urls for urls, _ in manifest.pending(spider='avm_gpl')] == [[GPL_URL]]
+
+
+def test_failed_files_are_retried_up_to_max_attempts(manifest):
+    manifest.record(GPL_URL, FAILED, error='timeout')
+    manifest.record(IMAGE_URL, DOWNLOADED, path='FRITZ.Box_7590-07.29.image', checksum='abc')
+
+    assert [urls for urls, _ in manifest.pending(max_attempts=2)] == [[GPL_URL]]
+
+    manifest.record(GPL_URL, FAILED, error='timeout')
+    assert not list(manifest.pending(max_attempts=2))
+    assert manifest.counts() == {DOWNLOADED: 1, FAILED: 1}
+
+
+def test_rediscovery_keeps_download_results(manifest):
+    manifest.record(IMAGE_URL, DOWNLOADED, path='FRITZ.Box_7590-07.29.image', checksum='abc')
+
+    manifest.add_item('avm', {'vendor': ['AVM'], 'file_urls': [IMAGE_URL, IMAGE_URL.replace('07.29', '07.30')]})
+
+    assert manifest.status(IMAGE_URL) == DOWNLOADED
+    assert manifest.status(IMAGE_URL.replace('07.29', '07.30')) == PENDING
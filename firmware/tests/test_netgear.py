@@ -0,0 +1,37 @@
+from scrapy.http import HtmlResponse
+
+from firmware.spiders.netgear import Netgear
+
+SUPPORT_URL = 'https://www.netgear.de/support/download/default.aspx?model=RAX50'
+
+# the first firmware link has no release notes, the one of the current version follows further down
+SUPPORT_PAGE = b'''<html><body><div class="downloads">
+    <div class="accordion-item">
+        <a href="https://www.downloads.netgear.com/files/GDC/RAX50/RAX50v2-V1.0.3.106.zip"><p>Firmware Version 1.0.3.106 (RAX50v2)</p></a>
+    </div>
+    <div class="accordion-item">
+        <a href="https://www.downloads.netgear.com/files/GDC/RAX50/RAX50_UM.pdf"><p>Benutzerhandbuch</p></a>
+        <a href="https://kb.netgear.com/000061234/RAX50-User-Manual">Details</a>
+    </div>
+    <div class="accordion-item">
+        <a href="https://www.downloads.netgear.com/files/GDC/RAX50/RAX50-V1.0.10.98.zip"><p>Firmware Version 1.0.10.98</p></a>
+        <a href="https://kb.netgear.com/000064998/RAX50-Firmware-Version-1-0-10-98">Release Notes</a>
+    </div>
+</div></body></html>'''
+
+
+def test_firmware_link_with_release_notes_is_followed():
+    response = HtmlResponse(SUPPORT_URL, body=SUPPORT_PAGE)
+
+    requests = list(Netgear().consult_support_pages(response, device_name='RAX50'))
+
+    assert len(requests) == 1
+    assert requests[0].url == 'https://kb.netgear.com/000064998/RAX50-Firmware-Version-1-0-10-98'
+    assert requests[0].cb_kwargs == {'firmware_version': '1.0.10.98', 'device_name': 'RAX50',
+                                     'download_link': 'https://www.downloads.netgear.com/files/GDC/RAX50/RAX50-V1.0.10.98.zip'}
+
+
+def test_pages_without_release_notes_are_skipped():
+    response = HtmlResponse(SUPPORT_URL, body=SUPPORT_PAGE.replace(b'https://kb.netgear.com/000064998', b'https://community.netgear.com/000064998'))
+
+    assert list(Netgear().consult_support_pages(response, device_name='RAX50')) == []
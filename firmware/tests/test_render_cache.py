@@ -0,0 +1,55 @@
+import os
+
+import pytest
+from scrapy import Request
+
+from firmware.render_cache import RenderCache
+from firmware.tests.mock_classes import MockStats
+
+URL = 'https://www.netgear.de/support/download/default.aspx?model=R7000'
+
+
+@pytest.fixture(scope='function')
+def cache(tmp_path):
+    instance = RenderCache(str(tmp_path / 'pages.db'), ttl=60, stats=MockStats())
+    yield instance
+    instance.close()
+
+
+def test_rendered_page_is_reused(cache):
+    cache.put(Request(URL, meta={'selenium': True}), URL + '&lang=de', b'<html>R7000</html>')
+
+    assert cache.get(Request(URL, meta={'selenium': True, 'download_slot': 'www.netgear.de'})) == (URL + '&lang=de', b'<html>R7000</html>')
+    assert cache.stats.get_value('selenium_cache/hit') == 1
+
+
+def test_relevant_meta_is_part_of_the_key(cache):
+    cache.put(Request(URL, meta={'selenium': True}), URL, b'<html></html>')
+
+    assert cache.get(Request(URL, meta={'selenium': True, 'hp': True})) is None
+    assert cache.get(Request(URL, meta={'selenium': True, 'selenium_wait': 'load'})) is None
+
+
+def test_expired_page_is_rendered_again(cache, monkeypatch):
+    cache.put(Request(URL), URL, b'<html></html>')
+    monkeypatch.setattr('firmware.render_cache.time', lambda: 10 ** 12)
+
+    assert cache.get(Request(URL)) is None
+    assert cache.stats.get_value('selenium_cache/expired') == 1
+
+
+def test_least_recently_used_pages_are_evicted(tmp_path, monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr('firmware.render_cache.time', lambda: next(clock))
+    page = os.urandom(1000)  # incompressible, so each stored body is a bit over 1000 bytes
+    cache = RenderCache(str(tmp_path / 'pages.db'), max_size=2500)
+
+    cache.put(Request(URL + '1'), URL + '1', page)
+    cache.put(Request(URL + '2'), URL + '2', page)
+    cache.get(Request(URL + '1'))
+    cache.put(Request(URL + '3'), URL + '3', page)
+
+    assert cache.get(Request(URL + '1')) is not None
+    assert cache.get(Request(URL + '2')) is None
+    assert cache.get(Request(URL + '3')) is not None
+    cache.close()
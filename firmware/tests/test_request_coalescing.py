@@ -0,0 +1,141 @@
+import pytest
+from scrapy import Request, Spider
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import TextResponse
+from scrapy.utils.reqser import request_from_dict, request_to_dict
+from twisted.internet.error import ConnectionRefusedError
+from twisted.python.failure import Failure
+
+from firmware.middlewares import RequestCoalescingMiddleware
+from firmware.tests.mock_classes import MockStats
+
+INFO_URL = 'ftp://ftp.avm.de/fritzbox/fritzbox-7590/deutschland/fritz.os/info_de.txt'
+
+
+class InfoSpider(Spider):
+    name = 'info'
+
+    def parse(self, response, **kwargs):
+        return [Request(INFO_URL, callback=self.parse_info, cb_kwargs={'image': image}) for image in ('a.image', 'b.image', 'c.image')]
+
+    @staticmethod
+    def parse_info(response, image):
+        yield {'image': image, 'info': response.text, 'url': response.request.url}
+
+    @staticmethod
+    def info_failed(failure):
+        yield {'image': failure.request.cb_kwargs['image'], 'error': type(failure.value).__name__}
+
+
+def crawl(middleware, spider, requests, offsite=()):
+    # takes the requests the way the engine does, scheduling each one before the next is taken
+    scheduled = []
+    for request in requests:
+        if request.url in offsite:
+            continue
+        middleware.request_scheduled(request, spider)
+        scheduled.append(request)
+    return scheduled
+
+
+def info_requests(errback=None):
+    return [Request(INFO_URL, callback=InfoSpider.parse_info, errback=errback, cb_kwargs={'image': image}) for image in ('a.image', 'b.image', 'c.image')]
+
+
+@pytest.fixture(scope='function')
+def middleware():
+    return RequestCoalescingMiddleware(stats=MockStats())
+
+
+def test_identical_requests_share_one_download(middleware):
+    spider = InfoSpider()
+    folder = TextResponse('ftp://ftp.avm.de/fritzbox/', body=b'', request=Request('ftp://ftp.avm.de/fritzbox/'))
+
+    scheduled = crawl(middleware, spider, middleware.process_spider_output(folder, spider.parse(folder), spider))
+    assert len(scheduled) == 1
+
+    leader = scheduled[0]
+    response = TextResponse(INFO_URL, body=b'Version: 7.29', encoding='latin-1', request=leader)
+    items = list(middleware.process_spider_output(response, leader.callback(response, **leader.cb_kwargs), spider))
+
+    assert [item['image'] for item in items] == ['a.image', 'b.image', 'c.image']
+    assert all(item['info'] == 'Version: 7.29' for item in items)
+    assert middleware.stats.get_value('coalesce/coalesced') == 2
+    assert not middleware.waiting
+
+
+def test_dont_filter_requests_are_not_coalesced(middleware):
+    requests = [Request(INFO_URL, dont_filter=True), Request(INFO_URL, dont_filter=True)]
+
+    assert len(list(middleware.process_start_requests(requests, InfoSpider()))) == 2
+
+
+def test_waiting_requests_are_dropped_with_a_failed_response(middleware):
+    leader, *_ = crawl(middleware, InfoSpider(), middleware.process_start_requests([Request(INFO_URL), Request(INFO_URL)], InfoSpider()))
+
+    middleware.process_spider_exception(TextResponse(INFO_URL, body=b'', request=leader), ValueError(), InfoSpider())
+
+    assert middleware.stats.get_value('coalesce/dropped') == 1
+
+
+def test_failures_are_passed_to_the_waiting_errbacks(middleware):
+    spider = InfoSpider()
+    leader, = crawl(middleware, spider, middleware.process_start_requests(info_requests(errback=spider.info_failed), spider))
+    failure = Failure(ConnectionRefusedError())
+    failure.request = leader
+
+    output = leader.errback(failure)
+
+    assert output == [{'image': image, 'error': 'ConnectionRefusedError'} for image in ('a.image', 'b.image', 'c.image')]
+    assert middleware.stats.get_value('coalesce/failed') == 2
+    assert not middleware.waiting
+
+
+def test_failures_without_errbacks_are_left_to_scrapy(middleware):
+    spider = InfoSpider()
+    leader, = crawl(middleware, spider, middleware.process_start_requests(info_requests(), spider))
+    failure = Failure(IgnoreRequest())
+    failure.request = leader
+
+    assert leader.errback(failure) is failure
+    assert not middleware.waiting
+
+
+@pytest.mark.parametrize('dropped_by', ['offsite', 'dupefilter'])
+def test_requests_that_are_not_scheduled_release_their_url(middleware, dropped_by):
+    spider = InfoSpider()
+    if dropped_by == 'offsite':
+        # the next identical request is dropped by the offsite middleware just the same
+        assert not crawl(middleware, spider, middleware.process_start_requests(info_requests(), spider), offsite=[INFO_URL])
+    else:
+        first = crawl(middleware, spider, middleware.process_start_requests(info_requests()[:1], spider))
+        middleware.request_dropped(first[0], spider)
+        assert len(crawl(middleware, spider, middleware.process_start_requests(info_requests()[1:], spider))) == 1
+
+    assert middleware.stats.get_value('coalesce/coalesced') == (None if dropped_by == 'offsite' else 1)
+
+
+class FolderSpider(Spider):
+    name = 'folder'
+
+    def parse_info(self, response, image):
+        yield {'image': image}
+
+    def info_failed(self, failure):
+        yield {'image': failure.request.cb_kwargs['image'], 'error': type(failure.value).__name__}
+
+
+def test_coalesced_requests_can_be_serialized(middleware):
+    spider = FolderSpider()
+    requests = [Request(INFO_URL, callback=spider.parse_info, errback=spider.info_failed, cb_kwargs={'image': image}) for image in ('a.image', 'b.image')]
+    leader, = crawl(middleware, spider, middleware.process_start_requests(requests, spider))
+
+    # e.g. fetched by another worker of a shared frontier, which has no requests waiting for it
+    other_spider = FolderSpider()
+    RequestCoalescingMiddleware(stats=MockStats()).spider_opened(other_spider)
+    request = request_from_dict(request_to_dict(leader, spider), other_spider)
+    failure = Failure(ConnectionRefusedError())
+    failure.request = request
+
+    assert request.meta[RequestCoalescingMiddleware.ERRBACK_KEY] == 'info_failed'
+    assert list(request.errback(failure)) == [{'image': 'a.image', 'error': 'ConnectionRefusedError'}]
@@ -0,0 +1,32 @@
+import pytest
+from scrapy.crawler import CrawlerProcess
+
+from firmware.runner import parse_args, run
+
+
+def test_spiders_share_one_catalog(monkeypatch, tmp_path):
+    monkeypatch.setattr(CrawlerProcess, 'start', lambda process: None)
+    crawlers = run(['avm', 'dlink'], catalog=str(tmp_path / 'catalog'), overrides={'LOG_LEVEL': 'INFO'})
+
+    assert [crawler.spidercls.name for crawler in crawlers] == ['avm', 'dlink']
+    assert all(crawler.settings.get('CATALOG_DIR') == str(tmp_path / 'catalog') for crawler in crawlers)
+    assert all(crawler.settings.get('CATALOG_PREFIX') == 'catalog' for crawler in crawlers)
+    assert all(crawler.settings.getdict('ITEM_PIPELINES').get('firmware.pipelines.CatalogPipeline') for crawler in crawlers)
+    assert all(crawler.settings.get('LOG_LEVEL') == 'INFO' for crawler in crawlers)
+
+
+def test_parse_args():
+    args = parse_args(['avm', 'dlink', '--catalog', 'catalog', '-s', 'LOG_LEVEL=INFO', '-s', 'FILES_STORE=/data', '-s', 'USER_AGENT=a=b'])
+
+    assert args.spiders == ['avm', 'dlink']
+    assert args.catalog == 'catalog'
+    assert args.overrides == {'LOG_LEVEL': 'INFO', 'FILES_STORE': '/data', 'USER_AGENT': 'a=b'}
+
+
+@pytest.mark.parametrize('setting', ['LOG_LEVEL', '=INFO'])
+def test_settings_without_a_name_and_value_are_rejected(setting, capsys):
+    with pytest.raises(SystemExit) as error:
+        parse_args(['avm', '-s', setting])
+
+    assert error.value.code == 2
+    assert f'settings must be given as NAME=VALUE: {setting}' in capsys.readouterr().err
@@ -0,0 +1,195 @@
+import json
+
+import pytest
+from scrapy import Request
+from twisted.internet.defer import succeed
+from twisted.internet.error import ConnectionLost
+from twisted.python.failure import Failure
+from twisted.web.client import ResponseDone
+from twisted.web.http_headers import Headers as TxHeaders
+
+from firmware.segmented_download import Segment, SegmentedDownload
+
+MIB = 1024 * 1024
+
+
+@pytest.mark.parametrize('total, count, min_size, expected', [
+    (8 * MIB, 4, MIB, [(0, 2 * MIB - 1), (2 * MIB, 4 * MIB - 1), (4 * MIB, 6 * MIB - 1), (6 * MIB, 8 * MIB - 1)]),
+    (2 * MIB, 4, MIB, [(0, MIB - 1), (MIB, 2 * MIB - 1)]),
+    (1000, 4, MIB, [(0, 999)]),
+    (0, 4, MIB, []),
+    (10, 3, 1, [(0, 3), (4, 7), (8, 9)]),
+])
+def test_split(total, count, min_size, expected):
+    assert [(segment.start, segment.end) for segment in Segment.split(total, count, min_size)] == expected
+
+
+def test_segment_progress():
+    segment = Segment(100, 199)
+    segment.position = 150
+
+    assert segment.remaining == 50
+    assert not segment.done
+
+    segment.position = 200
+    assert segment.done
+
+
+@pytest.mark.parametrize('total, validator, resumed', [(300, '"abc"', True), (300, '"def"', False), (400, '"abc"', False)])
+def test_state_only_resumes_same_content(tmp_path, total, validator, resumed):
+    filename = str(tmp_path / 'partial')
+    (tmp_path / 'partial').write_bytes(b'\0' * 300)
+    (tmp_path / 'partial.state').write_text(json.dumps({'total': 300, 'validator': '"abc"', 'segments': [[0, 149, 100], [150, 299, 299]]}))
+
+    download = SegmentedDownload(agent=None, request=None, filename=filename)
+    download.total, download.validator = total, validator
+
+    assert download._load_state() is resumed  # pylint: disable=protected-access
+    if resumed:
+        assert download.resumed == 249
+
+
+class FakeTransport:
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.stopped = False
+
+    def stopProducing(self):  # pylint: disable=invalid-name
+        # a connection is only lost once
+        if not self.stopped:
+            self.stopped = True
+            self.protocol.connectionLost(Failure(ConnectionLost()))
+
+
+class FakeResponse:
+    # delivers its body right away, or half of it and keeps the connection open
+    def __init__(self, code: int, body: bytes = b'', headers: dict = None, length=None, complete: bool = True):
+        self.code = code
+        self.body = body
+        self.headers = TxHeaders({name: [value] for name, value in (headers or {}).items()})
+        self.length = len(body) if length is None else length
+        self.complete = complete
+        self.transport = None
+
+    def deliverBody(self, protocol):  # pylint: disable=invalid-name
+        self.transport = FakeTransport(protocol)
+        protocol.makeConnection(self.transport)
+        body = self.body if self.complete else self.body[:len(self.body) // 2]
+        for start in range(0, len(body), 7):
+            protocol.dataReceived(body[start:start + 7])
+        if self.complete:
+            protocol.connectionLost(Failure(ResponseDone()))
+
+
+class FakeAgent:
+    # answers Range requests for CONTENT like a server with range support
+    def __init__(self, ranges: bool = True, failing: tuple = (), hanging: tuple = (), content: bytes = None):
+        self.content = CONTENT if content is None else content
+        self.ranges = ranges
+        self.failing = failing
+        self.hanging = hanging
+        self.requests = []
+        self.responses = []
+
+    def request(self, method, uri, headers, body):  # pylint: disable=unused-argument
+        byte_range = headers.getRawHeaders(b'Range')[0].decode()
+        self.requests.append((byte_range, headers))
+        start, end = (int(value) for value in byte_range[len('bytes='):].split('-'))
+        if not self.ranges:
+            response = FakeResponse(200, self.content)
+        elif start in self.failing:
+            response = FakeResponse(503)
+        elif start >= len(self.content):
+            response = FakeResponse(416, headers={b'Content-Range': f'bytes */{len(self.content)}'.encode()})
+        else:
+            headers = {b'Content-Range': f'bytes {start}-{end}/{len(self.content)}'.encode(), b'ETag': b'"abc"'}
+            response = FakeResponse(206, self.content[start:end + 1], headers=headers, complete=start not in self.hanging)
+        self.responses.append(response)
+        return succeed(response)
+
+
+CONTENT = bytes(range(256)) * 4
+
+
+def download_with(agent, tmp_path, **kwargs):
+    request = Request('https://dlink-gpl.s3.amazonaws.com/GPL2000004/DIR-860L_A1_GPL.tar.gz', headers={'Accept-Encoding': 'gzip, deflate'})
+    download = SegmentedDownload(agent, request, str(tmp_path / 'partial'), segments=4, min_segment_size=100, **kwargs)
+    results = []
+    download.start().addBoth(results.append)
+    return download, results[0]
+
+
+def test_ranges_are_fetched_in_parallel(tmp_path):
+    agent = FakeAgent()
+    download, response = download_with(agent, tmp_path)
+
+    assert response.status == 200 and 'segmented' in response.flags
+    assert (tmp_path / 'partial').read_bytes() == CONTENT
+    assert not (tmp_path / 'partial.state').exists()
+    assert [byte_range for byte_range, _ in agent.requests] == ['bytes=0-0', 'bytes=0-255', 'bytes=256-511', 'bytes=512-767', 'bytes=768-1023']
+    assert all(headers.getRawHeaders(b'If-Range') == [b'"abc"'] for _, headers in agent.requests[1:])
+    assert all(headers.getRawHeaders(b'Accept-Encoding') == [b'identity'] for _, headers in agent.requests)
+    assert download.resumed == 0
+
+
+def test_servers_without_range_support_stream_the_whole_file(tmp_path):
+    agent = FakeAgent(ranges=False)
+    _, response = download_with(agent, tmp_path)
+
+    assert len(agent.requests) == 1
+    assert response.status == 200
+    assert (tmp_path / 'partial').read_bytes() == CONTENT
+
+
+def test_downloads_resume_from_their_checkpoint(tmp_path):
+    (tmp_path / 'partial').write_bytes(CONTENT[:100] + b'\0' * 412 + CONTENT[512:])
+    (tmp_path / 'partial.state').write_text(json.dumps({'total': len(CONTENT), 'validator': '"abc"', 'segments': [[0, 511, 100], [512, 1023, 1024]]}))
+
+    agent = FakeAgent()
+    download, response = download_with(agent, tmp_path)
+
+    assert [byte_range for byte_range, _ in agent.requests] == ['bytes=0-0', 'bytes=100-511']
+    assert 'resumed' in response.flags and download.resumed == 612
+    assert (tmp_path / 'partial').read_bytes() == CONTENT
+
+
+def test_a_failed_segment_cancels_the_others(tmp_path):
+    agent = FakeAgent(failing=(768, ), hanging=(0, 256, 512))
+    download, failure = download_with(agent, tmp_path, retries=0)
+
+    assert isinstance(failure, Failure)
+    assert download.cancelled and not download.writers
+    assert all(response.transport.stopped for response in agent.responses[1:4])
+    # the cancelled segments keep their progress for the next attempt
+    state = json.loads((tmp_path / 'partial.state').read_text())
+    assert state['segments'] == [[0, 255, 128], [256, 511, 384], [512, 767, 640], [768, 1023, 768]]
+    assert (tmp_path / 'partial').read_bytes()[:128] == CONTENT[:128]
+
+
+def test_checkpoints_only_cover_bytes_on_disk(tmp_path):
+    # every segment stops halfway, with its bytes still in the writers' buffers
+    agent = FakeAgent(hanging=(0, 256, 512, 768))
+    request = Request('https://dlink-gpl.s3.amazonaws.com/GPL2000004/DIR-860L_A1_GPL.tar.gz')
+    download = SegmentedDownload(agent, request, str(tmp_path / 'partial'), segments=4, min_segment_size=100, checkpoint=100)
+    results = []
+    download.start().addBoth(results.append)
+
+    state = json.loads((tmp_path / 'partial.state').read_text())
+    content = (tmp_path / 'partial').read_bytes()
+    assert all(position > start for start, _, position in state['segments'])
+    assert all(content[start:position] == CONTENT[start:position] for start, _, position in state['segments'])
+    assert not (tmp_path / 'partial.state.tmp').exists()
+    download._cancel()  # pylint: disable=protected-access
+    assert isinstance(results[0], Failure)
+
+
+@pytest.mark.parametrize('ranges', [True, False])
+def test_empty_files(tmp_path, ranges):
+    (tmp_path / 'partial').write_bytes(b'left over')
+    request = Request('https://dlink-gpl.s3.amazonaws.com/GPL2000004/empty.txt')
+    download = SegmentedDownload(FakeAgent(ranges=ranges, content=b''), request, str(tmp_path / 'partial'), segments=4, min_segment_size=100)
+    results = []
+    download.start().addBoth(results.append)
+
+    assert results[0].status == 200
+    assert (tmp_path / 'partial').read_bytes() == b''
@@ -0,0 +1,166 @@
+import queue
+import threading
+
+import pytest
+from scrapy import Request
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from selenium.common.exceptions import NoSuchElementException
+
+from firmware.selenium_pool import (
+    DOM_QUIET_SCRIPT, READY_STATE_SCRIPT, RESOURCE_COUNT_SCRIPT, SeleniumBrowser, SeleniumPool
+)
+
+HP_URL = 'https://support.hp.com/us-en/drivers/selfservice/hp-laserjet-pro-m404-m405-printer-series/19202535'
+
+
+class MockDriver:
+    def __init__(self, quiet_ms=None, resources=None, ready_state='complete', xpaths=()):
+        self.quiet_ms = list(quiet_ms or [])
+        self.resources = list(resources or [])
+        self.ready_state = ready_state
+        self.xpaths = xpaths
+
+    def execute_script(self, script):
+        if script == READY_STATE_SCRIPT:
+            return self.ready_state
+        if script == DOM_QUIET_SCRIPT:
+            return self.quiet_ms.pop(0) if len(self.quiet_ms) > 1 else self.quiet_ms[0]
+        if script == RESOURCE_COUNT_SCRIPT:
+            return self.resources.pop(0) if len(self.resources) > 1 else self.resources[0]
+        raise AssertionError(script)
+
+    def find_element(self, by, value):  # pylint: disable=unused-argument
+        if value not in self.xpaths:
+            raise NoSuchElementException(value)
+        return value
+
+
+def browser(driver, wait_timeout=0.5):
+    instance = SeleniumBrowser(driver, wait_timeout=wait_timeout)
+    instance.POLL_FREQUENCY = 0.01
+    return instance
+
+
+@pytest.mark.parametrize('wait, driver, ready', [
+    ({'xpath': '//table'}, MockDriver(xpaths=['//table']), True),
+    ({'xpath': '//table', 'timeout': 0.05}, MockDriver(), False),
+    ('load', MockDriver(), True),
+    ('load', MockDriver(ready_state='interactive'), False),
+    ({'dom_quiet': 0.2}, MockDriver(quiet_ms=[10, 50, 250]), True),
+    ({'dom_quiet': 0.2}, MockDriver(quiet_ms=[10]), False),
+    ({'network_idle': 0.05}, MockDriver(resources=[1, 2, 3, 3]), True),
+])
+def test_wait_until_ready(wait, driver, ready):
+    assert browser(driver).wait_until_ready(wait) is ready
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        browser(MockDriver()).wait_until_ready('sleep')
+
+
+class MockReactor:
+    # runs what the worker threads hand back to the reactor when the test drains the queue
+    def __init__(self):
+        self.calls = queue.Queue()
+
+    def callFromThread(self, function, *args, **kwargs):  # pylint: disable=invalid-name
+        self.calls.put((function, args, kwargs))
+
+    def run_until(self, results: list):
+        while not results:
+            function, args, kwargs = self.calls.get(timeout=5)
+            function(*args, **kwargs)
+
+
+class FakeBrowser:
+    def __init__(self, rendering: threading.Event = None):
+        self.rendering = rendering
+        self.rendered = []
+        self.quit_after = None
+
+    def render(self, request):
+        if self.rendering is not None:
+            self.rendering.wait(5)
+        self.rendered.append(request.url)
+        return request.url
+
+    def quit(self):
+        self.quit_after = list(self.rendered)
+
+
+class FakeLaunch:
+    def __init__(self, fail: bool = False, rendering: threading.Event = None):
+        self.fail = fail
+        self.rendering = rendering
+        self.browsers = []
+
+    def __call__(self):
+        if self.fail:
+            raise NotConfigured('Selenium driver path not set correctly: None')
+        self.browsers.append(FakeBrowser(self.rendering))
+        return self.browsers[-1]
+
+
+def render(pool, reactor, url=HP_URL):
+    results = []
+    pool.render(Request(url)).addBoth(results.append)
+    reactor.run_until(results)
+    return results[0]
+
+
+def close(pool, reactor):
+    results = []
+    pool.close().addBoth(results.append)
+    if not results:
+        reactor.run_until(results)
+    return results[0]
+
+
+def test_browsers_are_launched_lazily():
+    launch, reactor = FakeLaunch(), MockReactor()
+    pool = SeleniumPool(launch, size=2, reactor_=reactor)
+    assert not pool._threadpool.started  # pylint: disable=protected-access
+
+    assert render(pool, reactor) == HP_URL
+    assert render(pool, reactor, HP_URL + '?os=linux') == HP_URL + '?os=linux'
+    # the idle browser is reused instead of launching a second one
+    assert len(launch.browsers) == 1
+
+    close(pool, reactor)
+    assert launch.browsers[0].quit_after == [HP_URL, HP_URL + '?os=linux']
+    assert not pool._threadpool.started  # pylint: disable=protected-access
+
+
+def test_failed_launches_fail_the_waiting_requests():
+    pool = SeleniumPool(FakeLaunch(fail=True), size=1, reactor_=MockReactor())
+
+    result = render(pool, pool._reactor)  # pylint: disable=protected-access
+
+    assert result.check(NotConfigured)
+    close(pool, pool._reactor)  # pylint: disable=protected-access
+
+
+def test_close_waits_for_renders_under_way():
+    rendering = threading.Event()
+    launch, reactor = FakeLaunch(rendering=rendering), MockReactor()
+    pool = SeleniumPool(launch, size=1, reactor_=reactor)
+    first, waiting = [], []
+    pool.render(Request(HP_URL)).addBoth(first.append)
+    pool.render(Request(HP_URL + '?os=linux')).addBoth(waiting.append)
+    # the launched browser goes straight to the first request
+    reactor.run_until(pool.browsers)
+
+    closed = []
+    pool.close().addBoth(closed.append)
+    # the second request never gets the browser, the first one finishes before it is quit
+    assert waiting[0].check(IgnoreRequest)
+    assert not closed and launch.browsers[0].quit_after is None
+    rendering.set()
+    reactor.run_until(closed)
+
+    assert first == [HP_URL]
+    assert launch.browsers[0].quit_after == [HP_URL]
+    assert not pool._idle.pending  # pylint: disable=protected-access
+    with pytest.raises(IgnoreRequest):
+        pool.render(Request(HP_URL))
@@ -0,0 +1,51 @@
+import os
+from io import BytesIO
+
+import pytest
+
+from firmware.stores import ContentAddressedFilesStore
+
+IMAGE = b'FRITZ.Box_7590-07.29.image' * 1024
+
+
+@pytest.fixture(scope='function')
+def store(tmp_path):
+    instance = ContentAddressedFilesStore(str(tmp_path), hardlinks=True)
+    yield instance
+    instance.close()
+
+
+def local_file(store_instance, data):
+    filename = store_instance.incomplete_path()
+    with open(filename, 'wb') as file:
+        file.write(data)
+    return filename
+
+
+def stored_objects(store_instance):
+    return [name for _, _, names in os.walk(os.path.join(store_instance.basedir, store_instance.OBJECTS_DIR)) for name in names]
+
+
+def test_identical_files_are_stored_once(store):
+    store.persist_local_file('ftp.avm.de/fritzbox/FRITZ.Box_7590-07.29.image', local_file(store, IMAGE), info=None)
+    store.persist_file('download.avm.de/FRITZ.Box_7590-07.29.image', BytesIO(IMAGE), info=None)
+
+    assert len(stored_objects(store)) == 1
+    assert store.lookup('ftp.avm.de/fritzbox/FRITZ.Box_7590-07.29.image') == store.lookup('download.avm.de/FRITZ.Box_7590-07.29.image')
+    assert os.listdir(os.path.join(store.basedir, store.INCOMPLETE_DIR)) == []
+
+
+def test_same_names_from_different_hosts_do_not_overwrite(store):
+    store.persist_file('ftp.avm.de/firmware.zip', BytesIO(b'avm'), info=None)
+    store.persist_file('static.tp-link.com/firmware.zip', BytesIO(b'tp-link'), info=None)
+
+    assert len(stored_objects(store)) == 2
+    with open(os.path.join(store.basedir, 'static.tp-link.com', 'firmware.zip'), 'rb') as linked:
+        assert linked.read() == b'tp-link'
+
+
+def test_stat_file(store):
+    checksum = store.persist_local_file('ftp.avm.de/image', local_file(store, IMAGE), info=None)
+
+    assert store.stat_file('ftp.avm.de/image', info=None)['checksum'] == checksum
+    assert store.stat_file('ftp.avm.de/unknown', info=None) == {}